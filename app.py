@@ -1,87 +1,269 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Blueprint, current_app, g, jsonify, request, send_file, send_from_directory
 import pandas as pd
 import numpy as np
-from simulation import CustomerMarkovModel
+from simulation import CustomerMarkovModel, TenureMarkovModel, moment_intervals
+from optimizer import optimize_campaign, OBJECTIVES
+from inverse_solver import solve_for_acquisition, METRICS
+from posterior import posterior_forecast, sample_transition_matrices
+from survival import SurvivalTables, ACTIVE_STATES, MAX_HORIZON as MAX_SURVIVAL_HORIZON
+from monte_carlo import compare_scenarios
+from tail_risk import tail_risk
+from hmm import load_fitted_scenario
+from path_store import PathStore, METRICS as PATH_METRICS
+from profiling import ProfileStore, DEFAULT_KEEP as DEFAULT_PROFILE_KEEP
+from ingest import LiveCounts, LiveForecaster, start as start_ingestion
+from whatif import WhatIfSessions
+from result_cache import ResultCache, warm_up, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from jobs import JobQueue, QueueFullError
+from singleflight import SingleFlight
+from static_assets import StaticAssets, choose_encoding
 from transition_matrices import SCENARIOS, STATES, STATE_ABBR, NEW_CUSTOMER_DISTRIBUTION
+import argparse
+import cProfile
+import gc
+import hmac
 import json
 import os
+import pstats
 import shutil
 import traceback
 import logging
+import time
+import uuid
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Create a Flask app
-app = Flask(__name__, static_folder='static')
+# Configuration used unless create_app is given other values
+DEFAULT_CONFIG = {
+    # Level of the app's log output; debug messages are only formatted when enabled
+    'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'INFO'),
+    # Concurrent identical /api/simulate requests share one computation
+    'COALESCE_SIMULATIONS': True,
+    # Compute scenario artifacts and warm the result cache before serving
+    'PRELOAD': False,
+    # Months of the default simulations put in the result cache by preloading
+    'PRELOAD_MONTHS': 12,
+    # Run check_simulation_module at startup
+    'SELF_TEST': False,
+    # Seconds browsers may reuse static assets other than HTML without revalidating
+    'STATIC_MAX_AGE': 3600,
+    # JSON files written by `python hmm.py fit`, registered as scenarios at startup
+    'FITTED_SCENARIOS': [],
+    # Directory of the simulation result cache shared with main.py and other processes
+    'RESULT_CACHE_DIR': DEFAULT_CACHE_DIR,
+    # Size bound of the result cache in bytes
+    'RESULT_CACHE_MAX_BYTES': DEFAULT_MAX_BYTES,
+    # Directory of Monte Carlo runs stored by `python path_store.py create`
+    'PATH_STORE_DIR': os.environ.get('CUSTOMER_PATH_DIR', '.path_store'),
+    # Secret that admins send in the X-Profile header to profile a request (never in the
+    # query string, which ends up in access logs); None disables profiling and installs no hooks
+    'PROFILE_TOKEN': os.environ.get('PROFILE_TOKEN'),
+    # Directory of the stored profile captures
+    'PROFILE_DIR': os.environ.get('CUSTOMER_PROFILE_DIR', '.profiles'),
+    # Number of most recent captures kept
+    'PROFILE_KEEP': DEFAULT_PROFILE_KEEP,
+    # Source of live segment-change events ("file:<path>" or "tcp:<host>:<port>"), None to disable
+    'LIVE_EVENTS': None,
+    # Segment counts of the customer base before the first live event
+    'LIVE_INITIAL_COUNTS': None,
+    # Scenario used as the prior of the live transition estimates
+    'LIVE_SCENARIO': 'Default',
+    # Months of the live forecast
+    'LIVE_MONTHS': 12,
+    # Relative drift of the live counts that triggers a new live forecast
+    'LIVE_THRESHOLD': 0.01
+}
 
-@app.route('/api/simulate', methods=['POST'])
-def simulate():
-    """API endpoint to run a simulation"""
-    data = request.json
-    logger.debug(f"Received simulation request with data: {data}")
+# API routes, registered on every app made by create_app
+api = Blueprint('api', __name__)
+
+# Largest horizon of /api/simulate, /api/extend and simulation jobs
+MAX_SIMULATION_MONTHS = 1200
+
+# Memory a simulated month takes in a job's result (JSON records and moments), measured
+# at about 1.7 KB retained and 2 KB peak
+JOB_BYTES_PER_MONTH = 2048
+
+# Largest result a single job may build in memory
+MAX_JOB_BYTES = 256 * 1024 * 1024
+
+# Total memory of the finished job results kept for lookup; older results are dropped beyond it
+MAX_RETAINED_JOB_BYTES = 1024 * 1024 * 1024
+
+# Upper bound on tenure buckets of the tenure-aware model
+MAX_TENURE_BUCKETS = 60
+
+# Analytic uncertainty columns added to every simulation response
+INTERVAL_COLUMNS = ['Revenue Std', 'Revenue Lower', 'Revenue Upper']
+
+# Key of the segment covariance carried by the last record of a response, so
+# /api/extend can continue the intervals from where the previous run ended
+COVARIANCE_KEY = 'Segment_Covariance'
+
+def add_revenue_intervals(results, model, months, confidence, initial_covariance=None):
+    """
+    Attach analytic revenue confidence intervals to simulation results.
     
-    # Extract parameters from request with validation
+    Moments are propagated exactly up to the month a simulation with tol
+    converged and follow its drift after that, like the counts do.
+    
+    Returns:
+        Tuple of (results, covariance of the segment counts in the last month)
+    """
+    if initial_covariance is None:
+        means, covariances = model.propagate_moments(months, exact_months=getattr(model, 'converged_month', None))
+    else:
+        means, covariances = model.propagate_moments(months, initial_covariance=initial_covariance)
+    intervals = moment_intervals(means, covariances, confidence)
+    for column in INTERVAL_COLUMNS:
+        results[column] = intervals[column].values
+    return results, covariances[-1]
+
+def to_records(results):
+    """Convert simulation results to JSON records with JavaScript-friendly property names"""
+    # Convert the pandas DataFrame to a dictionary for JSON serialization
+    results_dict = results.to_dict(orient='records')
+    
+    # Add JavaScript-friendly property names
+    for record in results_dict:
+        # Create underscore versions for JavaScript
+        if 'Total Customers' in record:
+            record['Total_Customers'] = record['Total Customers']
+        if 'Monthly Revenue' in record:
+            record['Monthly_Revenue'] = record['Monthly Revenue']
+        if 'Churn Rate' in record:
+            record['Churn_Rate'] = record['Churn Rate']
+        for column in INTERVAL_COLUMNS:
+            if column in record:
+                record[column.replace(' ', '_')] = record[column]
+        
+        # Add abbreviated state names
+        for i, state in enumerate(STATES):
+            if state in record:
+                record[STATE_ABBR[i]] = record[state]
+        
+        # Ensure all properties have both formats for compatibility
+        for state in STATES:
+            if state in record:
+                record[state.replace(' ', '_')] = record[state]
+    
+    return results_dict
+
+def parse_simulation_request(data):
+    """
+    Extract and validate simulation parameters from a request body.
+    
+    Raises:
+        ValueError: With a message for the client if a parameter is invalid
+    """
     try:
         initial_customers = int(data.get('initialCustomers', 10000))
         new_customers_per_month = int(data.get('newCustomersPerMonth', 800))
         months = int(data.get('months', 12))
         scenario = data.get('scenario', 'Default')
-        
-        if initial_customers <= 0 or new_customers_per_month < 0 or months <= 0:
-            return jsonify({"error": "Invalid parameters: values must be positive"}), 400
-        
-        if scenario not in SCENARIOS:
-            return jsonify({"error": f"Unknown scenario: {scenario}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
-    except ValueError:
-        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+        tol = data.get('tol')
+        tol = None if tol is None else float(tol)
+        confidence = float(data.get('confidence', 0.95))
+        tenure_buckets = data.get('tenureBuckets')
+        tenure_buckets = None if tenure_buckets is None else int(tenure_buckets)
+        stickiness = data.get('stickiness')
+        if stickiness is not None:
+            stickiness = {state: float(value) for state, value in dict(stickiness).items()}
+    except (ValueError, TypeError):
+        raise ValueError("Invalid parameters: numeric values expected")
+    
+    if initial_customers <= 0 or new_customers_per_month < 0 or months <= 0:
+        raise ValueError("Invalid parameters: values must be positive")
+    
+    if months > MAX_SIMULATION_MONTHS:
+        raise ValueError(f"Invalid parameters: at most {MAX_SIMULATION_MONTHS} months")
+    
+    if not 0 < confidence < 1:
+        raise ValueError("Invalid parameters: confidence must be between 0 and 1")
+    
+    if tol is not None and tol <= 0:
+        raise ValueError("Invalid parameters: tol must be positive")
+    
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario: {scenario}. Available scenarios: {list(SCENARIOS.keys())}")
+    
+    if tenure_buckets is not None and not 1 <= tenure_buckets <= MAX_TENURE_BUCKETS:
+        raise ValueError(f"Invalid parameters: tenureBuckets must be between 1 and {MAX_TENURE_BUCKETS}")
+    
+    if stickiness is not None:
+        unknown = [state for state in stickiness if state not in STATES]
+        if unknown:
+            raise ValueError(f"Unknown segment: {unknown}. Available segments: {STATES}")
+        if any(not 0 <= value <= 1 for value in stickiness.values()):
+            raise ValueError("Invalid parameters: stickiness must be between 0 and 1")
     
-    # Create model and run simulation
+    return {
+        'initial_customers': initial_customers,
+        'new_customers_per_month': new_customers_per_month,
+        'months': months,
+        'scenario': scenario,
+        'tol': tol,
+        'confidence': confidence,
+        'tenure_buckets': tenure_buckets,
+        'stickiness': stickiness
+    }
+
+def run_simulation(params, cache):
+    """Run a simulation for validated parameters through the result cache and return its JSON records"""
+    model_params = {
+        'initial_customers': params['initial_customers'],
+        'new_customers_per_month': params['new_customers_per_month'],
+        'scenario': params['scenario']
+    }
+    if params['tenure_buckets'] is None and params['stickiness'] is None:
+        model = CustomerMarkovModel(**model_params)
+    else:
+        # Tenure-aware model; unspecified settings keep the model's defaults
+        if params['tenure_buckets'] is not None:
+            model_params['tenure_buckets'] = params['tenure_buckets']
+        model = TenureMarkovModel(stickiness=params['stickiness'], **model_params)
+    
+    results = cache.simulate(model, months=params['months'], tol=params['tol'])
+    results, covariance = add_revenue_intervals(results, model, params['months'], params['confidence'])
+    records = to_records(results)
+    records[-1][COVARIANCE_KEY] = covariance.tolist()
+    return records
+
+@api.route('/api/simulate', methods=['POST'])
+def simulate():
+    """API endpoint to run a simulation"""
+    data = request.json
+    logger.debug("Received simulation request with data: %s", data)
+    
+    # Extract parameters from request with validation
     try:
-        model = CustomerMarkovModel(
-            initial_customers=initial_customers,
-            new_customers_per_month=new_customers_per_month,
-            scenario=scenario
-        )
-        
-        results = model.simulate(months=months)
-        
-        # Convert the pandas DataFrame to a dictionary for JSON serialization
-        results_dict = results.to_dict(orient='records')
-        
-        # Add JavaScript-friendly property names
-        for record in results_dict:
-            # Create underscore versions for JavaScript
-            if 'Total Customers' in record:
-                record['Total_Customers'] = record['Total Customers']
-            if 'Monthly Revenue' in record:
-                record['Monthly_Revenue'] = record['Monthly Revenue']
-            if 'Churn Rate' in record:
-                record['Churn_Rate'] = record['Churn Rate']
-            
-            # Add abbreviated state names
-            for i, state in enumerate(STATES):
-                if state in record:
-                    record[STATE_ABBR[i]] = record[state]
-            
-            # Ensure all properties have both formats for compatibility
-            for state in STATES:
-                if state in record:
-                    record[state.replace(' ', '_')] = record[state]
-        
-        logger.debug(f"Successfully generated simulation results with {len(results_dict)} records")
-        return jsonify(results_dict)
+        params = parse_simulation_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Create model and run simulation, serialized once for every identical in-flight request
+    cache = current_app.extensions['result_cache']
+    def compute():
+        results_dict = run_simulation(params, cache)
+        logger.debug("Successfully generated simulation results with %s records", len(results_dict))
+        return current_app.json.dumps(results_dict).encode()
+    
+    try:
+        if current_app.config['COALESCE_SIMULATIONS']:
+            body, _ = current_app.extensions['simulation_flight'].do(json.dumps(params, sort_keys=True), compute)
+        else:
+            body = compute()
+        return current_app.response_class(body, mimetype='application/json')
     except Exception as e:
-        logger.error(f"Simulation error: {str(e)}")
+        logger.error("Simulation error: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({"error": f"Simulation error: {str(e)}"}), 500
 
-@app.route('/api/extend', methods=['POST'])
+@api.route('/api/extend', methods=['POST'])
 def extend():
     """API endpoint to extend an existing simulation with a new scenario"""
     data = request.json
-    logger.debug(f"Received extension request with data: {data}")
+    logger.debug("Received extension request with data: %s", data)
     
     # Extract parameters from request
     try:
@@ -89,25 +271,40 @@ def extend():
         months = int(data.get('months', 3))
         scenario = data.get('scenario', 'Default')
         previous_results = data.get('previousResults', [])
+        confidence = float(data.get('confidence', 0.95))
         
-        logger.debug(f"Extension parameters: months={months}, scenario={scenario}, new_customers={new_customers_per_month}")
-        logger.debug(f"Previous results count: {len(previous_results)}")
+        logger.debug("Extension parameters: months=%s, scenario=%s, new_customers=%s", months, scenario, new_customers_per_month)
+        logger.debug("Previous results count: %s", len(previous_results))
         
         if not previous_results:
             return jsonify({"error": "No previous results provided"}), 400
             
         if new_customers_per_month < 0 or months <= 0:
             return jsonify({"error": "Invalid parameters: values must be positive"}), 400
+        
+        if months > MAX_SIMULATION_MONTHS:
+            return jsonify({"error": f"Invalid parameters: at most {MAX_SIMULATION_MONTHS} months"}), 400
+        
+        if not 0 < confidence < 1:
+            return jsonify({"error": "Invalid parameters: confidence must be between 0 and 1"}), 400
             
         if scenario not in SCENARIOS:
             return jsonify({"error": f"Unknown scenario: {scenario}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
-    except ValueError:
+        
+        # Uncertainty of the counts the extension starts from, if the previous run reported it
+        initial_covariance = previous_results[-1].get(COVARIANCE_KEY)
+        if initial_covariance is not None:
+            initial_covariance = np.asarray(initial_covariance, dtype=float)
+            if initial_covariance.shape != (len(STATES), len(STATES)):
+                return jsonify({"error": f"Invalid parameters: {COVARIANCE_KEY} must be a "
+                                         f"{len(STATES)}x{len(STATES)} matrix"}), 400
+    except (ValueError, TypeError, AttributeError):
         return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
     
     try:
         # Get the last data point from previous results
         last_result = previous_results[-1]
-        logger.debug(f"Last result data keys: {list(last_result.keys())}")
+        logger.debug("Last result data keys: %s", list(last_result.keys()))
         
         # Extract customer counts - first detect which key format is used
         customer_counts = np.zeros(len(STATES))
@@ -121,7 +318,7 @@ def extend():
         elif 'IR' in last_result:
             format_used = 'abbreviations'
         
-        logger.debug(f"Detected format in last result: {format_used}")
+        logger.debug("Detected format in last result: %s", format_used)
         
         # Extract values based on the format detected
         for i, state in enumerate(STATES):
@@ -143,12 +340,12 @@ def extend():
                         # Handle string values with commas
                         customer_counts[i] = float(str(value).replace(',', ''))
                 except (ValueError, TypeError):
-                    logger.warning(f"Could not convert {state} value to float: {value}")
+                    logger.warning("Could not convert %s value to float: %s", state, value)
                     customer_counts[i] = 0
             else:
-                logger.warning(f"Could not find value for {state}, using 0")
+                logger.warning("Could not find value for %s, using 0", state)
         
-        logger.debug(f"Extracted customer counts: {customer_counts}")
+        logger.debug("Extracted customer counts: %s", customer_counts)
         
         # Get the last month
         last_month = None
@@ -156,7 +353,7 @@ def extend():
             try:
                 last_month = int(float(last_result['Month']))
             except (ValueError, TypeError):
-                logger.warning(f"Could not convert Month to int: {last_result['Month']}")
+                logger.warning("Could not convert Month to int: %s", last_result['Month'])
         
         if last_month is None:
             # If Month not found or conversion failed, try to find the maximum month in previous results
@@ -167,11 +364,11 @@ def extend():
                 logger.warning("Could not determine last month, defaulting to 0")
                 last_month = 0
         
-        logger.debug(f"Last month: {last_month}")
+        logger.debug("Last month: %s", last_month)
         
         # Calculate total customers
         total_customers = int(np.sum(customer_counts))
-        logger.debug(f"Total customers from last result: {total_customers}")
+        logger.debug("Total customers from last result: %s", total_customers)
         
         # Calculate initial distribution
         if total_customers > 0:
@@ -180,10 +377,10 @@ def extend():
             # Default distribution if no customers
             initial_distribution = np.array([0.25, 0.25, 0.25, 0.25, 0.0])
         
-        logger.debug(f"Initial distribution: {initial_distribution}")
+        logger.debug("Initial distribution: %s", initial_distribution)
         
         # Let's add a special debug print to ensure we're properly using new_customers_per_month
-        logger.debug(f"DEBUG: new_customers_per_month = {new_customers_per_month}")
+        logger.debug("DEBUG: new_customers_per_month = %s", new_customers_per_month)
         
         # Create a new model, making sure to use the correct new_customers_per_month value
         model = CustomerMarkovModel(
@@ -193,23 +390,31 @@ def extend():
         )
         
         # Verify the model has the right values
-        logger.debug(f"Created model with new_customers_per_month={model.new_customers_per_month}")
+        logger.debug("Created model with new_customers_per_month=%s", model.new_customers_per_month)
         
         # Set the initial distribution
         model.initial_distribution = initial_distribution
         
         # Run the simulation for the desired months
-        extension_results = model.simulate(months=months) 
+        extension_results = model.simulate(months=months)
+        # Intervals restarting from zero variance at the join would be too narrow, so
+        # without the previous run's covariance the extension reports none
+        covariance = None
+        if initial_covariance is not None:
+            extension_results, covariance = add_revenue_intervals(extension_results, model, months, confidence,
+                                                                  initial_covariance)
         
         # Verify the simulation is using the right new customer value - let's check the results
-        logger.debug(f"For month 1, new customers should be ~{new_customers_per_month}")
+        logger.debug("For month 1, new customers should be ~%s", new_customers_per_month)
         
         # Update month numbers to continue from last result
         for i in range(len(extension_results)):
             extension_results.at[i, 'Month'] = last_month + i
         
-        # Calculate the actual new customers added by month
-        if len(extension_results) > 1:
+        # Check the new customers actually added and the matrix used, only when
+        # someone is reading debug output
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug and len(extension_results) > 1:
             month0_customers = extension_results.iloc[0]['Total Customers']
             month1_customers = extension_results.iloc[1]['Total Customers']
             month0_nr = extension_results.iloc[0]['No Repurchase'] 
@@ -220,73 +425,701 @@ def extend():
             new_nr_customers = month1_nr - month0_nr
             actual_new_customers = customer_increase + new_nr_customers
             
-            logger.debug(f"Actual new customers in month 1: {actual_new_customers}")
-            logger.debug(f"Customer increase: {customer_increase}, New No Repurchase: {new_nr_customers}")
+            logger.debug("Actual new customers in month 1: %s", actual_new_customers)
+            logger.debug("Customer increase: %s, New No Repurchase: %s", customer_increase, new_nr_customers)
         
         # Inspect the transition matrix to ensure it's correct
-        logger.debug(f"Using transition matrix for scenario '{scenario}':")
-        for row in SCENARIOS[scenario]:
-            logger.debug(f"  {row}")
+        if debug:
+            logger.debug("Using transition matrix for scenario '%s':", scenario)
+            for row in SCENARIOS[scenario]:
+                logger.debug("  %s", row)
         
         # Remove first month to avoid duplication
         extension_results = extension_results.iloc[1:]
-        logger.debug(f"Extension results: {len(extension_results)} months of data")
+        logger.debug("Extension results: %s months of data", len(extension_results))
         
         # Convert to dictionary for JSON
-        results_dict = extension_results.to_dict(orient='records')
-        
-        # Add JavaScript-friendly property names
-        for record in results_dict:
-            # Create underscore versions for JavaScript
-            if 'Total Customers' in record:
-                record['Total_Customers'] = record['Total Customers']
-            if 'Monthly Revenue' in record:
-                record['Monthly_Revenue'] = record['Monthly Revenue']
-            if 'Churn Rate' in record:
-                record['Churn_Rate'] = record['Churn Rate']
-            
-            # Add abbreviated state names
-            for i, state in enumerate(STATES):
-                if state in record:
-                    record[STATE_ABBR[i]] = record[state]
-            
-            # Ensure all properties have both formats for compatibility
-            for state in STATES:
-                if state in record:
-                    record[state.replace(' ', '_')] = record[state]
+        results_dict = to_records(extension_results)
+        if covariance is not None and results_dict:
+            results_dict[-1][COVARIANCE_KEY] = covariance.tolist()
         
         # Print first and last result for debugging
-        if results_dict:
-            logger.debug(f"First month in extension: Month {results_dict[0]['Month']}, " +
-                        f"Total Customers: {results_dict[0]['Total Customers']}, " +
-                        f"Revenue: ${results_dict[0]['Monthly Revenue']:.2f}")
-            logger.debug(f"Last month in extension: Month {results_dict[-1]['Month']}, " +
-                        f"Total Customers: {results_dict[-1]['Total Customers']}, " +
-                        f"Revenue: ${results_dict[-1]['Monthly Revenue']:.2f}")
+        if debug and results_dict:
+            logger.debug("First month in extension: Month %s, Total Customers: %s, Revenue: $%.2f",
+                         results_dict[0]['Month'], results_dict[0]['Total Customers'],
+                         results_dict[0]['Monthly Revenue'])
+            logger.debug("Last month in extension: Month %s, Total Customers: %s, Revenue: $%.2f",
+                         results_dict[-1]['Month'], results_dict[-1]['Total Customers'],
+                         results_dict[-1]['Monthly Revenue'])
         
         return jsonify(results_dict)
     except Exception as e:
-        logger.error(f"Extension error: {str(e)}")
+        logger.error("Extension error: %s", e)
         logger.error(traceback.format_exc())
         return jsonify({"error": f"Extension error: {str(e)}"}), 500
 
-@app.route('/api/scenarios', methods=['GET'])
+@api.route('/api/optimize', methods=['POST'])
+def optimize():
+    """API endpoint to search acquisition volume and marketing mix within a budget"""
+    data = request.json or {}
+    logger.debug("Received optimization request with data: %s", data)
+    
+    try:
+        initial_customers = int(data.get('initialCustomers', 10000))
+        months = int(data.get('months', 12))
+        budget = float(data.get('budget', 1000000))
+        cost_per_customer = float(data.get('costPerCustomer', 100))
+        scenarios = data.get('scenarios', list(SCENARIOS.keys()))
+        scenario_costs = {name: float(cost) for name, cost in data.get('scenarioCosts', {}).items()}
+        objective = data.get('objective', 'revenue')
+        discount_rate = float(data.get('discountRate', 0.01))
+        candidates = int(data.get('candidates', 4096))
+        iterations = int(data.get('iterations', 8))
+        seed = data.get('seed')
+        
+        if initial_customers <= 0 or months <= 0 or budget < 0 or cost_per_customer <= 0:
+            return jsonify({"error": "Invalid parameters: values must be positive"}), 400
+        
+        if months > MAX_SIMULATION_MONTHS:
+            return jsonify({"error": f"Invalid parameters: at most {MAX_SIMULATION_MONTHS} months"}), 400
+        
+        if candidates <= 0 or iterations <= 0 or candidates * iterations > 200000:
+            return jsonify({"error": "Invalid parameters: candidates x iterations must be between 1 and 200000"}), 400
+        
+        unknown = [name for name in scenarios if name not in SCENARIOS]
+        if not scenarios or unknown:
+            return jsonify({"error": f"Unknown scenario: {unknown}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
+        
+        if objective not in OBJECTIVES:
+            return jsonify({"error": f"Unknown objective: {objective}. Available objectives: {OBJECTIVES}"}), 400
+    except (ValueError, TypeError, AttributeError):
+        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+    
+    try:
+        result = optimize_campaign(
+            initial_customers=initial_customers,
+            months=months,
+            budget=budget,
+            cost_per_customer=cost_per_customer,
+            scenarios=scenarios,
+            scenario_costs=scenario_costs,
+            objective=objective,
+            discount_rate=discount_rate,
+            candidates=candidates,
+            iterations=iterations,
+            seed=None if seed is None else int(seed)
+        )
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("Optimization error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Optimization error: {str(e)}"}), 500
+
+@api.route('/api/target', methods=['POST'])
+def target():
+    """API endpoint to find the new customers per month needed to reach targets"""
+    data = request.json or {}
+    logger.debug("Received target request with data: %s", data)
+    
+    try:
+        targets = data.get('targets', data.get('target'))
+        months = data.get('months', data.get('month', 12))
+        scenario = data.get('scenario', 'Default')
+        metric = data.get('metric', 'revenue')
+        initial_customers = int(data.get('initialCustomers', 10000))
+        exact = bool(data.get('exact', True))
+        
+        if targets is None:
+            return jsonify({"error": "No target provided"}), 400
+        
+        targets = np.atleast_1d(np.asarray(targets, dtype=float))
+        months = np.atleast_1d(np.asarray(months, dtype=float)).astype(int)
+        targets, months = np.broadcast_arrays(targets, months)
+        
+        if initial_customers <= 0 or months.min() <= 0:
+            return jsonify({"error": "Invalid parameters: values must be positive"}), 400
+        
+        if targets.size > 10000 or months.max() > 1200:
+            return jsonify({"error": "Invalid parameters: at most 10000 targets and 1200 months"}), 400
+        
+        if scenario not in SCENARIOS:
+            return jsonify({"error": f"Unknown scenario: {scenario}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
+        
+        if metric not in METRICS:
+            return jsonify({"error": f"Unknown metric: {metric}. Available metrics: {list(METRICS.keys())}"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+    
+    try:
+        solution = solve_for_acquisition(
+            targets,
+            months,
+            scenario=scenario,
+            metric=metric,
+            initial_customers=initial_customers,
+            exact=exact
+        )
+        
+        results = []
+        for i in range(targets.size):
+            required = solution['new_customers_per_month'][i]
+            record = {
+                'Target': float(targets[i]),
+                'Month': int(months[i]),
+                'Baseline': float(solution['baseline'][i]),
+                'Required New Customers': float(required) if np.isfinite(required) else None
+            }
+            if exact:
+                record['Exact New Customers'] = int(solution['exact'][i]) if solution['exact'][i] >= 0 else None
+            results.append(record)
+        
+        return jsonify({"scenario": scenario, "metric": metric, "results": results})
+    except Exception as e:
+        logger.error("Target solve error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Target solve error: {str(e)}"}), 500
+
+@api.route('/api/posterior', methods=['POST'])
+def posterior():
+    """API endpoint for credible intervals under uncertain scenario matrices"""
+    data = request.json or {}
+    logger.debug("Received posterior request with data: %s", data)
+    
+    try:
+        initial_customers = int(data.get('initialCustomers', 10000))
+        new_customers_per_month = int(data.get('newCustomersPerMonth', 800))
+        months = int(data.get('months', 12))
+        scenarios = data.get('scenarios', list(SCENARIOS.keys()))
+        draws = int(data.get('draws', 2000))
+        credibility = float(data.get('credibility', 0.9))
+        
+        if initial_customers <= 0 or new_customers_per_month < 0 or months <= 0 or draws <= 0:
+            return jsonify({"error": "Invalid parameters: values must be positive"}), 400
+        
+        if draws * months * len(scenarios) > 5000000:
+            return jsonify({"error": "Invalid parameters: draws x months x scenarios must not exceed 5000000"}), 400
+        
+        if not 0 < credibility < 1:
+            return jsonify({"error": "Invalid parameters: credibility must be between 0 and 1"}), 400
+        
+        unknown = [name for name in scenarios if name not in SCENARIOS]
+        if not scenarios or unknown:
+            return jsonify({"error": f"Unknown scenario: {unknown}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+    
+    try:
+        results = posterior_forecast(
+            scenarios=scenarios,
+            months=months,
+            initial_customers=initial_customers,
+            new_customers_per_month=new_customers_per_month,
+            draws=draws,
+            credibility=credibility
+        )
+        
+        # Group the monthly intervals by scenario
+        response = {
+            scenario: group.drop(columns='Scenario').to_dict(orient='records')
+            for scenario, group in results.groupby('Scenario', sort=False)
+        }
+        return jsonify(response)
+    except Exception as e:
+        logger.error("Posterior error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Posterior error: {str(e)}"}), 500
+
+@api.route('/api/survival', methods=['POST'])
+def survival():
+    """API endpoint for time-to-churn distributions per starting segment"""
+    data = request.json or {}
+    logger.debug("Received survival request with data: %s", data)
+    
+    try:
+        horizon = int(data.get('horizon', data.get('months', 24)))
+        scenarios = data.get('scenarios', list(SCENARIOS.keys()))
+        
+        if horizon <= 0 or horizon > MAX_SURVIVAL_HORIZON:
+            return jsonify({"error": f"Invalid parameters: horizon must be between 1 and {MAX_SURVIVAL_HORIZON}"}), 400
+        
+        unknown = [name for name in scenarios if name not in SCENARIOS]
+        if not scenarios or unknown:
+            return jsonify({"error": f"Unknown scenario: {unknown}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+    
+    try:
+        analysis = current_app.extensions['survival_tables'].get(scenarios, horizon)
+        
+        response = {}
+        for k, scenario in enumerate(analysis['scenarios']):
+            response[scenario] = {
+                'Expected Months To Churn': dict(zip(ACTIVE_STATES, analysis['expected_months'][k].tolist())),
+                'Median Months To Churn': {
+                    state: (int(months) if months >= 0 else None)
+                    for state, months in zip(ACTIVE_STATES, analysis['median_months'][k])
+                },
+                'Survival': {state: analysis['survival'][k, :, i].tolist() for i, state in enumerate(ACTIVE_STATES)},
+                'Hazard': {state: analysis['hazard'][k, :, i].tolist() for i, state in enumerate(ACTIVE_STATES)}
+            }
+        return jsonify(response)
+    except Exception as e:
+        logger.error("Survival error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Survival error: {str(e)}"}), 500
+
+@api.route('/api/compare', methods=['POST'])
+def compare():
+    """API endpoint comparing scenarios from paired stochastic runs"""
+    data = request.json or {}
+    logger.debug("Received comparison request with data: %s", data)
+    
+    try:
+        initial_customers = int(data.get('initialCustomers', 10000))
+        new_customers_per_month = int(data.get('newCustomersPerMonth', 800))
+        months = int(data.get('months', 12))
+        scenarios = data.get('scenarios', list(SCENARIOS.keys()))
+        baseline = data.get('baseline', 'Default')
+        replications = int(data.get('replications', 200))
+        antithetic = bool(data.get('antithetic', True))
+        common_random_numbers = bool(data.get('commonRandomNumbers', True))
+        confidence = float(data.get('confidence', 0.95))
+        seed = int(data.get('seed', 0))
+        
+        if initial_customers <= 0 or new_customers_per_month < 0 or months <= 0 or replications < 2:
+            return jsonify({"error": "Invalid parameters: values must be positive (at least 2 replications)"}), 400
+        
+        if antithetic and replications % 2:
+            return jsonify({"error": "Invalid parameters: replications must be even with antithetic variates"}), 400
+        
+        customer_months = (initial_customers + new_customers_per_month * months) * months
+        if customer_months * replications * (len(scenarios) + 1) > 300000000:
+            return jsonify({"error": "Invalid parameters: customers x months x replications x scenarios "
+                                     "must not exceed 300000000"}), 400
+        
+        if not 0 < confidence < 1:
+            return jsonify({"error": "Invalid parameters: confidence must be between 0 and 1"}), 400
+        
+        unknown = [name for name in scenarios + [baseline] if name not in SCENARIOS]
+        if not scenarios or unknown:
+            return jsonify({"error": f"Unknown scenario: {unknown}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+    
+    try:
+        results = compare_scenarios(
+            scenarios=scenarios,
+            baseline=baseline,
+            months=months,
+            initial_customers=initial_customers,
+            new_customers_per_month=new_customers_per_month,
+            replications=replications,
+            antithetic=antithetic,
+            common_random_numbers=common_random_numbers,
+            confidence=confidence,
+            seed=seed
+        )
+        return jsonify(results.to_dict(orient='records'))
+    except Exception as e:
+        logger.error("Comparison error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Comparison error: {str(e)}"}), 500
+
+@api.route('/api/tailrisk', methods=['POST'])
+def tailrisk():
+    """API endpoint for the probability and expected shortfall of revenue below a floor"""
+    data = request.json or {}
+    logger.debug("Received tail risk request with data: %s", data)
+    
+    try:
+        floor = data.get('floor')
+        if floor is None:
+            return jsonify({"error": "No revenue floor provided"}), 400
+        floor = float(floor)
+        initial_customers = int(data.get('initialCustomers', 10000))
+        new_customers_per_month = int(data.get('newCustomersPerMonth', 800))
+        months = int(data.get('months', 24))
+        scenario = data.get('scenario', 'Default')
+        paths = int(data.get('paths', 10000))
+        confidence = float(data.get('confidence', 0.95))
+        seed = int(data.get('seed', 0))
+        
+        if initial_customers <= 0 or new_customers_per_month < 0 or months <= 0 or paths < 2:
+            return jsonify({"error": "Invalid parameters: values must be positive (at least 2 paths)"}), 400
+        
+        if paths * months > 5000000:
+            return jsonify({"error": "Invalid parameters: paths x months must not exceed 5000000"}), 400
+        
+        if not 0 < confidence < 1:
+            return jsonify({"error": "Invalid parameters: confidence must be between 0 and 1"}), 400
+        
+        if scenario not in SCENARIOS:
+            return jsonify({"error": f"Unknown scenario: {scenario}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+    
+    try:
+        model = CustomerMarkovModel(
+            initial_customers=initial_customers,
+            new_customers_per_month=new_customers_per_month,
+            scenario=scenario
+        )
+        result = tail_risk(model, floor, months=months, paths=paths, confidence=confidence, seed=seed)
+        result['scenario'] = scenario
+        return jsonify(result)
+    except Exception as e:
+        logger.error("Tail risk error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Tail risk error: {str(e)}"}), 500
+
+@api.route('/api/whatif', methods=['POST'])
+def whatif():
+    """
+    API endpoint to tweak one transition probability and get instant updates.
+    
+    Edits accumulate in the engine of the request's sessionId. A request
+    without one starts a new session, whose id is returned for later edits,
+    so clients never share an engine by accident.
+    """
+    start = time.perf_counter()
+    data = request.json or {}
+    
+    try:
+        session_id = data.get('sessionId')
+        session_id = uuid.uuid4().hex if session_id is None else str(session_id)
+        scenario = data.get('scenario', 'Default')
+        initial_customers = int(data.get('initialCustomers', 10000))
+        new_customers_per_month = int(data.get('newCustomersPerMonth', 800))
+        months = int(data.get('months', 12))
+        from_state = data.get('from')
+        to_state = data.get('to')
+        value = data.get('value')
+        delta = data.get('delta')
+        
+        if initial_customers <= 0 or new_customers_per_month < 0 or months <= 0 or months > 600:
+            return jsonify({"error": "Invalid parameters: values must be positive (at most 600 months)"}), 400
+        
+        if scenario not in SCENARIOS:
+            return jsonify({"error": f"Unknown scenario: {scenario}. Available scenarios: {list(SCENARIOS.keys())}"}), 400
+        
+        # States may be given by name or by index
+        edit = from_state is not None or to_state is not None
+        if edit:
+            from_state = STATES.index(from_state) if isinstance(from_state, str) else int(from_state)
+            to_state = STATES.index(to_state) if isinstance(to_state, str) else int(to_state)
+            if not (0 <= from_state < len(STATES) and 0 <= to_state < len(STATES)):
+                return jsonify({"error": f"Invalid state: states must be between 0 and {len(STATES) - 1}"}), 400
+            if value is None and delta is None:
+                return jsonify({"error": "Either value or delta is required to edit a transition"}), 400
+            value = None if value is None else float(value)
+            delta = None if delta is None else float(delta)
+    except (ValueError, TypeError):
+        return jsonify({"error": f"Invalid parameters: numeric values and states from {STATES} expected"}), 400
+    
+    try:
+        engine = current_app.extensions['whatif_sessions'].get(
+            session_id,
+            scenario,
+            initial_customers=initial_customers,
+            new_customers_per_month=new_customers_per_month,
+            months=months
+        )
+        with engine.lock:
+            if data.get('reset'):
+                engine.reset()
+            if edit:
+                engine.edit(from_state, to_state, value=value, delta=delta)
+            response = engine.summary()
+        
+        response['sessionId'] = session_id
+        response['latency_ms'] = (time.perf_counter() - start) * 1000
+        return jsonify(response)
+    except Exception as e:
+        logger.error("What-if error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"What-if error: {str(e)}"}), 500
+
+@api.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """API endpoint to submit a simulation job, run inline if cheap and queued otherwise"""
+    data = request.json or {}
+    logger.debug("Received job request with data: %s", data)
+    
+    kind = data.get('kind', 'simulate')
+    try:
+        priority = int(data.get('priority', 0))
+        if kind == 'simulate':
+            runs = [parse_simulation_request(data.get('params', {}))]
+        elif kind == 'batch':
+            runs = [parse_simulation_request(params) for params in data.get('runs', [])]
+            if not runs:
+                return jsonify({"error": "No runs provided"}), 400
+        else:
+            return jsonify({"error": f"Unknown job kind: {kind}. Available kinds: ['simulate', 'batch']"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except (TypeError, AttributeError):
+        return jsonify({"error": "Invalid parameters: objects expected"}), 400
+    
+    # Cost is the horizon times the batch size
+    cost = sum(params['months'] for params in runs)
+    
+    # Queued jobs run outside the request, so they get the cache rather than the app
+    cache = current_app.extensions['result_cache']
+    def work(report_progress):
+        results = []
+        for i, params in enumerate(runs):
+            results.append(run_simulation(params, cache))
+            report_progress((i + 1) / len(runs))
+        return results[0] if kind == 'simulate' else results
+    
+    try:
+        job = current_app.extensions['job_queue'].submit(work, cost, priority=priority, kind=kind)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429
+    
+    if job.status == 'done':
+        return jsonify(job.to_dict())
+    if job.status == 'failed':
+        return jsonify(job.to_dict()), 500
+    
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job.id}"
+    return response
+
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """API endpoint for the status, progress and result of a job"""
+    job = current_app.extensions['job_queue'].get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+@api.route('/api/jobs', methods=['GET'])
+def job_stats():
+    """API endpoint summarizing the job queue"""
+    return jsonify(current_app.extensions['job_queue'].stats())
+
+@api.route('/api/metrics/coalescing', methods=['GET'])
+def coalescing_metrics():
+    """API endpoint reporting how many simulations were shared between requests"""
+    return jsonify(current_app.extensions['simulation_flight'].stats())
+
+def open_path_run(run_id):
+    """Open a stored path run and read the scenario and metric query parameters"""
+    run = current_app.extensions['path_store'].open(run_id)
+    if run is None:
+        return None, None, None, (jsonify({"error": f"Unknown run: {run_id}"}), 404)
+    
+    scenario = request.args.get('scenario', run.scenarios[0])
+    metric = request.args.get('metric', 'revenue')
+    if scenario not in run.scenarios:
+        return None, None, None, (jsonify({"error": f"Scenario {scenario} is not in run {run_id}. "
+                                                   f"Available scenarios: {run.scenarios}"}), 400)
+    if metric not in PATH_METRICS:
+        return None, None, None, (jsonify({"error": f"Unknown metric: {metric}. "
+                                                   f"Available metrics: {PATH_METRICS}"}), 400)
+    return run, scenario, metric, None
+
+@api.route('/api/paths', methods=['GET'])
+def list_path_runs():
+    """API endpoint listing the stored Monte Carlo runs"""
+    return jsonify(current_app.extensions['path_store'].runs())
+
+@api.route('/api/paths/<run_id>/quantiles', methods=['GET'])
+def path_quantiles(run_id):
+    """API endpoint for per-month quantiles of a stored run, streamed from disk"""
+    run, scenario, metric, error = open_path_run(run_id)
+    if error:
+        return error
+    
+    try:
+        quantiles = [float(q) for q in request.args.get('q', '0.05,0.5,0.95').split(',')]
+    except ValueError:
+        return jsonify({"error": "Invalid parameters: q must be a comma-separated list of numbers"}), 400
+    if not quantiles or any(not 0 <= q <= 1 for q in quantiles):
+        return jsonify({"error": "Invalid parameters: quantiles must be between 0 and 1"}), 400
+    
+    try:
+        return jsonify(run.quantiles(scenario, quantiles, metric))
+    except Exception as e:
+        logger.error("Path quantile error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Path quantile error: {str(e)}"}), 500
+
+@api.route('/api/paths/<run_id>/exceedance', methods=['GET'])
+def path_exceedance(run_id):
+    """API endpoint for the probability of a stored run's metric crossing a threshold"""
+    run, scenario, metric, error = open_path_run(run_id)
+    if error:
+        return error
+    
+    threshold = request.args.get('threshold')
+    if threshold is None:
+        return jsonify({"error": "No threshold provided"}), 400
+    try:
+        threshold = float(threshold)
+    except ValueError:
+        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+    below = request.args.get('below', 'false').lower() in ('1', 'true', 'yes')
+    
+    try:
+        return jsonify(run.exceedance(scenario, threshold, metric, below))
+    except Exception as e:
+        logger.error("Path exceedance error: %s", e)
+        logger.error(traceback.format_exc())
+        return jsonify({"error": f"Path exceedance error: {str(e)}"}), 500
+
+@api.route('/api/live', methods=['GET'])
+def live_forecast():
+    """API endpoint for the live customer base and its latest forecast"""
+    forecaster = current_app.extensions.get('live_forecaster')
+    if forecaster is None:
+        return jsonify({"error": "Live event ingestion is not enabled (set LIVE_EVENTS)"}), 404
+    
+    summary = forecaster.summary()
+    results = forecaster.results
+    summary['results'] = None if results is None else to_records(results)
+    return jsonify(summary)
+
+def profile_authorized():
+    """Check whether the request carries the admin profiling token in its X-Profile header"""
+    token = request.headers.get('X-Profile')
+    expected = current_app.config['PROFILE_TOKEN']
+    return bool(token and expected) and hmac.compare_digest(token.encode(), expected.encode())
+
+def start_profile():
+    """Start profiling a request that asks for it with the admin token"""
+    if request.path.startswith('/api/profiles') or not profile_authorized():
+        return
+    
+    # Read the body first so the capture can keep it for reproducing the request
+    g.profile_body = request.get_data(cache=True)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active in this process (one at a time since Python 3.12)
+        logger.warning("Skipped profiling %s: another profile is running", request.path)
+        return
+    g.profiler = profiler
+    g.profile_started = time.perf_counter()
+
+def finish_profile(response):
+    """Stop the request's profiler, store the capture and return its id in X-Profile-Id"""
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    duration = time.perf_counter() - g.profile_started
+    
+    # A token sent in the query string by mistake is not authorized but must not be stored either
+    args = {key: value for key, value in request.args.items() if key != 'profile'}
+    meta = current_app.extensions['profile_store'].save(pstats.Stats(profiler), {
+        'method': request.method,
+        'path': request.path,
+        'args': args,
+        'status': response.status_code,
+        'duration': duration
+    }, body=g.pop('profile_body', None))
+    logger.info("Profiled %s %s in %.1f ms as %s", request.method, request.path, duration * 1000, meta['id'])
+    response.headers['X-Profile-Id'] = meta['id']
+    return response
+
+def stop_profile(error=None):
+    """Make sure a profiler never outlives its request"""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+@api.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """API endpoint listing the most recent profile captures (admin only)"""
+    store = current_app.extensions.get('profile_store')
+    if store is None:
+        return jsonify({"error": "Profiling is not enabled (set PROFILE_TOKEN)"}), 404
+    if not profile_authorized():
+        return jsonify({"error": "Profiling requires the admin token"}), 403
+    
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "Invalid parameters: numeric values expected"}), 400
+    return jsonify(store.list(max(limit, 0)))
+
+@api.route('/api/profiles/<capture_id>/<kind>', methods=['GET'])
+def download_profile(capture_id, kind):
+    """API endpoint downloading a capture's pstats, folded stacks or request body (admin only)"""
+    store = current_app.extensions.get('profile_store')
+    if store is None:
+        return jsonify({"error": "Profiling is not enabled (set PROFILE_TOKEN)"}), 404
+    if not profile_authorized():
+        return jsonify({"error": "Profiling requires the admin token"}), 403
+    
+    path = store.path(capture_id, kind)
+    if path is None:
+        return jsonify({"error": f"Unknown capture file: {capture_id}/{kind}"}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=os.path.basename(path),
+                     mimetype='application/octet-stream')
+
+@api.route('/api/scenarios', methods=['GET'])
 def get_scenarios():
     """Return the available scenarios"""
     return jsonify(list(SCENARIOS.keys()))
 
-@app.route('/', methods=['GET'])
+def send_asset(asset):
+    """
+    Serve a cached static asset, compressed if the client accepts it.
+
+    HTML is revalidated on every load (its name never changes when its content
+    does); other assets may be reused for STATIC_MAX_AGE seconds. A request
+    whose If-None-Match holds the current ETag gets an empty 304.
+    """
+    encoding = choose_encoding(asset, request.accept_encodings)
+    etag = asset.etag(encoding)
+    
+    if asset.mimetype == 'text/html':
+        cache_control = 'no-cache'
+    else:
+        cache_control = f"public, max-age={current_app.config['STATIC_MAX_AGE']}"
+    
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@api.route('/', methods=['GET'])
 def index():
     """Serve the React app"""
-    return app.send_static_file('index.html')
+    asset = current_app.extensions['static_assets'].get('index.html')
+    if asset is None:
+        return jsonify({"error": "Dashboard not found: static/index.html is missing"}), 404
+    return send_asset(asset)
 
 # Catch-all route to handle the React router
-@app.route('/<path:path>', methods=['GET'])
+@api.route('/<path:path>', methods=['GET'])
 def catch_all(path):
-    try:
-        return app.send_static_file(path)
-    except:
-        return app.send_static_file('index.html')
+    """Serve a static file, or the React app for client-side routes"""
+    assets = current_app.extensions['static_assets']
+    asset = assets.get(path)
+    if asset is not None:
+        return send_asset(asset)
+    
+    # Unknown API endpoints and missing files are errors, not app routes
+    if path.startswith('api/') or '.' in path.rsplit('/', 1)[-1]:
+        return jsonify({"error": f"Not found: /{path}"}), 404
+    
+    return index()
 
 def setup_static_directory():
     """Set up the static directory with the index.html file"""
@@ -342,16 +1175,126 @@ def check_simulation_module():
         traceback.print_exc()
         return False
 
+def preload(app):
+    """
+    Compute the scenario artifacts that requests would otherwise build on first use.
+
+    Called once in the parent of a pre-fork server, so every worker starts with
+    them in memory shared copy-on-write instead of rebuilding them per worker:
+    the survival tables /api/survival slices and the posterior draws
+    /api/posterior reads at its default settings. The default simulations are
+    also put in the on-disk result cache.
+
+    Args:
+        app: App whose extensions are filled
+    """
+    start = time.perf_counter()
+    warm_up(app.extensions['result_cache'], months=app.config['PRELOAD_MONTHS'])
+    for scenario in SCENARIOS:
+        sample_transition_matrices(scenario)
+    app.extensions['survival_tables'].compute()
+    logger.info("Preloaded %d scenarios in %.2fs", len(SCENARIOS), time.perf_counter() - start)
+
+def create_app(config=None):
+    """
+    Create the Flask app.
+
+    Importing this module builds no app; `flask --app app run` finds this
+    factory, and servers call it, e.g. for a pre-fork server create the app
+    in the parent with preloading:
+
+        gunicorn --preload -w 4 'app:create_app({"PRELOAD": True})'
+
+    Preloaded state is moved out of the garbage collector's reach with
+    gc.freeze(), so collections in the workers do not write to (and copy) the
+    pages they share with the parent.
+
+    Args:
+        config: Values overriding DEFAULT_CONFIG and Flask's own settings
+
+    Returns:
+        The configured Flask app
+    """
+    app = Flask(__name__, static_folder='static')
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(config or {})
+    
+    # basicConfig leaves handlers configured by the server alone
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
+    logger.setLevel(app.config['LOG_LEVEL'])
+    
+    app.register_blueprint(api)
+    
+    for path in app.config['FITTED_SCENARIOS']:
+        logger.info("Registered fitted scenario '%s' from %s", load_fitted_scenario(path), path)
+    
+    if app.config['PROFILE_TOKEN']:
+        # Hooks are only installed when profiling is configured, so it costs nothing otherwise
+        app.extensions['profile_store'] = ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_KEEP'])
+        app.before_request(start_profile)
+        app.after_request(finish_profile)
+        app.teardown_request(stop_profile)
+    
+    # Per-app state of the handlers; module-level objects would be shared by every app
+    app.extensions['whatif_sessions'] = WhatIfSessions()
+    app.extensions['simulation_flight'] = SingleFlight()
+    app.extensions['survival_tables'] = SurvivalTables()
+    # Worker threads start with the first queued job, so after a pre-fork server forks
+    app.extensions['job_queue'] = JobQueue(max_cost=MAX_JOB_BYTES // JOB_BYTES_PER_MONTH,
+                                           max_retained_cost=MAX_RETAINED_JOB_BYTES // JOB_BYTES_PER_MONTH)
+    
+    # Simulation results, created on disk with the first stored result
+    app.extensions['result_cache'] = ResultCache(app.config['RESULT_CACHE_DIR'], app.config['RESULT_CACHE_MAX_BYTES'])
+    
+    # Stored Monte Carlo runs, queried from memory-mapped files
+    app.extensions['path_store'] = PathStore(app.config['PATH_STORE_DIR'])
+    
+    # Static files are read and compressed once, then served from memory
+    app.extensions['static_assets'] = StaticAssets(app.static_folder, auto_reload=app.debug)
+    
+    if app.config['LIVE_EVENTS']:
+        # One ingestion thread per process; a tcp source needs a single worker
+        live = LiveCounts(app.config['LIVE_INITIAL_COUNTS'])
+        forecaster = LiveForecaster(live, app.config['LIVE_SCENARIO'], app.config['LIVE_MONTHS'],
+                                    app.config['LIVE_THRESHOLD'])
+        forecaster.refresh(force=True)
+        start_ingestion(forecaster, app.config['LIVE_EVENTS'], from_start=True)
+        app.extensions['live_forecaster'] = forecaster
+    
+    if app.config['SELF_TEST']:
+        # Run a test to check if the simulation module handles new customers correctly
+        check_simulation_module()
+    
+    if app.config['PRELOAD']:
+        preload(app)
+        gc.collect()
+        gc.freeze()
+    
+    return app
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Client behavior dashboard")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="Skip the simulation self-test and preloading")
+    parser.add_argument("--debug", action="store_true", help="Run Flask in debug mode with debug logging")
+    parser.add_argument("--port", type=int, default=5000, help="Port to listen on")
+    parser.add_argument("--live-events", help="Live event source, file:<path> or tcp:<host>:<port>")
+    args = parser.parse_args()
+    
     # Setup static directory
     setup_static_directory()
     
-    # Run a test to check if the simulation module handles new customers correctly
-    check_simulation_module()
+    app = create_app({
+        'LOG_LEVEL': 'DEBUG' if args.debug else DEFAULT_CONFIG['LOG_LEVEL'],
+        'SELF_TEST': not args.fast_start,
+        'PRELOAD': not args.fast_start,
+        'LIVE_EVENTS': args.live_events,
+        'DEBUG': args.debug,
+        # Enable detailed error messages in the browser
+        'PROPAGATE_EXCEPTIONS': True
+    })
     
     print("\nClient behavior dashboard")
-    print("Open your browser at http://localhost:5000")
+    print(f"Open your browser at http://localhost:{args.port}")
     
-    # Enable detailed error messages in the browser
-    app.config['PROPAGATE_EXCEPTIONS'] = True
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=args.debug, port=args.port)
@@ -0,0 +1,332 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from transition_matrices import STATES, NEW_CUSTOMER_DISTRIBUTION, get_transition_matrix
+from revenue_model import revenue_vector
+from simulation import CustomerMarkovModel
+
+# Name of the method that fits a matrix on every training window
+FITTED = "Window Fit"
+
+# Origins scored per task sent to a worker
+DEFAULT_CHUNK_SIZE = 8
+
+def project_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Project every row onto the probability simplex (Euclidean projection).
+
+    Args:
+        matrix: Matrix whose rows are projected
+
+    Returns:
+        Matrix with non-negative rows summing to 1
+    """
+    n = matrix.shape[1]
+    ordered = -np.sort(-matrix, axis=1)
+    cumulative = np.cumsum(ordered, axis=1) - 1.0
+    positive = ordered - cumulative / np.arange(1, n + 1) > 0
+    last = n - 1 - np.argmax(positive[:, ::-1], axis=1)
+    threshold = cumulative[np.arange(len(matrix)), last] / (last + 1)
+    return np.maximum(matrix - threshold[:, None], 0.0)
+
+def fit_transition_matrix(counts: np.ndarray,
+                          new_customers: np.ndarray,
+                          prior: np.ndarray,
+                          regularization: float = 1.0,
+                          new_customer_distribution: np.ndarray = NEW_CUSTOMER_DISTRIBUTION,
+                          iterations: int = 5000,
+                          tol: float = 1e-10) -> np.ndarray:
+    """
+    Fit a transition matrix to aggregate monthly segment counts.
+
+    Solves the constrained least squares problem
+        min ||counts[1:] - new_customers * d - counts[:-1] @ P||^2 + lambda ||P - prior||^2
+    over row-stochastic P by accelerated projected gradient (FISTA), as only
+    segment totals, not individual transitions, are observed. The ridge
+    term toward the prior weighs as much as `regularization` months of data,
+    which keeps short windows well-posed.
+
+    Args:
+        counts: Segment counts of consecutive months, shape (months + 1, 5)
+        new_customers: New customers that joined in each transition, shape (months,)
+        prior: Matrix the fit is shrunk toward
+        regularization: Weight of the prior in months of data
+        new_customer_distribution: How new customers are split across segments
+        iterations: Maximum number of iterations
+        tol: Stop once no probability changes by more than this
+
+    Returns:
+        Fitted transition matrix
+    """
+    counts = np.asarray(counts, dtype=float)
+    scale = max(counts.sum(axis=1).mean(), 1.0)
+    X = counts[:-1] / scale
+    Y = (counts[1:] - np.outer(new_customers, new_customer_distribution)) / scale
+
+    gram = X.T @ X
+    cross = X.T @ Y
+    penalty = regularization * np.trace(gram) / len(X) / len(STATES)
+    step = 1.0 / (np.linalg.eigvalsh(gram).max() + penalty)
+
+    P = previous = np.asarray(prior, dtype=float).copy()
+    momentum = 1.0
+    for _ in range(iterations):
+        # Gradient step from the extrapolated point, then back onto the simplex
+        next_momentum = (1 + np.sqrt(1 + 4 * momentum ** 2)) / 2
+        point = P + (momentum - 1) / next_momentum * (P - previous)
+        gradient = gram @ point - cross + penalty * (point - prior)
+        previous, P = P, project_rows(point - step * gradient)
+        momentum = next_momentum
+        if np.abs(P - previous).max() < tol:
+            break
+    return P
+
+def infer_new_customers(counts: np.ndarray) -> np.ndarray:
+    """
+    Infer the new customers of every month from the growth of the total.
+
+    No customer leaves the chain (churned customers stay in No Repurchase),
+    so the total only grows by new customers.
+    """
+    return np.maximum(np.diff(np.asarray(counts, dtype=float).sum(axis=1)), 0.0)
+
+def load_history(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load historical monthly segment counts.
+
+    Args:
+        path: CSV with one column per segment (as written by main.py) and an
+            optional "New Customers" column, or a .npy array of shape (months, 5)
+
+    Returns:
+        Tuple of (counts with shape (months, 5), new customers of each of
+        the months - 1 transitions)
+    """
+    if path.endswith(".npy"):
+        counts = np.load(path).astype(float)
+        return counts, infer_new_customers(counts)
+
+    frame = pd.read_csv(path)
+    missing = [state for state in STATES if state not in frame.columns]
+    if missing:
+        raise ValueError(f"History is missing segment columns: {missing}")
+    if "Month" in frame.columns:
+        frame = frame.sort_values("Month")
+    counts = frame[STATES].to_numpy(dtype=float)
+    if "New Customers" in frame.columns:
+        # The new customers of a month joined during the transition into it
+        return counts, frame["New Customers"].to_numpy(dtype=float)[1:]
+    return counts, infer_new_customers(counts)
+
+# Worker state: views of the shared history and the settings of the run
+_shared = {}
+
+def _attach(name: str, months: int, prior: np.ndarray, fixed: Dict[str, np.ndarray], regularization: float):
+    """Process pool initializer: map the shared history instead of receiving a copy per task"""
+    memory = shared_memory.SharedMemory(name=name)
+    # Keep the mapping open for the life of the worker
+    _shared["memory"] = memory
+    data = np.ndarray((months, len(STATES) + 1), dtype=np.float64, buffer=memory.buf)
+    _shared.update(counts=data[:, :len(STATES)], new_customers=data[1:, len(STATES)],
+                   prior=prior, fixed=fixed, regularization=regularization)
+
+class OriginModel(CustomerMarkovModel):
+    """
+    CustomerMarkovModel that starts from given segment counts.
+
+    Setting initial_distribution does not reproduce arbitrary counts, since
+    initial_counts() truncates distribution * total, so the counts are kept
+    as they are.
+    """
+
+    def __init__(self, counts: np.ndarray, transition_matrix: np.ndarray, new_customers_per_month: float):
+        """
+        Initialize the model at a forecast origin.
+
+        Args:
+            counts: Segment counts at the origin
+            transition_matrix: Transition matrix to forecast with
+            new_customers_per_month: New customers per month over the forecast
+        """
+        counts = np.round(np.asarray(counts, dtype=float)).astype(int)
+        super().__init__(initial_customers=int(counts.sum()), new_customers_per_month=new_customers_per_month)
+        self.transition_matrix = transition_matrix
+        self.origin_counts = counts
+
+    def initial_counts(self) -> np.ndarray:
+        """Get the segment counts at the origin"""
+        return self.origin_counts.copy()
+
+def forecast(matrix: np.ndarray, counts: np.ndarray, new_customers_per_month: float, horizon: int) -> np.ndarray:
+    """
+    Forecast segment counts from an origin with CustomerMarkovModel.
+
+    Args:
+        matrix: Transition matrix
+        counts: Segment counts at the origin
+        new_customers_per_month: New customers per month over the horizon
+        horizon: Months ahead
+
+    Returns:
+        Forecast counts with shape (horizon + 1, 5), the origin first
+    """
+    model = OriginModel(counts, matrix, new_customers_per_month)
+    return model.simulate(months=horizon)[STATES].to_numpy(dtype=float)
+
+def score_origins(origins: List[int], window: Optional[int], horizon: int) -> List[Dict]:
+    """
+    Score every method at a list of forecast origins (runs in a worker).
+
+    Args:
+        origins: Months to forecast from; training uses the months up to them
+        window: Training months of a rolling window, or None for expanding windows
+        horizon: Maximum months ahead
+
+    Returns:
+        One row per origin, method and horizon with absolute percentage errors
+    """
+    counts, new_customers = _shared["counts"], _shared["new_customers"]
+    revenue = revenue_vector(STATES)
+    rows = []
+    for origin in origins:
+        start = 0 if window is None else origin - window
+        train_counts = counts[start:origin + 1]
+        train_new = new_customers[start:origin]
+        steps = min(horizon, len(counts) - 1 - origin)
+        actual = counts[origin:origin + steps + 1]
+        # Acquisition over the horizon is assumed to continue at the training average
+        acquisition = float(train_new.mean())
+
+        matrices = dict(_shared["fixed"])
+        matrices[FITTED] = fit_transition_matrix(train_counts, train_new, _shared["prior"], _shared["regularization"])
+        for method, matrix in matrices.items():
+            predicted = forecast(matrix, counts[origin], acquisition, steps)
+            for ahead in range(1, steps + 1):
+                row = {"Method": method, "Origin": origin, "Horizon": ahead, "Train Months": origin - start}
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    errors = np.abs(predicted[ahead] - actual[ahead]) / np.abs(actual[ahead]) * 100
+                for i, state in enumerate(STATES):
+                    row[f"{state} APE"] = errors[i] if actual[ahead, i] != 0 else np.nan
+                row["Revenue Forecast"] = predicted[ahead] @ revenue
+                row["Revenue Actual"] = actual[ahead] @ revenue
+                row["Revenue APE"] = abs(row["Revenue Forecast"] - row["Revenue Actual"]) / row["Revenue Actual"] * 100
+                rows.append(row)
+    return rows
+
+def backtest(counts: np.ndarray,
+             new_customers: Optional[np.ndarray] = None,
+             window: Optional[int] = 12,
+             horizon: int = 3,
+             min_train: int = 6,
+             prior: str = "Default",
+             compare: Optional[List[str]] = None,
+             regularization: float = 1.0,
+             workers: Optional[int] = None,
+             chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Backtest fitted transition matrices on historical segment counts.
+
+    At every origin a matrix is fitted on the training window before it and
+    the counts are forecast up to horizon months ahead with
+    CustomerMarkovModel, continuing the training window's average
+    acquisition. The scenarios in compare are scored the same way with their
+    fixed matrices. Origins are split across a process pool; the history is
+    placed in shared memory once and mapped by every worker, so tasks only
+    carry their origins.
+
+    Args:
+        counts: Segment counts of every month, shape (months, 5)
+        new_customers: New customers of each transition, shape (months - 1,)
+            (inferred from the growth of the total if None)
+        window: Months of a rolling training window, or None for expanding windows
+        horizon: Maximum months ahead
+        min_train: Training months of the first expanding window
+        prior: Scenario whose matrix starts the fits and regularizes them
+        compare: Scenarios scored as fixed-matrix baselines
+        regularization: Weight of the prior in months of data
+        workers: Worker processes (defaults to the CPU count)
+        chunk_size: Origins per task
+
+    Returns:
+        Tuple of (one row of errors per method, origin and horizon; MAPE per
+        method and horizon)
+    """
+    counts = np.asarray(counts, dtype=float)
+    if counts.ndim != 2 or counts.shape[1] != len(STATES):
+        raise ValueError(f"counts must have shape (months, {len(STATES)})")
+    new_customers = infer_new_customers(counts) if new_customers is None else np.asarray(new_customers, dtype=float)
+    if new_customers.shape != (len(counts) - 1,):
+        raise ValueError("new_customers must have one entry per transition (months - 1)")
+
+    first = min_train if window is None else window
+    if first < 1 or first >= len(counts) - 1:
+        raise ValueError(f"History of {len(counts)} months is too short for {first} training months")
+    origins = list(range(first, len(counts) - 1))
+    fixed = {scenario: get_transition_matrix(scenario) for scenario in (compare or [])}
+    if FITTED in fixed:
+        raise ValueError(f"'{FITTED}' names the window fits; rename that scenario to compare it")
+
+    # One block holds the counts and, in the last column, the new customers (row t: transition into t)
+    memory = shared_memory.SharedMemory(create=True, size=counts.shape[0] * (len(STATES) + 1) * 8)
+    try:
+        data = np.ndarray((len(counts), len(STATES) + 1), dtype=np.float64, buffer=memory.buf)
+        data[:, :len(STATES)] = counts
+        data[0, len(STATES)] = 0.0
+        data[1:, len(STATES)] = new_customers
+        del data
+
+        initargs = (memory.name, len(counts), get_transition_matrix(prior), fixed, regularization)
+        chunks = [origins[i:i + chunk_size] for i in range(0, len(origins), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=initargs) as pool:
+            results = pool.map(score_origins, chunks, [window] * len(chunks), [horizon] * len(chunks))
+            rows = [row for chunk in results for row in chunk]
+    finally:
+        memory.close()
+        memory.unlink()
+
+    errors = pd.DataFrame(rows).sort_values(["Method", "Origin", "Horizon"], ignore_index=True)
+    ape_columns = [f"{state} APE" for state in STATES] + ["Revenue APE"]
+    summary = errors.groupby(["Method", "Horizon"])[ape_columns].mean()
+    summary.columns = [column.replace(" APE", " MAPE") for column in ape_columns]
+    summary["Windows"] = errors.groupby(["Method", "Horizon"]).size()
+    return errors, summary.reset_index()
+
+def main():
+    """Command line entry point to backtest fitted matrices on a history"""
+    parser = argparse.ArgumentParser(description="Backtest transition matrices fitted on rolling or expanding windows")
+    parser.add_argument("history", help="CSV of monthly segment counts (or .npy of shape (months, 5))")
+    parser.add_argument("--window", type=int, default=12, help="Months of the rolling training window")
+    parser.add_argument("--expanding", action="store_true", help="Train on every month before the origin")
+    parser.add_argument("--min-train", type=int, default=6, help="Training months of the first expanding window")
+    parser.add_argument("--horizon", type=int, default=3)
+    parser.add_argument("--prior", default="Default", help="Scenario regularizing the fits")
+    parser.add_argument("--regularization", type=float, default=1.0, help="Weight of the prior in months")
+    parser.add_argument("--compare", nargs="*", default=[], help="Scenarios scored as fixed baselines")
+    parser.add_argument("--fitted-scenario", action="append", default=[],
+                        help="JSON written by `python hmm.py fit`, scored as a fixed baseline")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="CSV for the per-window errors")
+    args = parser.parse_args()
+
+    compare = list(args.compare)
+    if args.fitted_scenario:
+        # Imported here so plain backtests do not load the HMM module
+        from hmm import load_fitted_scenario
+        compare += [load_fitted_scenario(path) for path in args.fitted_scenario]
+
+    counts, new_customers = load_history(args.history)
+    errors, summary = backtest(counts, new_customers, None if args.expanding else args.window, args.horizon,
+                               args.min_train, args.prior, compare, args.regularization, args.workers)
+    if args.output:
+        errors.to_csv(args.output, index=False)
+        print(f"Wrote {len(errors)} rows to {os.path.abspath(args.output)}")
+    print(summary.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import argparse
+import cProfile
+import glob
+import json
+import os
+import sys
+import time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from transition_matrices import STATES, SCENARIOS
+from simulation import CustomerMarkovModel
+from profiling import ProfileStore, DEFAULT_PROFILE_DIR, merge_stats, profile_stats
+
+try:
+    import pyarrow  # Parquet engine of pandas
+except ImportError:  # Output then falls back to CSV
+    pyarrow = None
+
+# Format of outputs whose name ends in neither .parquet nor .csv
+DEFAULT_FORMAT = "parquet" if pyarrow is not None else "csv"
+
+# Defaults for fields a manifest entry leaves out
+JOB_DEFAULTS = {
+    "initial_customers": 10000,
+    "new_customers_per_month": 800,
+    "months": 12,
+    "scenario": "Default"
+}
+
+def parse_schedule(schedule) -> List[Dict]:
+    """
+    Parse a scenario schedule into a list of segments.
+
+    Args:
+        schedule: Either a list of {"scenario", "months", "new_customers_per_month"}
+            dicts or a string like "Default:6;Price Increase:6"
+
+    Returns:
+        List of segment dicts with scenario and months (and optionally
+        new_customers_per_month)
+    """
+    if isinstance(schedule, str):
+        segments = []
+        for part in schedule.split(';'):
+            if part.strip():
+                scenario, months = part.rsplit(':', 1)
+                segments.append({"scenario": scenario.strip(), "months": int(months)})
+        return segments
+    return [dict(segment) for segment in schedule]
+
+def load_manifest(path: str) -> List[Dict]:
+    """
+    Load a job manifest from JSON or CSV.
+
+    JSON manifests are a list of jobs (or {"jobs": [...]}); CSV manifests
+    have one job per row. Each job may set id, initial_customers,
+    new_customers_per_month, months, scenario and schedule. Missing ids
+    default to the job's position in the manifest.
+
+    Args:
+        path: Path of the manifest
+
+    Returns:
+        List of validated job dicts
+    """
+    if path.endswith('.csv'):
+        jobs = pd.read_csv(path, dtype={'id': str}).to_dict(orient='records')
+        jobs = [{key: value for key, value in job.items() if not pd.isna(value)} for job in jobs]
+    else:
+        with open(path) as f:
+            jobs = json.load(f)
+        if isinstance(jobs, dict):
+            jobs = jobs["jobs"]
+
+    validated = []
+    for position, job in enumerate(jobs):
+        job = {**JOB_DEFAULTS, **job}
+        job["id"] = str(job.get("id", position))
+        job["initial_customers"] = int(job["initial_customers"])
+        job["new_customers_per_month"] = int(job["new_customers_per_month"])
+        job["months"] = int(job["months"])
+
+        if "schedule" in job:
+            job["schedule"] = parse_schedule(job["schedule"])
+        else:
+            job["schedule"] = [{"scenario": job["scenario"], "months": job["months"]}]
+
+        for segment in job["schedule"]:
+            if segment["scenario"] not in SCENARIOS:
+                raise ValueError(f"Job {job['id']}: unknown scenario: {segment['scenario']}. "
+                                 f"Available scenarios: {list(SCENARIOS.keys())}")
+            if int(segment["months"]) <= 0:
+                raise ValueError(f"Job {job['id']}: months must be positive")
+        if job["initial_customers"] <= 0 or job["new_customers_per_month"] < 0:
+            raise ValueError(f"Job {job['id']}: invalid customer counts")
+        validated.append(job)
+
+    ids = [job["id"] for job in validated]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Job ids in the manifest must be unique")
+    return validated
+
+def run_job(job: Dict) -> pd.DataFrame:
+    """
+    Run one job: a simulation, or a chain of simulations following a scenario
+    schedule where each segment continues from the previous segment's final
+    counts (as /api/extend does).
+
+    Args:
+        job: Validated job dict
+
+    Returns:
+        DataFrame of monthly results tagged with the job id and scenario
+    """
+    frames = []
+    counts = None
+    last_month = 0
+    for segment in job["schedule"]:
+        model = CustomerMarkovModel(
+            initial_customers=job["initial_customers"] if counts is None else int(counts.sum()),
+            new_customers_per_month=int(segment.get("new_customers_per_month", job["new_customers_per_month"])),
+            scenario=segment["scenario"]
+        )
+        if counts is not None and counts.sum() > 0:
+            model.initial_distribution = counts / counts.sum()
+
+        results = model.simulate(months=int(segment["months"]))
+        results['Month'] += last_month
+        results.insert(1, 'Scenario', segment["scenario"])
+
+        # Later segments start where the previous one ended
+        frames.append(results if counts is None else results.iloc[1:])
+        counts = results.iloc[-1][STATES].to_numpy(dtype=float)
+        last_month = int(results['Month'].iloc[-1])
+
+    combined = pd.concat(frames, ignore_index=True)
+    combined.insert(0, 'job_id', job["id"])
+    return combined
+
+def run_jobs(jobs: List[Dict]) -> pd.DataFrame:
+    """Run a chunk of jobs in a worker process"""
+    return pd.concat([run_job(job) for job in jobs], ignore_index=True)
+
+def run_jobs_profiled(jobs: List[Dict]):
+    """Run a chunk of jobs under cProfile; returns the results and the worker's raw stats"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        frame = run_jobs(jobs)
+    finally:
+        profiler.disable()
+    return frame, profile_stats(profiler)
+
+def completed_job_ids(parts_dir: str) -> set:
+    """
+    Collect the ids of jobs already written by an earlier (possibly crashed) run.
+
+    Args:
+        parts_dir: Directory of part files
+
+    Returns:
+        Set of completed job ids
+    """
+    done = set()
+    for path in glob.glob(os.path.join(parts_dir, 'part-*.csv')):
+        done.update(pd.read_csv(path, usecols=['job_id'], dtype={'job_id': str})['job_id'].unique())
+    return done
+
+def write_part(parts_dir: str, frame: pd.DataFrame, index: int):
+    """Atomically write one part file so a crash never leaves a partial part"""
+    path = os.path.join(parts_dir, f'part-{os.getpid()}-{index:06d}.csv')
+    frame.to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+def output_format(output: str) -> str:
+    """
+    Get the format of an output file from its name.
+
+    Args:
+        output: Path of the output
+
+    Returns:
+        "parquet" or "csv"; names with neither extension get DEFAULT_FORMAT,
+        which is Parquet whenever pyarrow is installed
+    """
+    if output.endswith('.parquet'):
+        return "parquet"
+    if output.endswith('.csv'):
+        return "csv"
+    return DEFAULT_FORMAT
+
+def finalize(parts_dir: str, output: str) -> int:
+    """
+    Merge all part files into the single output file, in the format of output_format.
+
+    Args:
+        parts_dir: Directory of part files
+        output: Path of the combined output
+
+    Returns:
+        Number of rows written
+    """
+    parts = sorted(glob.glob(os.path.join(parts_dir, 'part-*.csv')))
+    if not parts:
+        raise ValueError(f"No completed jobs found in {parts_dir}")
+    combined = pd.concat([pd.read_csv(path, dtype={'job_id': str}) for path in parts], ignore_index=True)
+    combined = combined.sort_values(['job_id', 'Month'], kind='stable')
+
+    if output_format(output) == "parquet":
+        combined.to_parquet(output + '.tmp', index=False)
+    else:
+        combined.to_csv(output + '.tmp', index=False)
+    os.replace(output + '.tmp', output)
+    return len(combined)
+
+def run_batch(manifest: str,
+              output: str,
+              workers: Optional[int] = None,
+              chunk_size: int = 50,
+              keep_parts: bool = False,
+              profile_dir: Optional[str] = None) -> int:
+    """
+    Run every job of a manifest across a process pool.
+
+    Completed chunks are written to <output>.parts as they finish, so an
+    interrupted run can be restarted with the same arguments and will skip
+    every job already written.
+
+    With profile_dir, the parent and every worker task run under cProfile
+    and their statistics are merged into one capture in that directory.
+
+    Args:
+        manifest: Path of the JSON or CSV manifest
+        output: Path of the combined output (see output_format)
+        workers: Number of worker processes (defaults to the CPU count)
+        chunk_size: Number of jobs per task sent to a worker
+        keep_parts: Keep the part files after the output is written
+        profile_dir: Directory of a ProfileStore to save a profile of the run to
+
+    Returns:
+        Number of jobs run in this invocation
+    """
+    # Fail before simulating rather than when writing the output
+    if output_format(output) == "parquet" and pyarrow is None:
+        raise ValueError(f"Parquet output {output} requires pyarrow; install it or write a .csv output")
+
+    profiler = None
+    worker_stats = []
+    if profile_dir:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    jobs = load_manifest(manifest)
+    parts_dir = output + '.parts'
+    os.makedirs(parts_dir, exist_ok=True)
+
+    done = completed_job_ids(parts_dir)
+    pending = [job for job in jobs if job["id"] not in done]
+    if done:
+        print(f"Resuming: {len(done)} of {len(jobs)} jobs already completed")
+
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    start = time.perf_counter()
+    completed = 0
+
+    if chunks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            work = run_jobs_profiled if profiler else run_jobs
+            futures = {pool.submit(work, chunk): len(chunk) for chunk in chunks}
+            for index, future in enumerate(as_completed(futures)):
+                result = future.result()
+                if profiler:
+                    result, stats = result
+                    worker_stats.append(stats)
+                write_part(parts_dir, result, index)
+                completed += futures[future]
+                elapsed = time.perf_counter() - start
+                print(f"\r{completed}/{len(pending)} jobs "
+                      f"({completed / max(elapsed, 1e-9):,.0f} jobs/s)", end='', flush=True)
+        print()
+
+    rows = finalize(parts_dir, output)
+    if not keep_parts:
+        for path in glob.glob(os.path.join(parts_dir, 'part-*.csv')):
+            os.remove(path)
+        os.rmdir(parts_dir)
+
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {rows} rows for {len(jobs)} jobs to {output} in {elapsed:.2f}s")
+
+    if profiler:
+        profiler.disable()
+        store = ProfileStore(profile_dir)
+        meta = store.save(merge_stats([profile_stats(profiler)] + worker_stats), {
+            "command": "batch",
+            "manifest": manifest,
+            "jobs": len(jobs),
+            "duration": elapsed
+        })
+        print(f"Saved profile {meta['id']} to {store.path(meta['id'], 'pstats')} "
+              f"(worker time is summed over {len(worker_stats)} tasks)")
+    return completed
+
+def main(argv: Optional[List[str]] = None):
+    """Command line entry point: python main.py batch <manifest> [output]"""
+    parser = argparse.ArgumentParser(prog="main.py batch",
+                                     description="Run many simulations from a job manifest")
+    parser.add_argument("manifest", help="JSON or CSV job manifest")
+    parser.add_argument("output", nargs="?", default=f"batch_results.{DEFAULT_FORMAT}",
+                        help="Combined output file, .parquet or .csv (default: batch_results.parquet, "
+                             "or .csv without pyarrow)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=50, help="Jobs per worker task")
+    parser.add_argument("--keep-parts", action="store_true", help="Keep per-chunk part files")
+    parser.add_argument("--profile", action="store_true", help="Profile the run with cProfile")
+    parser.add_argument("--profile-dir", default=DEFAULT_PROFILE_DIR, help="Directory of the saved profiles")
+    args = parser.parse_args(argv)
+
+    run_batch(args.manifest, args.output, args.workers, args.chunk_size, args.keep_parts,
+              args.profile_dir if args.profile else None)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
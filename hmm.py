@@ -0,0 +1,405 @@
+import argparse
+import json
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from transition_matrices import STATES, SCENARIOS, get_transition_matrix
+from revenue_model import MONTHLY_REVENUE
+from posterior import register_transition_counts, forget_transition_counts
+from scoring import score_tables
+
+# Expected purchases per month in each segment. The active segments follow the
+# purchase frequencies behind MONTHLY_REVENUE; Immediate Repurchase customers
+# buy about monthly and No Repurchase customers almost never.
+PURCHASE_RATES = np.array([1.0, 6.5 / 12, 3.5 / 12, 5 / 12, 0.02])
+
+# Starting emission parameters: purchases per month are Poisson, and the log of
+# the average ticket of a month with purchases is normal
+DEFAULT_EMISSIONS = {
+    "rate": PURCHASE_RATES,
+    "log_ticket_mean": np.log([max(MONTHLY_REVENUE[state], 1.0) / rate if MONTHLY_REVENUE[state] else 100.0
+                               for state, rate in zip(STATES, PURCHASE_RATES)]),
+    "log_ticket_std": np.full(len(STATES), 0.3)
+}
+
+# Lower bounds that keep degenerate segments from collapsing the fit
+MIN_RATE = 1e-6
+MIN_LOG_TICKET_STD = 1e-3
+
+Source = Union[str, np.ndarray]
+
+def initial_parameters(scenario: str = "Default") -> Dict[str, np.ndarray]:
+    """
+    Get starting HMM parameters: a scenario's transition matrix and the default emissions.
+
+    Args:
+        scenario: Scenario whose transition matrix starts the fit
+
+    Returns:
+        Dictionary of parameters (initial, transition, rate, log_ticket_mean,
+        log_ticket_std)
+    """
+    return {
+        "initial": np.full(len(STATES), 1.0 / len(STATES)),
+        "transition": np.array(get_transition_matrix(scenario), dtype=float),
+        **{name: np.array(value, dtype=float) for name, value in DEFAULT_EMISSIONS.items()}
+    }
+
+def emission_log_likelihood(counts: np.ndarray, spend: np.ndarray, params: Dict) -> np.ndarray:
+    """
+    Log-likelihood of every monthly observation under every segment.
+
+    Args:
+        counts: Purchases per customer and month, shape (customers, months);
+            negative for months that were not observed
+        spend: Spend per customer and month, same shape
+        params: HMM parameters
+
+    Returns:
+        Array of shape (months, 5, customers), customers last so every
+        per-month slice is contiguous; unobserved months are 0
+    """
+    counts = np.asarray(counts, dtype=np.int64).T[:, None, :]
+    spend = np.asarray(spend, dtype=float).T[:, None, :]
+    observed = counts >= 0
+    bought = counts > 0
+    safe_counts = np.where(observed, counts, 0)
+
+    # log(k!) from a cumulative table, since numpy has no lgamma
+    log_factorial = np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, safe_counts.max() + 1)))])
+    rate = params["rate"][:, None]
+    log_b = safe_counts * np.log(rate) - rate - log_factorial[safe_counts]
+
+    ticket = np.log(np.where(bought, spend, 1.0) / np.where(bought, safe_counts, 1))
+    std = params["log_ticket_std"][:, None]
+    z = (ticket - params["log_ticket_mean"][:, None]) / std
+    log_b += np.where(bought, -0.5 * z ** 2 - np.log(std * np.sqrt(2 * np.pi)), 0.0)
+
+    return np.where(observed, log_b, 0.0)
+
+def forward_backward(log_b: np.ndarray, params: Dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Run the forward-backward recursions in log space for a batch of sequences.
+
+    Each step is a matrix product of exponentials shifted by their per-sequence
+    maximum, so it stays vectorized across customers without underflowing.
+
+    Args:
+        log_b: Emission log-likelihoods, shape (months, 5, customers)
+        params: HMM parameters
+
+    Returns:
+        Tuple of (log alpha, log beta, log-likelihood of each sequence)
+    """
+    months = log_b.shape[0]
+    transition = params["transition"]
+    log_alpha = np.empty_like(log_b)
+    log_beta = np.zeros_like(log_b)
+
+    with np.errstate(divide='ignore'):
+        log_alpha[0] = np.log(params["initial"])[:, None] + log_b[0]
+        for t in range(1, months):
+            shift = log_alpha[t - 1].max(axis=0)
+            log_alpha[t] = np.log(transition.T @ np.exp(log_alpha[t - 1] - shift)) + shift + log_b[t]
+
+        for t in range(months - 2, -1, -1):
+            following = log_b[t + 1] + log_beta[t + 1]
+            shift = following.max(axis=0)
+            log_beta[t] = np.log(transition @ np.exp(following - shift)) + shift
+
+    shift = log_alpha[-1].max(axis=0)
+    log_likelihood = np.log(np.exp(log_alpha[-1] - shift).sum(axis=0)) + shift
+    return log_alpha, log_beta, log_likelihood
+
+def sufficient_statistics(counts: np.ndarray, spend: np.ndarray, params: Dict) -> Dict[str, np.ndarray]:
+    """
+    E-step for a batch of customers.
+
+    The statistics of separate batches add up, so chunks can be processed
+    independently (and in parallel) and summed before the M-step.
+
+    Args:
+        counts: Purchases per customer and month, shape (customers, months)
+        spend: Spend per customer and month, same shape
+        params: Current HMM parameters
+
+    Returns:
+        Dictionary of expected initial segment counts, expected transition
+        counts, emission statistics and the total log-likelihood
+    """
+    log_b = emission_log_likelihood(counts, spend, params)
+    log_alpha, log_beta, log_likelihood = forward_backward(log_b, params)
+
+    # Expected transitions, summed over customers with one matrix product per month
+    transition = params["transition"]
+    transitions = np.zeros_like(transition)
+    for t in range(log_b.shape[0] - 1):
+        current = log_alpha[t]
+        following = log_b[t + 1] + log_beta[t + 1]
+        current_shift = current.max(axis=0)
+        following_shift = following.max(axis=0)
+        weight = np.exp(current_shift + following_shift - log_likelihood)
+        transitions += (np.exp(current - current_shift) * weight) @ np.exp(following - following_shift).T
+    transitions *= transition
+
+    # Segment posteriors of every customer and month, shape (months, 5, customers)
+    gamma = log_alpha
+    gamma += log_beta
+    gamma -= log_likelihood
+    np.exp(gamma, out=gamma)
+
+    counts = np.asarray(counts, dtype=np.int64).T[:, None, :]
+    spend = np.asarray(spend, dtype=float).T[:, None, :]
+    observed = gamma * (counts >= 0)
+    bought = gamma * (counts > 0)
+    ticket = np.log(np.where(counts > 0, spend, 1.0) / np.maximum(counts, 1))
+    return {
+        "initial": gamma[0].sum(axis=1),
+        "transitions": transitions,
+        "observed": observed.sum(axis=(0, 2)),
+        "purchases": (observed * np.maximum(counts, 0)).sum(axis=(0, 2)),
+        "bought": bought.sum(axis=(0, 2)),
+        "ticket": (bought * ticket).sum(axis=(0, 2)),
+        "ticket_squared": (bought * ticket ** 2).sum(axis=(0, 2)),
+        "log_likelihood": np.array(log_likelihood.sum())
+    }
+
+def maximize(statistics: Dict[str, np.ndarray], params: Dict, fit_emissions: bool = True) -> Dict[str, np.ndarray]:
+    """
+    M-step: re-estimate the parameters from summed sufficient statistics.
+
+    Args:
+        statistics: Summed output of sufficient_statistics
+        params: Current parameters, kept where the statistics carry no information
+        fit_emissions: Also re-estimate the emission parameters
+
+    Returns:
+        New HMM parameters
+    """
+    updated = {name: value.copy() for name, value in params.items()}
+    updated["initial"] = statistics["initial"] / statistics["initial"].sum()
+
+    totals = statistics["transitions"].sum(axis=1, keepdims=True)
+    np.divide(statistics["transitions"], totals, out=updated["transition"], where=totals > 0)
+
+    if fit_emissions:
+        observed, bought = statistics["observed"], statistics["bought"]
+        np.divide(statistics["purchases"], observed, out=updated["rate"], where=observed > 0)
+        updated["rate"] = np.maximum(updated["rate"], MIN_RATE)
+
+        np.divide(statistics["ticket"], bought, out=updated["log_ticket_mean"], where=bought > 0)
+        variance = np.divide(statistics["ticket_squared"], bought, out=np.zeros_like(bought), where=bought > 0)
+        variance -= updated["log_ticket_mean"] ** 2
+        updated["log_ticket_std"] = np.where(bought > 0, np.sqrt(np.maximum(variance, MIN_LOG_TICKET_STD ** 2)),
+                                             params["log_ticket_std"])
+    return updated
+
+def _load(source: Source, start: int, stop: int) -> np.ndarray:
+    """Read rows start:stop of an array or of a .npy file (memory-mapped)"""
+    if isinstance(source, str):
+        return np.asarray(np.load(source, mmap_mode='r')[start:stop])
+    return source[start:stop]
+
+def _chunk_statistics(task: Tuple) -> Dict[str, np.ndarray]:
+    """E-step of one chunk in a worker process"""
+    counts, spend, start, stop, params = task
+    return sufficient_statistics(_load(counts, start, stop), _load(spend, start, stop), params)
+
+def fit_hmm(counts: Source,
+            spend: Source,
+            params: Optional[Dict] = None,
+            iterations: int = 100,
+            tol: float = 1e-7,
+            chunk_size: int = 20000,
+            workers: int = 1,
+            fit_emissions: bool = True,
+            verbose: bool = False) -> Tuple[Dict, Dict, List[float]]:
+    """
+    Fit the HMM with Baum-Welch over customer sequences processed in chunks.
+
+    Every iteration runs the E-step chunk by chunk, in a pool of worker
+    processes when workers > 1, and sums the chunks' sufficient statistics
+    before the M-step. Pass file paths rather than arrays with several
+    workers: each worker then memory-maps only its own rows.
+
+    Args:
+        counts: Purchases per customer and month (array or .npy path), shape
+            (customers, months); negative for unobserved months
+        spend: Spend per customer and month (array or .npy path), same shape
+        params: Starting parameters (defaults to initial_parameters())
+        iterations: Maximum number of iterations
+        tol: Stop when the log-likelihood improves by less than this
+            fraction of its magnitude
+        chunk_size: Customers per E-step chunk
+        workers: Number of worker processes
+        fit_emissions: Also fit the emission parameters
+        verbose: Print the log-likelihood of every iteration
+
+    Returns:
+        Tuple of (fitted parameters, sufficient statistics of the final
+        parameters, log-likelihood of every iteration)
+    """
+    params = initial_parameters() if params is None else {name: np.array(value, dtype=float)
+                                                          for name, value in params.items()}
+    customers = (np.load(counts, mmap_mode='r') if isinstance(counts, str) else counts).shape[0]
+    bounds = [(start, min(start + chunk_size, customers)) for start in range(0, customers, chunk_size)]
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    history = []
+    try:
+        for iteration in range(iterations):
+            start_time = time.perf_counter()
+            tasks = [(counts, spend, start, stop, params) for start, stop in bounds]
+            chunk_statistics = pool.map(_chunk_statistics, tasks) if pool else map(_chunk_statistics, tasks)
+
+            statistics = None
+            for chunk in chunk_statistics:
+                statistics = chunk if statistics is None else {name: statistics[name] + value
+                                                               for name, value in chunk.items()}
+
+            log_likelihood = float(statistics["log_likelihood"])
+            history.append(log_likelihood)
+            if verbose:
+                print(f"Iteration {iteration + 1}: log-likelihood {log_likelihood:,.1f} "
+                      f"({time.perf_counter() - start_time:.2f}s)")
+
+            # The statistics belong to the current parameters, so stop before updating them
+            if len(history) > 1 and history[-1] - history[-2] < tol * abs(history[-2]):
+                break
+            params = maximize(statistics, params, fit_emissions)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    return params, statistics, history
+
+def simulate_observations(transition_matrix: np.ndarray,
+                          customers: int,
+                          months: int,
+                          params: Optional[Dict] = None,
+                          seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Generate purchase observations from hidden segment paths.
+
+    Args:
+        transition_matrix: Matrix the hidden segments move by
+        customers: Number of customers
+        months: Number of months per customer
+        params: Emission parameters (and initial distribution) to use
+        seed: Random seed
+
+    Returns:
+        Tuple of (hidden segments, purchase counts, spend), each of shape
+        (customers, months)
+    """
+    params = initial_parameters() if params is None else params
+    rng = np.random.default_rng(seed)
+    cumulative = np.cumsum(transition_matrix, axis=1)
+    cumulative[:, -1] = 1.0
+
+    segments = np.empty((customers, months), dtype=np.int8)
+    segments[:, 0] = rng.choice(len(STATES), size=customers, p=params["initial"])
+    for t in range(1, months):
+        uniforms = rng.random(customers)
+        segments[:, t] = (uniforms[:, None] >= cumulative[segments[:, t - 1], :-1]).sum(axis=1)
+
+    counts = rng.poisson(params["rate"][segments]).astype(np.int32)
+    tickets = np.exp(rng.normal(params["log_ticket_mean"][segments], params["log_ticket_std"][segments]))
+    spend = np.where(counts > 0, counts * tickets, 0.0)
+    return segments, counts, spend
+
+def register_fitted_scenario(name: str, params: Dict, statistics: Optional[Dict] = None) -> None:
+    """
+    Make a fitted transition matrix available as a scenario.
+
+    The expected transition counts, if given, become the scenario's observed
+    counts for posterior sampling; otherwise counts of an earlier fit with
+    this name are dropped. Either way cached posterior draws and scores are
+    cleared, and what-if sessions on this name restart from the new matrix.
+
+    Args:
+        name: Scenario name
+        params: Fitted HMM parameters
+        statistics: Sufficient statistics of the fit
+    """
+    transition = np.asarray(params["transition"], dtype=float)
+    if transition.shape != (len(STATES), len(STATES)) or not np.allclose(transition.sum(axis=1), 1.0):
+        raise ValueError(f"A scenario needs a row-stochastic {len(STATES)}x{len(STATES)} matrix")
+
+    SCENARIOS[name] = transition
+    if statistics is not None:
+        register_transition_counts(name, statistics["transitions"])
+    else:
+        forget_transition_counts(name)
+    # Tables of an earlier scenario with this name are stale now
+    score_tables.cache_clear()
+
+def save_fit(path: str, name: str, params: Dict, statistics: Dict, history: List[float]) -> None:
+    """Write a fitted model to JSON"""
+    with open(path, 'w') as f:
+        json.dump({
+            "name": name,
+            "params": {key: value.tolist() for key, value in params.items()},
+            "transition_counts": statistics["transitions"].tolist(),
+            "log_likelihood": history
+        }, f, indent=2)
+
+def load_fitted_scenario(path: str) -> str:
+    """
+    Register the scenario of a model written by save_fit.
+
+    Args:
+        path: Path of the JSON file
+
+    Returns:
+        The scenario name
+    """
+    with open(path) as f:
+        fit = json.load(f)
+    params = {key: np.array(value) for key, value in fit["params"].items()}
+    register_fitted_scenario(fit["name"], params, {"transitions": np.array(fit["transition_counts"])})
+    return fit["name"]
+
+def main():
+    """Command line entry point to simulate observations and fit the HMM"""
+    parser = argparse.ArgumentParser(description="Fit segment transitions from purchase observations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    simulate = subparsers.add_parser("simulate", help="Generate observations from a scenario")
+    simulate.add_argument("prefix", help="Writes <prefix>_counts.npy and <prefix>_spend.npy")
+    simulate.add_argument("--scenario", default="Default")
+    simulate.add_argument("--customers", type=int, default=100000)
+    simulate.add_argument("--months", type=int, default=24)
+    simulate.add_argument("--seed", type=int, default=0)
+
+    fit = subparsers.add_parser("fit", help="Fit the HMM with Baum-Welch")
+    fit.add_argument("counts", help=".npy file of purchases per customer and month")
+    fit.add_argument("spend", help=".npy file of spend per customer and month")
+    fit.add_argument("output", help="JSON file for the fitted model")
+    fit.add_argument("--name", default="Fitted", help="Scenario name of the fitted matrix")
+    fit.add_argument("--start", default="Default", help="Scenario whose matrix starts the fit")
+    fit.add_argument("--iterations", type=int, default=100)
+    fit.add_argument("--tol", type=float, default=1e-7)
+    fit.add_argument("--chunk-size", type=int, default=20000)
+    fit.add_argument("--workers", type=int, default=1)
+    fit.add_argument("--fixed-emissions", action="store_true", help="Only fit the transitions")
+    args = parser.parse_args()
+
+    if args.command == "simulate":
+        _, counts, spend = simulate_observations(get_transition_matrix(args.scenario), args.customers,
+                                                 args.months, seed=args.seed)
+        np.save(f"{args.prefix}_counts.npy", counts)
+        np.save(f"{args.prefix}_spend.npy", spend)
+    else:
+        params, statistics, history = fit_hmm(args.counts, args.spend, initial_parameters(args.start),
+                                              iterations=args.iterations, tol=args.tol,
+                                              chunk_size=args.chunk_size, workers=args.workers,
+                                              fit_emissions=not args.fixed_emissions, verbose=True)
+        save_fit(args.output, args.name, params, statistics, history)
+        print(f"Fitted transition matrix for scenario '{args.name}':")
+        print(np.round(params["transition"], 4))
+
+if __name__ == "__main__":
+    main()
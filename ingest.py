@@ -0,0 +1,586 @@
+import argparse
+import logging
+import math
+import os
+import socketserver
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from transition_matrices import STATES, NEW_CUSTOMER_DISTRIBUTION, get_transition_matrix
+from posterior import DEFAULT_CONCENTRATION
+from simulation import CustomerMarkovModel, forecast_batch
+
+logger = logging.getLogger(__name__)
+
+# Average month length in seconds, the unit of the estimated transition rates
+SECONDS_PER_MONTH = 30.4375 * 24 * 3600
+
+# Index of "outside the customer base" in the from/to codes of an event
+OUTSIDE = len(STATES)
+
+def _pair_codes() -> Dict[str, int]:
+    """
+    Map the "from,to" part of an event line to a code from * 6 + to.
+
+    Segments can be given by index or by name; an empty field stands for
+    outside the customer base. Keys include the line endings so lines can be
+    looked up without stripping them.
+    """
+    names = {"": OUTSIDE}
+    for i, state in enumerate(STATES):
+        names[str(i)] = i
+        names[state] = i
+
+    codes = {}
+    for source, i in names.items():
+        for target, j in names.items():
+            if i == OUTSIDE and j == OUTSIDE:
+                continue
+            for ending in ("", "\n", "\r\n"):
+                codes[f"{source},{target}{ending}"] = i * (OUTSIDE + 1) + j
+    return codes
+
+PAIR_CODES = _pair_codes()
+
+class LiveCounts:
+    """
+    Live segment counts and rolling transition counts from segment-change events.
+
+    An event is a line "timestamp,from,to": a Unix timestamp in seconds and
+    the segments a customer moves between, by index (0-4) or name. An empty
+    from is a new customer and an empty to a customer leaving the base,
+    e.g. "1718000000,,1" or "1718000000,Loyal Customer,No Repurchase".
+    Only changes are events; customers staying in their segment send nothing.
+
+    Each event increments one of 36 pair counters, so ingestion is O(1) per
+    event. The counters are folded into the segment counts and the current
+    time bucket once per batch, and whole buckets enter and leave the rolling
+    window, so the window costs O(1) per bucket rather than per event.
+    Segment exposure (customer-months) is accumulated per bucket from the
+    counts at its start and end, which turns the window's move counts into
+    monthly transition probabilities.
+
+    Events older than the current bucket are counted in the current bucket.
+    Malformed lines, non-finite timestamps and timestamps more than
+    max_ahead_seconds past both the latest event and the wall clock are
+    skipped and counted as rejected, so one bad clock cannot move the open
+    bucket far ahead and clear the window.
+    """
+
+    def __init__(self,
+                 initial_counts: Optional[np.ndarray] = None,
+                 window_seconds: float = 3 * SECONDS_PER_MONTH,
+                 bucket_seconds: float = 24 * 3600,
+                 max_ahead_seconds: Optional[float] = None):
+        """
+        Initialize the counts.
+
+        Args:
+            initial_counts: Segment counts before the first event (defaults to zeros)
+            window_seconds: Length of the rolling window of transition counts
+            bucket_seconds: Granularity at which events leave the window
+            max_ahead_seconds: How far past the latest event (or the wall
+                clock, if later) a timestamp may be (defaults to window_seconds)
+        """
+        if bucket_seconds <= 0 or window_seconds < bucket_seconds:
+            raise ValueError("bucket_seconds must be positive and at most window_seconds")
+
+        self.counts = np.zeros(len(STATES)) if initial_counts is None else np.asarray(initial_counts, dtype=float)
+        if self.counts.shape != (len(STATES),):
+            raise ValueError(f"initial_counts must have {len(STATES)} entries")
+
+        self.bucket_seconds = float(bucket_seconds)
+        self.window_buckets = int(window_seconds // bucket_seconds)
+        self.max_ahead_seconds = float(window_seconds if max_ahead_seconds is None else max_ahead_seconds)
+        self.lock = threading.Lock()
+
+        size = OUTSIDE + 1
+        # Events since the last fold, by pair code
+        self._pending = [0] * (size * size)
+        # Closed buckets of the window as (moves, exposure), and their running sums
+        self._buckets = deque()
+        self.window_moves = np.zeros((size, size))
+        self.window_exposure = np.zeros(len(STATES))
+        # The open bucket
+        self._bucket = None
+        self._bucket_moves = np.zeros((size, size))
+        self._bucket_start_counts = self.counts.copy()
+
+        self.events = 0
+        self.rejected = 0
+        self.last_timestamp = None
+
+    def ingest(self, lines: List[str]) -> int:
+        """
+        Apply a batch of event lines.
+
+        Args:
+            lines: Event lines, with or without line endings
+
+        Returns:
+            Number of events applied
+        """
+        codes = PAIR_CODES
+        width = self.bucket_seconds
+        applied = rejected = 0
+
+        with self.lock:
+            pending = self._pending
+            bucket = self._bucket
+            latest = self.last_timestamp
+            now = time.time()
+            limit = (now if latest is None else max(latest, now)) + self.max_ahead_seconds
+            for line in lines:
+                stamp, _, pair = line.partition(",")
+                try:
+                    code = codes[pair]
+                    timestamp = float(stamp)
+                    if not math.isfinite(timestamp) or timestamp > limit:
+                        raise ValueError(f"Implausible timestamp: {stamp}")
+                    line_bucket = int(timestamp // width)
+                except (KeyError, ValueError):
+                    rejected += 1
+                    continue
+
+                if latest is None or timestamp > latest:
+                    latest = timestamp
+                    limit = max(limit, latest + self.max_ahead_seconds)
+                if bucket is None or line_bucket > bucket:
+                    self._fold()
+                    self._advance(line_bucket)
+                    bucket = line_bucket
+                pending[code] += 1
+                applied += 1
+
+            self._fold()
+            self.events += applied
+            self.rejected += rejected
+            self.last_timestamp = latest
+        return applied
+
+    def _fold(self):
+        """Move the pending pair counters into the segment counts and the open bucket"""
+        size = OUTSIDE + 1
+        moves = np.array(self._pending, dtype=float).reshape(size, size)
+        if not moves.any():
+            return
+        self._pending[:] = [0] * (size * size)
+        self._bucket_moves += moves
+        self.counts += moves.sum(axis=0)[:OUTSIDE] - moves.sum(axis=1)[:OUTSIDE]
+
+    def _advance(self, bucket: int):
+        """Close the open bucket and any empty ones up to bucket, dropping buckets that leave the window"""
+        if self._bucket is not None:
+            months = self.bucket_seconds / SECONDS_PER_MONTH
+            exposure = (self._bucket_start_counts + self.counts) / 2 * months
+            self._push(self._bucket_moves, exposure)
+
+            # Buckets without events hold the current counts throughout
+            skipped = min(bucket - self._bucket - 1, self.window_buckets)
+            for _ in range(skipped):
+                self._push(np.zeros_like(self._bucket_moves), self.counts * months)
+
+        self._bucket = bucket
+        self._bucket_moves = np.zeros_like(self._bucket_moves)
+        self._bucket_start_counts = self.counts.copy()
+
+    def _push(self, moves: np.ndarray, exposure: np.ndarray):
+        """Add a closed bucket to the window"""
+        self._buckets.append((moves, exposure))
+        self.window_moves += moves
+        self.window_exposure += exposure
+        while len(self._buckets) > self.window_buckets:
+            old_moves, old_exposure = self._buckets.popleft()
+            self.window_moves -= old_moves
+            self.window_exposure -= old_exposure
+
+    def snapshot(self) -> Dict:
+        """
+        Copy the current state, including the open bucket.
+
+        Returns:
+            Dictionary with the segment counts, the window's moves (rows and
+            columns 0-4 are segments, 5 is outside the base), the exposure in
+            customer-months per segment, the window length in months and the
+            event totals
+        """
+        with self.lock:
+            months = self.bucket_seconds / SECONDS_PER_MONTH
+            open_fraction = 0.0
+            if self._bucket is not None and self.last_timestamp is not None:
+                open_fraction = min(max(self.last_timestamp / self.bucket_seconds - self._bucket, 0.0), 1.0)
+            open_exposure = (self._bucket_start_counts + self.counts) / 2 * months * open_fraction
+            return {
+                "counts": self.counts.copy(),
+                "moves": self.window_moves + self._bucket_moves,
+                "exposure": self.window_exposure + open_exposure,
+                "window_months": (len(self._buckets) + open_fraction) * months,
+                "events": self.events,
+                "rejected": self.rejected,
+                "last_timestamp": self.last_timestamp
+            }
+
+def estimate_parameters(snapshot: Dict, scenario: str = "Default",
+                        concentration: float = DEFAULT_CONCENTRATION) -> Dict:
+    """
+    Estimate the monthly transition matrix and acquisition from a snapshot.
+
+    The expected number of moves from segment i to j per customer-month is
+    P[i, j], so the window's moves divided by the exposure estimate the
+    off-diagonal probabilities. Every row is shrunk toward the scenario's
+    matrix with `concentration` customer-months of pseudo-exposure, so rows
+    with little exposure follow the scenario; staying absorbs the rest of
+    the row.
+
+    Args:
+        snapshot: Result of LiveCounts.snapshot()
+        scenario: Scenario whose matrix serves as the prior
+        concentration: Pseudo customer-months of the prior per row
+
+    Returns:
+        Dictionary with the transition matrix, new customers per month and
+        the new customer distribution
+    """
+    prior = get_transition_matrix(scenario)
+    moves = snapshot["moves"][:OUTSIDE, :OUTSIDE].copy()
+    np.fill_diagonal(moves, 0.0)
+    prior_moves = prior - np.diag(np.diag(prior))
+
+    leaving = (moves + concentration * prior_moves) / (np.maximum(snapshot["exposure"], 0.0) + concentration)[:, None]
+    # More observed moves than customers would make a negative diagonal; cap the row at 1
+    leaving /= np.maximum(leaving.sum(axis=1, keepdims=True), 1.0)
+    matrix = leaving + np.diag(1.0 - leaving.sum(axis=1))
+
+    arrivals = snapshot["moves"][OUTSIDE, :OUTSIDE]
+    window_months = snapshot["window_months"]
+    if arrivals.sum() > 0 and window_months > 0:
+        new_customers_per_month = arrivals.sum() / window_months
+        distribution = arrivals / arrivals.sum()
+    else:
+        new_customers_per_month = 0.0
+        distribution = np.asarray(NEW_CUSTOMER_DISTRIBUTION, dtype=float)
+
+    return {
+        "transition_matrix": matrix,
+        "new_customers_per_month": float(new_customers_per_month),
+        "new_customer_distribution": distribution
+    }
+
+class LiveForecaster:
+    """
+    Keeps a forecast of the live customer base, refreshed when the inputs drift.
+
+    After every batch the forecaster compares the live counts, transition
+    matrix and acquisition with the ones behind its current forecast, an O(1)
+    check, and only re-forecasts when one of them moved by more than the
+    threshold.
+    """
+
+    def __init__(self,
+                 live: LiveCounts,
+                 scenario: str = "Default",
+                 months: int = 12,
+                 threshold: float = 0.01,
+                 matrix_threshold: float = 0.01):
+        """
+        Initialize the forecaster.
+
+        Args:
+            live: Live counts to forecast from
+            scenario: Scenario whose matrix is the prior of the estimates
+            months: Number of months to forecast
+            threshold: Relative change of the segment counts (L1 distance over
+                total customers) or of acquisition that triggers a refresh
+            matrix_threshold: Change of any transition probability that
+                triggers a refresh
+        """
+        self.live = live
+        self.scenario = scenario
+        self.months = months
+        self.threshold = threshold
+        self.matrix_threshold = matrix_threshold
+        self.lock = threading.Lock()
+        self.basis = None
+        self.results = None
+        self.refreshes = 0
+        self.refreshed_at = None
+
+    def ingest(self, lines: List[str]) -> int:
+        """Apply a batch of event lines and refresh the forecast if needed"""
+        applied = self.live.ingest(lines)
+        self.refresh()
+        return applied
+
+    def drifted(self, snapshot: Dict, parameters: Dict) -> bool:
+        """Check whether the inputs moved beyond the thresholds since the last forecast"""
+        if self.basis is None:
+            return True
+        counts, basis = snapshot["counts"], self.basis
+        total = max(basis["counts"].sum(), 1.0)
+        if np.abs(counts - basis["counts"]).sum() / total > self.threshold:
+            return True
+        if np.abs(parameters["transition_matrix"] - basis["transition_matrix"]).max() > self.matrix_threshold:
+            return True
+        acquisition = max(basis["new_customers_per_month"], 1.0)
+        return abs(parameters["new_customers_per_month"] - basis["new_customers_per_month"]) / acquisition > self.threshold
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Re-forecast if the inputs drifted (or always with force).
+
+        Returns:
+            Whether the forecast was refreshed
+        """
+        snapshot = self.live.snapshot()
+        parameters = estimate_parameters(snapshot, self.scenario)
+        with self.lock:
+            if not force and not self.drifted(snapshot, parameters):
+                return False
+
+            counts = forecast_batch(np.maximum(snapshot["counts"], 0.0), parameters["transition_matrix"],
+                                    parameters["new_customers_per_month"], self.months,
+                                    parameters["new_customer_distribution"])
+            model = CustomerMarkovModel(scenario=self.scenario)
+            self.results = model._results_frame(np.round(counts).astype(int))
+            self.basis = {"counts": snapshot["counts"], **parameters}
+            self.refreshes += 1
+            self.refreshed_at = time.time()
+            logger.debug("Refreshed live forecast after %d events", snapshot["events"])
+            return True
+
+    def summary(self) -> Dict:
+        """Current live state and the parameters behind the latest forecast"""
+        snapshot = self.live.snapshot()
+        with self.lock:
+            basis = self.basis
+            return {
+                "counts": snapshot["counts"].tolist(),
+                "events": snapshot["events"],
+                "rejected": snapshot["rejected"],
+                "last_timestamp": snapshot["last_timestamp"],
+                "window_months": snapshot["window_months"],
+                "refreshes": self.refreshes,
+                "refreshed_at": self.refreshed_at,
+                "forecast_counts": None if basis is None else basis["counts"].tolist(),
+                "transition_matrix": None if basis is None else basis["transition_matrix"].tolist(),
+                "new_customers_per_month": None if basis is None else basis["new_customers_per_month"]
+            }
+
+def split_lines(remainder: bytes, chunk: bytes):
+    """
+    Split a chunk of a byte stream into complete lines.
+
+    Returns:
+        Tuple of (decoded complete lines, bytes of the incomplete last line)
+    """
+    data = remainder + chunk
+    end = data.rfind(b"\n") + 1
+    if not end:
+        return [], data
+    return data[:end].decode("utf-8", errors="replace").splitlines(), data[end:]
+
+def follow(path: str, from_start: bool = False, poll_interval: float = 0.2,
+           stop: Optional[threading.Event] = None, chunk_size: int = 1 << 20) -> Iterator[List[str]]:
+    """
+    Tail a file like `tail -F`, yielding batches of complete lines.
+
+    A file that shrinks (truncated) or is replaced (rotated) is read again
+    from its start.
+
+    Args:
+        path: File to follow
+        from_start: Read the lines already in the file first
+        poll_interval: Seconds to wait for new data
+        stop: Event ending the generator when set
+        chunk_size: Bytes read per batch
+    """
+    stop = stop or threading.Event()
+    f = None
+    remainder = b""
+    while not stop.is_set():
+        if f is None:
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                stop.wait(poll_interval)
+                continue
+            if not from_start:
+                f.seek(0, os.SEEK_END)
+            # Later reopenings after truncation or rotation always start at the beginning
+            from_start = True
+
+        chunk = f.read(chunk_size)
+        if chunk:
+            lines, remainder = split_lines(remainder, chunk)
+            if lines:
+                yield lines
+            continue
+
+        try:
+            status = os.stat(path)
+            replaced = status.st_ino != os.fstat(f.fileno()).st_ino or status.st_size < f.tell()
+        except FileNotFoundError:
+            replaced = False
+        if replaced:
+            f.close()
+            f, remainder = None, b""
+        else:
+            stop.wait(poll_interval)
+
+    if f is not None:
+        f.close()
+
+class _EventHandler(socketserver.BaseRequestHandler):
+    """Reads newline-delimited events from one connection"""
+
+    def handle(self):
+        remainder = b""
+        while True:
+            chunk = self.request.recv(1 << 16)
+            if not chunk:
+                break
+            lines, remainder = split_lines(remainder, chunk)
+            if lines:
+                self.server.consume(lines)
+
+class EventServer(socketserver.ThreadingTCPServer):
+    """Local TCP server passing the event lines of every connection to a consumer"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, consume: Callable[[List[str]], int]):
+        super().__init__(address, _EventHandler)
+        self.consume = consume
+
+def start(forecaster: LiveForecaster, source: str, from_start: bool = False,
+          stop: Optional[threading.Event] = None) -> threading.Thread:
+    """
+    Feed events from a source to a forecaster in a background thread.
+
+    Args:
+        forecaster: Forecaster consuming the events
+        source: "file:<path>" to tail a file or "tcp:<host>:<port>" to listen
+            on a socket (use one process per port)
+        from_start: Read the lines already in a tailed file first
+        stop: Event stopping a file tail when set
+
+    Returns:
+        The started daemon thread
+    """
+    kind, _, target = source.partition(":")
+    if kind == "file":
+        def run():
+            for lines in follow(target, from_start=from_start, stop=stop):
+                try:
+                    forecaster.ingest(lines)
+                except Exception:
+                    # A bad batch must not end the tail for good
+                    logger.exception("Failed to ingest %d event lines from %s", len(lines), target)
+    elif kind == "tcp":
+        host, _, port = target.rpartition(":")
+        server = EventServer((host or "127.0.0.1", int(port)), forecaster.ingest)
+        run = server.serve_forever
+    else:
+        raise ValueError(f"Unknown event source: {source}. Use file:<path> or tcp:<host>:<port>")
+
+    thread = threading.Thread(target=run, name="live-events", daemon=True)
+    thread.start()
+    logger.info("Ingesting live events from %s", source)
+    return thread
+
+def generate_events(path: str, events: int, customers: int = 10000, scenario: str = "Default",
+                    start_time: Optional[float] = None, months: float = 3.0, seed: int = 0):
+    """
+    Write synthetic events of a scenario's customers, for testing and benchmarks.
+
+    Customers start spread evenly over the active segments; each month every
+    customer moves according to the scenario's matrix (only changes are
+    written) and new customers arrive, until `events` lines are written.
+
+    Args:
+        path: Output file
+        events: Number of events to write
+        customers: Initial number of customers
+        scenario: Scenario driving the transitions
+        start_time: Timestamp of the first month (defaults to now minus the span)
+        months: Months per `events` lines, spreading the timestamps
+        seed: Random seed
+    """
+    rng = np.random.default_rng(seed)
+    matrix = get_transition_matrix(scenario)
+    cumulative = np.cumsum(matrix, axis=1)
+    states = np.repeat(np.arange(4), customers // 4)
+    arrivals_per_month = max(customers // 12, 1)
+
+    written = 0
+    timestamp = time.time() - months * SECONDS_PER_MONTH if start_time is None else start_time
+    with open(path, "w") as f:
+        while written < events:
+            moved = (rng.random(len(states))[:, None] > cumulative[states]).sum(axis=1)
+            changed = np.flatnonzero(moved != states)
+            new = rng.choice(len(STATES), size=arrivals_per_month, p=NEW_CUSTOMER_DISTRIBUTION)
+            step = SECONDS_PER_MONTH / max(len(changed) + len(new), 1)
+            times = timestamp + step * np.arange(len(changed) + len(new))
+            sources = np.concatenate([states[changed].astype(str), np.full(len(new), "")])
+            targets = np.concatenate([moved[changed], new]).astype(str)
+
+            count = min(len(times), events - written)
+            f.writelines(f"{t:.3f},{s},{d}\n" for t, s, d in zip(times[:count], sources[:count], targets[:count]))
+            written += count
+            states = np.concatenate([moved, new])
+            timestamp += SECONDS_PER_MONTH
+
+def main():
+    """Command line entry point to generate, tail or receive live events"""
+    parser = argparse.ArgumentParser(description="Ingest live segment-change events")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="Write synthetic events")
+    generate.add_argument("path")
+    generate.add_argument("--events", type=int, default=1000000)
+    generate.add_argument("--customers", type=int, default=100000)
+    generate.add_argument("--scenario", default="Default")
+    generate.add_argument("--seed", type=int, default=0)
+
+    for name, help_text in [("tail", "Follow an event file"), ("serve", "Listen for events on a local socket")]:
+        command = subparsers.add_parser(name, help=help_text)
+        if name == "tail":
+            command.add_argument("path")
+            command.add_argument("--from-start", action="store_true", help="Read the existing lines first")
+        else:
+            command.add_argument("--host", default="127.0.0.1")
+            command.add_argument("--port", type=int, default=9100)
+        command.add_argument("--initial-counts", type=float, nargs=len(STATES),
+                             help="Segment counts before the first event")
+        command.add_argument("--scenario", default="Default", help="Scenario used as the prior")
+        command.add_argument("--months", type=int, default=12)
+        command.add_argument("--threshold", type=float, default=0.01)
+        command.add_argument("--interval", type=float, default=5.0, help="Seconds between status lines")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate_events(args.path, args.events, args.customers, args.scenario, seed=args.seed)
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    forecaster = LiveForecaster(LiveCounts(args.initial_counts), args.scenario, args.months, args.threshold)
+    if args.command == "tail":
+        start(forecaster, f"file:{args.path}", from_start=args.from_start)
+    else:
+        start(forecaster, f"tcp:{args.host}:{args.port}")
+
+    while True:
+        time.sleep(args.interval)
+        summary = forecaster.summary()
+        revenue = None if forecaster.results is None else forecaster.results['Monthly Revenue'].iloc[-1]
+        print(f"{summary['events']} events, {summary['refreshes']} refreshes, "
+              f"counts {np.round(summary['counts']).astype(int).tolist()}, "
+              f"month {args.months} revenue {revenue}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import numpy as np
+from typing import Dict, Optional
+
+from transition_matrices import STATES, NEW_CUSTOMER_DISTRIBUTION, get_transition_matrix
+from revenue_model import revenue_vector
+from simulation import CustomerMarkovModel, forecast_batch
+
+# Quantities a target can be set on, as weights over the segment counts
+METRICS = {
+    "revenue": revenue_vector(STATES),                       # Monthly Revenue
+    "customers": np.ones(len(STATES)),                       # Total Customers
+    "active_customers": np.array([1.0, 1.0, 1.0, 1.0, 0.0])  # Everyone but No Repurchase
+}
+
+def affine_coefficients(initial_counts: np.ndarray,
+                        transition_matrix: np.ndarray,
+                        metric_vector: np.ndarray,
+                        months: int,
+                        new_customer_distribution: np.ndarray = NEW_CUSTOMER_DISTRIBUTION) -> np.ndarray:
+    """
+    Express a metric at every month as an affine function of acquisition.
+
+    Without rounding the simulation recurrence gives
+    counts[N] = counts[0] @ P^N + a * d @ (I + P + ... + P^(N-1)),
+    so metric[N] = base[N] + a * slope[N] for new customers per month a.
+
+    Args:
+        initial_counts: Customer counts at month 0
+        transition_matrix: The Markov chain transition matrix
+        metric_vector: Weight of each segment in the metric
+        months: Last month to compute coefficients for
+        new_customer_distribution: How new customers are split across segments
+
+    Returns:
+        Array of shape (months + 1, 2) holding (base, slope) for each month
+    """
+    coefficients = np.zeros((months + 1, 2))
+    counts = np.asarray(initial_counts, dtype=float)
+    inflow = np.asarray(new_customer_distribution, dtype=float)
+    accumulated = np.zeros_like(inflow)
+
+    coefficients[0, 0] = counts @ metric_vector
+    for month in range(1, months + 1):
+        counts = counts @ transition_matrix
+        accumulated = accumulated @ transition_matrix + inflow
+        coefficients[month] = counts @ metric_vector, accumulated @ metric_vector
+
+    return coefficients
+
+def _exact_acquisition(initial_counts: np.ndarray,
+                       transition_matrix: np.ndarray,
+                       metric_vector: np.ndarray,
+                       targets: np.ndarray,
+                       months: np.ndarray,
+                       estimates: np.ndarray,
+                       max_width: int = 4096) -> np.ndarray:
+    """
+    Find the smallest whole acquisition that meets each target with rounding.
+
+    simulate rounds counts to whole customers every month, which moves the
+    metric slightly off the affine line. The continuous estimate is therefore
+    refined by simulating a small window of integers around it, all targets
+    at once, widening the window until the answer is bracketed.
+    """
+    exact = np.full(targets.shape, -1, dtype=np.int64)
+    pending = np.arange(targets.size)
+    width = 4
+
+    while pending.size and width <= max_width:
+        low = np.maximum(np.ceil(estimates[pending]) - width, 0)
+        candidates = low[:, None] + np.arange(2 * width + 1)
+        paths = forecast_batch(initial_counts, transition_matrix, candidates,
+                               int(months[pending].max()), round_counts=True)
+        values = paths[np.arange(pending.size), :, months[pending], :] @ metric_vector
+        meets = values >= targets[pending, None]
+
+        # Bracketed when the window starts below the target (or at zero) and ends above it
+        bracketed = meets[:, -1] & (~meets[:, 0] | (low == 0))
+        first = np.argmax(meets, axis=1)
+        exact[pending[bracketed]] = (low + first)[bracketed]
+
+        pending = pending[~bracketed]
+        width *= 4
+
+    # Anything still unresolved falls back to the rounded-up continuous answer
+    exact[pending] = np.ceil(np.maximum(estimates[pending], 0))
+    return exact
+
+def solve_for_acquisition(target,
+                          month,
+                          scenario: str = "Default",
+                          metric: str = "revenue",
+                          initial_customers: int = 10000,
+                          initial_counts: Optional[np.ndarray] = None,
+                          exact: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Solve for the new customers per month needed to reach a target.
+
+    Because the recurrence is affine in new_customers_per_month, the answer
+    is one division per target instead of a bisection over simulations.
+    target and month may be scalars or arrays; they are broadcast together
+    so many targets are answered in one call.
+
+    Args:
+        target: Value the metric should reach
+        month: Month at which the target should be reached
+        scenario: Which business scenario to use
+        metric: "revenue", "customers" or "active_customers"
+        initial_customers: Total number of customers at start
+        initial_counts: Explicit month 0 counts (overrides initial_customers)
+        exact: Also compute the whole-customer answer under simulate's rounding
+
+    Returns:
+        Dictionary with the continuous required acquisition
+        ("new_customers_per_month", negative when the target is met without
+        any acquisition), the metric reached with no acquisition ("baseline")
+        and, if requested, the smallest whole acquisition that meets the
+        target in simulate ("exact")
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}. Available metrics: {list(METRICS.keys())}")
+
+    targets, months = np.broadcast_arrays(np.asarray(target, dtype=float), np.asarray(month, dtype=np.int64))
+    if months.size and months.min() <= 0:
+        raise ValueError("month must be positive")
+
+    transition_matrix = get_transition_matrix(scenario)
+    if initial_counts is None:
+        initial_counts = CustomerMarkovModel(initial_customers=initial_customers, scenario=scenario).initial_counts()
+    metric_vector = METRICS[metric]
+
+    coefficients = affine_coefficients(initial_counts, transition_matrix, metric_vector,
+                                       int(months.max()) if months.size else 0)
+    base, slope = coefficients[months, 0], coefficients[months, 1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        required = np.where(slope > 0, (targets - base) / slope, np.nan)
+
+    solution = {"new_customers_per_month": required, "baseline": base}
+    if exact:
+        flat_required = required.ravel()
+        solvable = np.isfinite(flat_required)
+        whole = np.full(flat_required.shape, -1, dtype=np.int64)
+        whole[solvable] = _exact_acquisition(initial_counts, transition_matrix, metric_vector,
+                                             targets.ravel()[solvable], months.ravel()[solvable],
+                                             flat_required[solvable])
+        solution["exact"] = whole.reshape(required.shape)
+
+    return solution
@@ -0,0 +1,231 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when a job is refused by admission control"""
+
+class Job:
+    """
+    A unit of work with its status, progress and result.
+    """
+
+    def __init__(self, work: Callable[[Callable[[float], None]], Any], cost: float, priority: int = 0,
+                 kind: str = "job"):
+        """
+        Initialize a job.
+
+        Args:
+            work: Function doing the work; it is passed a callback that takes
+                the completed fraction (0 to 1) and returns the job's result
+            cost: Estimated cost of the job (months x batch size)
+            priority: Higher priorities run first
+            kind: Name of the job type, for reporting
+        """
+        self.id = uuid.uuid4().hex
+        self.work = work
+        self.cost = cost
+        self.priority = priority
+        self.kind = kind
+        self.status = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.result_dropped = False
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def set_progress(self, fraction: float):
+        """Record the completed fraction of the job"""
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+
+    def run(self):
+        """Run the job, capturing its result or error"""
+        self.status = "running"
+        self.started = time.time()
+        try:
+            self.result = self.work(self.set_progress)
+            self.progress = 1.0
+            self.status = "done"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+            logger.exception("Job %s (%s) failed", self.id, self.kind)
+        finally:
+            self.work = None
+            self.finished = time.time()
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        """
+        Describe the job for JSON serialization.
+
+        Args:
+            include_result: Include the result of a finished job
+
+        Returns:
+            Dictionary with the job's id, status, progress and timings
+        """
+        description = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "priority": self.priority,
+            "cost": self.cost,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+        if self.error is not None:
+            description["error"] = self.error
+        if include_result and self.status == "done":
+            if self.result_dropped:
+                description["result_dropped"] = True
+            else:
+                description["result"] = self.result
+        return description
+
+class JobQueue:
+    """
+    An in-process job queue with a bounded pool of worker threads.
+
+    Cheap jobs run inline in the caller's thread. Other jobs wait in a
+    priority queue for one of the workers; admission control refuses jobs
+    above the maximum cost and jobs arriving while the queue is full.
+    Finished jobs are kept for lookup up to a retention limit, and the
+    results of the oldest ones are dropped (keeping their status) once the
+    retained results cost more than max_retained_cost in total.
+    """
+
+    def __init__(self,
+                 workers: int = 2,
+                 max_queued: int = 64,
+                 inline_cost: float = 1_000,
+                 max_cost: float = 10_000_000,
+                 max_retained: int = 1000,
+                 max_retained_cost: Optional[float] = None):
+        """
+        Initialize the queue. Worker threads start on the first queued job.
+
+        Args:
+            workers: Number of worker threads
+            max_queued: Maximum number of jobs waiting to run
+            inline_cost: Jobs estimated at or below this cost run inline
+            max_cost: Jobs estimated above this cost are refused
+            max_retained: Number of jobs kept for status lookups
+            max_retained_cost: Total cost of the results kept (defaults to
+                four jobs of the maximum cost)
+        """
+        self.workers = workers
+        self.max_queued = max_queued
+        self.inline_cost = inline_cost
+        self.max_cost = max_cost
+        self.max_retained = max_retained
+        self.max_retained_cost = 4 * max_cost if max_retained_cost is None else max_retained_cost
+
+        self.pending = queue.PriorityQueue()
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.threads = []
+
+    def _start_workers(self):
+        """Start the worker threads if they are not running yet"""
+        if not self.threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _worker(self):
+        """Run queued jobs in priority order, forever"""
+        while True:
+            _, _, job = self.pending.get()
+            job.run()
+            self._drop_results()
+            self.pending.task_done()
+
+    def _retain(self, job: Job):
+        """Remember a job, forgetting the oldest finished jobs past the retention limit"""
+        with self.lock:
+            self.jobs[job.id] = job
+            excess = len(self.jobs) - self.max_retained
+            for job_id in list(self.jobs):
+                if excess <= 0:
+                    break
+                if self.jobs[job_id].status in ("done", "failed"):
+                    del self.jobs[job_id]
+                    excess -= 1
+
+    def _drop_results(self):
+        """Drop the results of the earliest finished jobs until the rest fit in max_retained_cost"""
+        with self.lock:
+            kept = sorted((job for job in self.jobs.values() if job.status == "done" and not job.result_dropped),
+                          key=lambda job: job.finished)
+            total = sum(job.cost for job in kept)
+            # The latest result is always kept, so its owner can still fetch it
+            for job in kept[:-1]:
+                if total <= self.max_retained_cost:
+                    break
+                job.result = None
+                job.result_dropped = True
+                total -= job.cost
+
+    def submit(self, work: Callable, cost: float, priority: int = 0, kind: str = "job") -> Job:
+        """
+        Submit a job, running it inline if it is cheap enough.
+
+        Args:
+            work: Function doing the work (see Job)
+            cost: Estimated cost of the job (months x batch size)
+            priority: Higher priorities run first
+            kind: Name of the job type, for reporting
+
+        Returns:
+            The job; finished if it ran inline, queued otherwise
+
+        Raises:
+            QueueFullError: If the job costs too much or the queue is full
+        """
+        if cost > self.max_cost:
+            raise QueueFullError(f"Job cost {cost:,.0f} exceeds the maximum of {self.max_cost:,.0f}")
+
+        job = Job(work, cost, priority, kind)
+        if cost <= self.inline_cost:
+            job.run()
+            self._retain(job)
+            self._drop_results()
+            return job
+
+        with self.lock:
+            if self.pending.qsize() >= self.max_queued:
+                raise QueueFullError(f"Job queue is full ({self.max_queued} jobs waiting)")
+            self._start_workers()
+
+        # Retain before queueing so the job can be looked up as soon as it runs
+        self._retain(job)
+        self.pending.put((-priority, next(self.sequence), job))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id"""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        """Summarize the queue for monitoring"""
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": self.pending.qsize(),
+            **{status: statuses.count(status) for status in ("running", "done", "failed")}
+        }
@@ -0,0 +1,265 @@
+import argparse
+import json
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Placeholder for previousResults: replaced by the history the session has built so far
+HISTORY_PLACEHOLDER = "@history"
+
+def load_traffic(path: str) -> List[Dict]:
+    """
+    Load recorded traffic from a JSONL file.
+
+    Each line is an object with "path" (or "endpoint"), an optional "method"
+    (POST when a body is present, GET otherwise) and an optional "body" (or
+    "json"). An /api/extend body whose previousResults is "@history" is sent
+    with every record its session has received so far, so the history grows
+    the way it does in the dashboard.
+
+    Args:
+        path: Path of the JSONL file
+
+    Returns:
+        List of request specifications
+    """
+    traffic = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            endpoint = entry.get("path", entry.get("endpoint"))
+            if endpoint is None:
+                raise ValueError(f"{path}:{line_number}: request has no path")
+            body = entry.get("body", entry.get("json"))
+            traffic.append({
+                "path": endpoint,
+                "method": entry.get("method", "POST" if body is not None else "GET").upper(),
+                "body": body
+            })
+    if not traffic:
+        raise ValueError(f"{path} contains no requests")
+    return traffic
+
+class InProcessTarget:
+    """Sends requests to an app made by create_app through its test client"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        Create the app under test.
+
+        Args:
+            config: Overrides of the app's configuration, e.g.
+                {"COALESCE_SIMULATIONS": False}; results are cached in a fresh
+                temporary directory unless RESULT_CACHE_DIR is given
+        """
+        from app import create_app
+        self.app = create_app({"RESULT_CACHE_DIR": tempfile.mkdtemp(prefix="loadtest_cache_"), **(config or {})})
+        self.local = threading.local()
+
+    def send(self, method: str, path: str, body: Optional[bytes]):
+        if not hasattr(self.local, "client"):
+            self.local.client = self.app.test_client()
+        response = self.local.client.open(path, method=method, data=body,
+                                          content_type="application/json" if body is not None else None)
+        return response.status_code, response.get_data()
+
+class HttpTarget:
+    """Sends requests to a running server"""
+
+    def __init__(self, base_url: str, timeout: float = 60.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def send(self, method: str, path: str, body: Optional[bytes]):
+        request = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                         headers={"Content-Type": "application/json"} if body is not None else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+def run_load_test(traffic: List[Dict],
+                  target,
+                  requests: int,
+                  concurrency: int = 8,
+                  rate: Optional[float] = None,
+                  seed: int = 0) -> Dict:
+    """
+    Replay traffic against a target and measure it.
+
+    Requests are split into concurrency sessions, each replaying the whole
+    file in order. Without a rate the test is closed-loop: each session sends
+    its next request as soon as the previous one returns. With a rate the test
+    is open-loop: requests arrive as a Poisson process at that rate and are
+    dealt to the sessions in turn. A session still sends its requests one at
+    a time, so an extension never overtakes the simulation it extends, and
+    latency is measured from the scheduled arrival, so time spent queued
+    behind the session's earlier requests counts against the server.
+
+    Args:
+        traffic: Request specifications from load_traffic, replayed in a cycle
+        target: InProcessTarget or HttpTarget
+        requests: Total number of requests to send
+        concurrency: Number of concurrent sessions
+        rate: Arrival rate in requests per second (None for closed-loop)
+        seed: Random seed of the arrival process
+
+    Returns:
+        Machine-readable report with per-endpoint throughput, latency
+        percentiles, payload sizes and errors
+    """
+    samples = []
+    samples_lock = threading.Lock()
+    histories = {}
+
+    def send(index: int, scheduled: float):
+        # Request i belongs to session i % concurrency, which walks through the file in order
+        session, position = index % concurrency, index // concurrency
+        spec = traffic[position % len(traffic)]
+        history = histories.setdefault(session, [])
+
+        body = spec["body"]
+        if body is not None and body.get("previousResults") == HISTORY_PLACEHOLDER:
+            body = {**body, "previousResults": history}
+        payload = None if body is None else json.dumps(body).encode()
+
+        start = scheduled if scheduled is not None else time.perf_counter()
+        try:
+            status, content = target.send(spec["method"], spec["path"], payload)
+            error = None if status < 400 else f"HTTP {status}"
+        except Exception as e:
+            status, content, error = None, b"", type(e).__name__
+        latency = time.perf_counter() - start
+
+        # Keep the records returned so far as the history of later extensions
+        if error is None and spec["path"] in ("/api/simulate", "/api/extend"):
+            records = json.loads(content)
+            if spec["path"] == "/api/simulate":
+                history[:] = records
+            else:
+                history.extend(records)
+
+        with samples_lock:
+            samples.append((spec["path"], latency, len(payload or b""), len(content), error))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if rate is None:
+            # Closed loop: every worker loops over its share of the requests
+            def worker(offset: int):
+                for index in range(offset, requests, concurrency):
+                    send(index, None)
+            for future in [pool.submit(worker, offset) for offset in range(concurrency)]:
+                future.result()
+        else:
+            # Open loop: one queue per session, drained in order by that session's worker
+            queues = [queue.Queue() for _ in range(concurrency)]
+            def worker(session: int):
+                for index, arrival in iter(queues[session].get, None):
+                    send(index, arrival)
+            futures = [pool.submit(worker, session) for session in range(concurrency)]
+
+            rng = random.Random(seed)
+            arrival = time.perf_counter()
+            for index in range(requests):
+                arrival += rng.expovariate(rate)
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                queues[index % concurrency].put((index, arrival))
+            for session_queue in queues:
+                session_queue.put(None)
+            for future in futures:
+                future.result()
+    elapsed = time.perf_counter() - start
+
+    report = summarize(samples, elapsed, concurrency, rate)
+    # How many simulations identical concurrent requests shared (counted since the server started)
+    status, content = target.send("GET", "/api/metrics/coalescing", None)
+    report["coalescing"] = json.loads(content) if status == 200 else None
+    return report
+
+def summarize(samples: List, elapsed: float, concurrency: int, rate: Optional[float]) -> Dict:
+    """Aggregate raw samples into the per-endpoint report"""
+    def describe(rows):
+        latencies = np.array([row[1] for row in rows]) * 1000
+        errors = [row[4] for row in rows if row[4] is not None]
+        return {
+            "requests": len(rows),
+            "throughput_rps": len(rows) / elapsed if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "mean": float(latencies.mean()),
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "p99": float(np.percentile(latencies, 99)),
+                "max": float(latencies.max())
+            },
+            "request_bytes_mean": float(np.mean([row[2] for row in rows])),
+            "response_bytes_mean": float(np.mean([row[3] for row in rows])),
+            "response_bytes_max": int(max(row[3] for row in rows)),
+            "errors": len(errors),
+            "error_types": {error: errors.count(error) for error in sorted(set(errors))}
+        }
+
+    endpoints = sorted(set(row[0] for row in samples))
+    return {
+        "elapsed_s": elapsed,
+        "concurrency": concurrency,
+        "arrival_rate_rps": rate,
+        "total": describe(samples) if samples else None,
+        "endpoints": {endpoint: describe([row for row in samples if row[0] == endpoint])
+                      for endpoint in endpoints}
+    }
+
+def main():
+    """Command line entry point for replaying recorded API traffic"""
+    parser = argparse.ArgumentParser(
+        description="Replay recorded API traffic against the Flask app",
+        epilog="coalescing_traffic.jsonl sends every session the same /api/simulate requests at once; "
+               "run it with and without --app-config '{\"COALESCE_SIMULATIONS\": false}' to measure "
+               "request coalescing")
+    parser.add_argument("traffic", help="JSONL file of recorded requests")
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process test client)")
+    parser.add_argument("--requests", type=int, default=None,
+                        help="Requests to send (default: one pass over the file per session)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent sessions")
+    parser.add_argument("--rate", type=float, default=None, help="Open-loop arrival rate in requests/s")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the arrival process")
+    parser.add_argument("--app-config", type=json.loads, default=None,
+                        help="JSON config overrides of the in-process app, e.g. '{\"COALESCE_SIMULATIONS\": false}'")
+    parser.add_argument("--report", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    traffic = load_traffic(args.traffic)
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        import logging
+        logging.disable(logging.CRITICAL)
+        target = InProcessTarget(args.app_config)
+
+    requests = args.requests or len(traffic) * args.concurrency
+    report = run_load_test(traffic, target, requests, args.concurrency, args.rate, args.seed)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
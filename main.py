@@ -1,7 +1,8 @@
+import sys
 import pandas as pd
 from transition_matrices import SCENARIOS, STATE_ABBR
 from simulation import CustomerMarkovModel
-from visualization import plot_results
+from result_cache import ResultCache
 
 def display_banner():
     """Display a banner for the program"""
@@ -58,7 +59,7 @@ def main():
         scenario=scenario
     )
     
-    results = model.simulate(months=months)
+    results = ResultCache().simulate(model, months=months)
     
     # Display summary results
     print("\nSUMMARY RESULTS:")
@@ -106,9 +107,14 @@ def main():
     except Exception as e:
         print(f"\nCould not save results to CSV: {e}")
     
-    # Open visualization with interactive features
+    # Open visualization with interactive features (imported here so batch runs never load matplotlib)
+    from visualization import plot_results
     print("\nOpening interactive visualization with analysis...")
-    plot_results(results, scenario)
+    plot_results(results, scenario, new_customers_per_month)
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        import batch
+        batch.main(sys.argv[2:])
+    else:
+        main()
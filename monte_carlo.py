@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from typing import Iterator, List, Optional, Tuple
+
+from transition_matrices import SCENARIOS, STATES, NEW_CUSTOMER_DISTRIBUTION, get_transition_matrix
+from revenue_model import revenue_vector
+from simulation import CustomerMarkovModel
+
+# Upper bound on scenarios x replications x customers handled per chunk
+CHUNK_ELEMENTS = 1 << 22
+
+def inverse_cdf(cumulative: np.ndarray, rows, uniforms: np.ndarray) -> np.ndarray:
+    """
+    Map uniforms to states through cumulative probabilities.
+
+    The state is the first one whose cumulative probability exceeds the
+    uniform, i.e. the number of cumulative probabilities at or below it.
+    The mapping is monotone in the uniform, which is what makes common and
+    antithetic random numbers effective.
+
+    Args:
+        cumulative: Table of cumulative probability rows, shape (rows, 5)
+        rows: Row of the table to use for each uniform (array or scalar)
+        uniforms: Uniforms broadcastable against rows
+
+    Returns:
+        Array of state indices
+    """
+    states = np.zeros(np.broadcast_shapes(np.shape(rows), uniforms.shape), dtype=np.int8)
+    # The last cumulative probability is 1, so only the others need comparing
+    for j in range(cumulative.shape[-1] - 1):
+        states += uniforms >= np.take(cumulative[:, j], rows)
+    return states
+
+def simulate_customer_chunks(scenarios: Optional[List[str]] = None,
+                             months: int = 12,
+                             initial_customers: int = 10000,
+                             new_customers_per_month: int = 800,
+                             replications: int = 100,
+                             antithetic: bool = True,
+                             common_random_numbers: bool = True,
+                             seed: int = 0) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Simulate individual customers moving between segments.
+
+    Customers start in the same integer segment counts as
+    CustomerMarkovModel.simulate, and new_customers_per_month customers join
+    each month with segments drawn from NEW_CUSTOMER_DISTRIBUTION. Every
+    customer draws its next segment by inverse CDF on the cumulative row of
+    its current segment.
+
+    With common random numbers, every scenario uses the same uniform for the
+    same customer, month and replication, so scenario differences are not
+    drowned out by sampling noise. With antithetic variates the second half
+    of the replications uses 1 - u for the uniforms u of the first half;
+    replication i is paired with replication i + replications // 2, however
+    the run is chunked.
+
+    Args:
+        scenarios: Scenarios to simulate (defaults to all scenarios)
+        months: Number of months to simulate
+        initial_customers: Total number of customers at start
+        new_customers_per_month: Number of new customers added each month
+        replications: Number of simulated runs per scenario (even with antithetic)
+        antithetic: Pair every run with an antithetic run
+        common_random_numbers: Drive every scenario with the same uniforms
+            (otherwise each scenario gets independent streams)
+        seed: Random seed
+
+    Yields:
+        Tuples of (first replication, segment counts of consecutive
+        replications with shape (scenarios, chunk replications, months + 1, 5)).
+        With antithetic variates a chunk of pairs is yielded as its
+        replications in the first half followed by their mirrors in the second
+    """
+    scenarios = list(SCENARIOS.keys()) if scenarios is None else list(scenarios)
+    if antithetic and replications % 2:
+        raise ValueError("replications must be even with antithetic variates")
+
+    n_states = len(STATES)
+    # One table of cumulative rows for all scenarios: row k * 5 + i is state i of scenario k
+    cumulative = np.cumsum([get_transition_matrix(scenario) for scenario in scenarios], axis=-1)
+    cumulative[..., -1] = 1.0
+    cumulative = cumulative.reshape(-1, n_states)
+    arrival_cumulative = np.cumsum(NEW_CUSTOMER_DISTRIBUTION)[None]
+    arrival_cumulative[:, -1] = 1.0
+
+    initial_counts = CustomerMarkovModel(initial_customers=initial_customers).initial_counts()
+    initial_states = np.repeat(np.arange(n_states, dtype=np.int8), initial_counts)
+    customers = len(initial_states) + months * new_customers_per_month
+
+    # Chunks hold whole antithetic pairs: the first half of a chunk is mirrored by the second
+    pair = 2 if antithetic else 1
+    chunk = max(pair, CHUNK_ELEMENTS // (len(scenarios) * customers) // pair * pair)
+    row_offset = (np.arange(len(scenarios)) * n_states)[:, None, None]
+    # Streams are drawn for the first half of the run; the second half mirrors it
+    drawn = replications // pair
+    streams = np.random.SeedSequence(seed).spawn((drawn + chunk // pair - 1) // (chunk // pair))
+
+    for start, stream in zip(range(0, drawn, chunk // pair), streams):
+        half = min(chunk // pair, drawn - start)
+        size = half * pair
+        counts = np.zeros((len(scenarios), size, months + 1, n_states), dtype=np.int32)
+        counts[:, :, 0] = initial_counts
+        # One set of streams shared by every scenario, or one per scenario
+        stream_shape = (half, customers) if common_random_numbers else (len(scenarios), half, customers)
+        rng = np.random.default_rng(stream)
+
+        states = np.empty((len(scenarios), size, customers), dtype=np.int8)
+        states[..., :len(initial_states)] = initial_states
+        active = len(initial_states)
+        for month in range(1, months + 1):
+            uniforms = rng.random(stream_shape)
+            if antithetic:
+                uniforms = np.concatenate([uniforms, 1.0 - uniforms], axis=-2)
+
+            rows = row_offset + states[..., :active]
+            states[..., :active] = inverse_cdf(cumulative, rows, uniforms[..., :active])
+
+            # Arrivals join in their drawn segment without transitioning this month
+            arrivals = slice(active, active + new_customers_per_month)
+            states[..., arrivals] = inverse_cdf(arrival_cumulative, 0, uniforms[..., arrivals])
+            active += new_customers_per_month
+
+            for state in range(n_states):
+                counts[:, :, month, state] = np.count_nonzero(states[..., :active] == state, axis=-1)
+
+        yield start, counts[:, :half]
+        if antithetic:
+            yield drawn + start, counts[:, half:]
+
+def simulate_customers(scenarios: Optional[List[str]] = None,
+                       months: int = 12,
+                       initial_customers: int = 10000,
+                       new_customers_per_month: int = 800,
+                       replications: int = 100,
+                       antithetic: bool = True,
+                       common_random_numbers: bool = True,
+                       seed: int = 0) -> np.ndarray:
+    """
+    Simulate individual customers moving between segments, keeping every run in memory.
+
+    See simulate_customer_chunks for the model and the arguments.
+
+    Returns:
+        Array of segment counts with shape (scenarios, replications, months + 1, 5)
+    """
+    scenarios = list(SCENARIOS.keys()) if scenarios is None else list(scenarios)
+    counts = np.zeros((len(scenarios), replications, months + 1, len(STATES)), dtype=np.int32)
+    for start, chunk in simulate_customer_chunks(scenarios, months, initial_customers, new_customers_per_month,
+                                                 replications, antithetic, common_random_numbers, seed):
+        counts[:, start:start + chunk.shape[1]] = chunk
+    return counts
+
+def compare_scenarios(scenarios: Optional[List[str]] = None,
+                      baseline: str = "Default",
+                      months: int = 12,
+                      initial_customers: int = 10000,
+                      new_customers_per_month: int = 800,
+                      replications: int = 200,
+                      antithetic: bool = True,
+                      common_random_numbers: bool = True,
+                      confidence: float = 0.95,
+                      precision: Optional[float] = None,
+                      seed: int = 0) -> pd.DataFrame:
+    """
+    Estimate each scenario's revenue difference to a baseline from paired runs.
+
+    The compared quantity is the total revenue of months 1 to months. The
+    variance the same number of independent runs would have had is estimated
+    from the per-scenario variances, giving the variance reduction factor of
+    common random numbers and antithetic variates.
+
+    Args:
+        scenarios: Scenarios to compare (defaults to all scenarios)
+        baseline: Scenario the others are compared against
+        months: Number of months to simulate
+        initial_customers: Total number of customers at start
+        new_customers_per_month: Number of new customers added each month
+        replications: Number of simulated runs per scenario
+        antithetic: Pair every run with an antithetic run
+        common_random_numbers: Drive every scenario with the same uniforms
+        confidence: Confidence level of the intervals
+        precision: Confidence interval half-width the replication counts are
+            computed for (defaults to 0.1% of the baseline's total revenue)
+        seed: Random seed
+
+    Returns:
+        DataFrame with one row per compared scenario holding the mean
+        difference, its standard error and confidence interval, the
+        standard error of independent sampling, the variance reduction
+        factor and the replications needed for the requested precision
+        with and without variance reduction
+    """
+    scenarios = list(SCENARIOS.keys()) if scenarios is None else list(scenarios)
+    if baseline not in scenarios:
+        scenarios.insert(0, baseline)
+
+    counts = simulate_customers(scenarios, months, initial_customers, new_customers_per_month,
+                                replications, antithetic, common_random_numbers, seed)
+    totals = (counts[:, :, 1:] @ revenue_vector(STATES)).sum(axis=-1)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    base = scenarios.index(baseline)
+    if precision is None:
+        precision = 0.001 * totals[base].mean()
+
+    rows = []
+    for k, scenario in enumerate(scenarios):
+        if k == base:
+            continue
+        difference = totals[k] - totals[base]
+        if antithetic:
+            # Antithetic pairs are the independent units
+            half = replications // 2
+            units = (difference[:half] + difference[half:]) / 2
+        else:
+            units = difference
+        mean = units.mean()
+        variance = units.var(ddof=1) / len(units)
+        independent_variance = (totals[k].var(ddof=1) + totals[base].var(ddof=1)) / replications
+
+        rows.append({
+            'Scenario': scenario,
+            'Baseline': baseline,
+            'Mean Revenue': float(totals[k].mean()),
+            'Mean Difference': float(mean),
+            'Std Error': float(np.sqrt(variance)),
+            'Lower': float(mean - z * np.sqrt(variance)),
+            'Upper': float(mean + z * np.sqrt(variance)),
+            'Independent Std Error': float(np.sqrt(independent_variance)),
+            'Variance Reduction': float(independent_variance / variance) if variance > 0 else float('inf'),
+            # Runs needed so that z * std error <= precision
+            'Replications Needed': int(np.ceil(replications * variance * (z / precision) ** 2)),
+            'Independent Replications Needed': int(np.ceil(replications * independent_variance * (z / precision) ** 2))
+        })
+
+    return pd.DataFrame(rows)
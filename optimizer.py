@@ -0,0 +1,216 @@
+import numpy as np
+from typing import Dict, List, Optional
+
+from transition_matrices import STATES, SCENARIOS, get_transition_matrix
+from revenue_model import revenue_vector
+from simulation import CustomerMarkovModel, forecast_batch
+
+OBJECTIVES = ["revenue", "clv"]
+
+def blend_matrices(weights: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """
+    Build convex blends of transition matrices (the marketing mix).
+
+    A convex combination of row-stochastic matrices is itself row-stochastic,
+    so every blend is a valid transition matrix.
+
+    Args:
+        weights: Blend weights, shape (batch, n_scenarios), rows summing to 1
+        matrices: Scenario transition matrices, shape (n_scenarios, 5, 5)
+
+    Returns:
+        Blended transition matrices, shape (batch, 5, 5)
+    """
+    return np.einsum('bk,kij->bij', weights, matrices)
+
+def evaluate_candidates(initial_counts: np.ndarray,
+                        matrices: np.ndarray,
+                        new_customers: np.ndarray,
+                        weights: np.ndarray,
+                        months: int,
+                        cost_per_customer: float,
+                        scenario_costs: np.ndarray,
+                        objective: str = "revenue",
+                        discount_rate: float = 0.01) -> Dict[str, np.ndarray]:
+    """
+    Score a batch of (acquisition, marketing mix) candidates in one forecast.
+
+    Args:
+        initial_counts: Customer counts at month 0
+        matrices: Scenario transition matrices, shape (n_scenarios, 5, 5)
+        new_customers: New customers per month for each candidate, shape (batch,)
+        weights: Blend weights for each candidate, shape (batch, n_scenarios)
+        months: Planning horizon in months
+        cost_per_customer: Acquisition cost of one new customer
+        scenario_costs: Monthly cost of fully running each scenario
+        objective: "revenue" for total horizon revenue, "clv" for discounted
+            revenue net of spend
+        discount_rate: Monthly discount rate used by the "clv" objective
+
+    Returns:
+        Dictionary with the objective value, total spend and horizon revenue
+        of every candidate
+    """
+    paths = forecast_batch(initial_counts, blend_matrices(weights, matrices), new_customers, months)
+    monthly_revenue = paths[:, 1:, :] @ revenue_vector(STATES)
+    monthly_spend = new_customers * cost_per_customer + weights @ scenario_costs
+
+    revenue = monthly_revenue.sum(axis=1)
+    if objective == "revenue":
+        value = revenue
+    else:
+        discount = (1 + discount_rate) ** -np.arange(1, months + 1)
+        value = (monthly_revenue - monthly_spend[:, None]) @ discount
+
+    return {"value": value, "spend": monthly_spend * months, "revenue": revenue}
+
+def pareto_frontier(spend: np.ndarray, value: np.ndarray, max_points: int = 100) -> np.ndarray:
+    """
+    Find the candidates that no other candidate beats on both spend and value.
+
+    Args:
+        spend: Total spend of each candidate
+        value: Objective value of each candidate
+        max_points: Upper bound on the number of frontier points returned
+
+    Returns:
+        Indices of the frontier candidates, ordered by increasing spend
+    """
+    order = np.lexsort((-value, spend))
+    best_so_far = np.maximum.accumulate(value[order])
+    is_frontier = np.ones(len(order), dtype=bool)
+    is_frontier[1:] = value[order][1:] > best_so_far[:-1]
+    frontier = order[is_frontier]
+
+    if len(frontier) > max_points:
+        frontier = frontier[np.linspace(0, len(frontier) - 1, max_points).astype(int)]
+    return frontier
+
+def optimize_campaign(initial_customers: int = 10000,
+                      months: int = 12,
+                      budget: float = 1_000_000.0,
+                      cost_per_customer: float = 100.0,
+                      scenarios: Optional[List[str]] = None,
+                      scenario_costs: Optional[Dict[str, float]] = None,
+                      objective: str = "revenue",
+                      discount_rate: float = 0.01,
+                      candidates: int = 4096,
+                      iterations: int = 8,
+                      elite_fraction: float = 0.1,
+                      seed: Optional[int] = None) -> Dict:
+    """
+    Search acquisition volume and marketing mix for the best plan within budget.
+
+    Uses the cross-entropy method: each iteration samples a batch of
+    candidates, scores them all with one batched forecast, and refits the
+    sampling distribution to the best (elite) candidates. The acquisition
+    volume is sampled as a fraction of the budget the marketing mix leaves
+    over, so acquisition never pushes a candidate past the budget.
+
+    Args:
+        initial_customers: Total number of customers at start
+        months: Planning horizon in months
+        budget: Total budget over the horizon
+        cost_per_customer: Acquisition cost of one new customer
+        scenarios: Scenarios to blend (defaults to all scenarios)
+        scenario_costs: Monthly cost of fully running each scenario (default 0)
+        objective: "revenue" or "clv"
+        discount_rate: Monthly discount rate used by the "clv" objective
+        candidates: Number of candidates evaluated per iteration
+        iterations: Number of cross-entropy iterations
+        elite_fraction: Share of candidates used to refit the distribution
+        seed: Random seed for reproducible searches
+
+    Returns:
+        Dictionary with the best plan, the spend/value Pareto frontier and
+        search statistics
+    """
+    scenarios = list(SCENARIOS.keys()) if scenarios is None else list(scenarios)
+    scenario_costs = scenario_costs or {}
+
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective: {objective}. Available objectives: {OBJECTIVES}")
+    if not scenarios:
+        raise ValueError("At least one scenario is required")
+    if months <= 0 or candidates <= 0 or iterations <= 0:
+        raise ValueError("months, candidates and iterations must be positive")
+    if budget < 0 or cost_per_customer <= 0:
+        raise ValueError("budget must be non-negative and cost_per_customer positive")
+
+    matrices = np.stack([get_transition_matrix(scenario) for scenario in scenarios])
+    costs = np.array([float(scenario_costs.get(scenario, 0.0)) for scenario in scenarios])
+    initial_counts = CustomerMarkovModel(initial_customers=initial_customers, scenario=scenarios[0]).initial_counts()
+    monthly_budget = budget / months
+
+    if costs.min() > monthly_budget:
+        raise ValueError("Budget does not cover the cheapest scenario")
+
+    rng = np.random.default_rng(seed)
+    n_elite = max(2, int(candidates * elite_fraction))
+    alpha = np.ones(len(scenarios))
+    fraction_mean, fraction_std = 0.5, 0.5
+
+    all_new_customers, all_weights, all_value, all_spend = [], [], [], []
+    for iteration in range(iterations):
+        weights = rng.dirichlet(alpha, size=candidates)
+        if iteration == 0:
+            fraction = rng.uniform(0.0, 1.0, size=candidates)
+        else:
+            fraction = np.clip(rng.normal(fraction_mean, fraction_std, size=candidates), 0.0, 1.0)
+
+        # Whatever the marketing mix leaves of the budget funds acquisition
+        headroom = monthly_budget - weights @ costs
+        new_customers = np.maximum(headroom, 0.0) / cost_per_customer * fraction
+
+        scores = evaluate_candidates(initial_counts, matrices, new_customers, weights, months,
+                                     cost_per_customer, costs, objective, discount_rate)
+        value = np.where(headroom >= 0, scores["value"], -np.inf)
+
+        all_new_customers.append(new_customers)
+        all_weights.append(weights)
+        all_value.append(value)
+        all_spend.append(scores["spend"])
+
+        # Refit the sampling distribution to the elite candidates
+        elite = np.argsort(value)[-n_elite:]
+        elite_weights = weights[elite]
+        concentration = len(scenarios) * 10.0 * (1 + iteration)
+        alpha = np.maximum(elite_weights.mean(axis=0) * concentration, 1e-3)
+        fraction_mean = fraction[elite].mean()
+        fraction_std = max(fraction[elite].std(), 1e-3)
+
+    new_customers = np.concatenate(all_new_customers)
+    weights = np.concatenate(all_weights)
+    value = np.concatenate(all_value)
+    spend = np.concatenate(all_spend)
+
+    # Whole customers only: round the winner down so it stays within budget
+    best = int(np.argmax(value))
+    best_new_customers = np.floor(new_customers[best:best + 1])
+    best_scores = evaluate_candidates(initial_counts, matrices, best_new_customers, weights[best:best + 1],
+                                      months, cost_per_customer, costs, objective, discount_rate)
+
+    feasible = np.isfinite(value)
+    frontier = np.flatnonzero(feasible)[pareto_frontier(spend[feasible], value[feasible])]
+
+    return {
+        "objective": objective,
+        "best": {
+            "new_customers_per_month": int(best_new_customers[0]),
+            "weights": dict(zip(scenarios, weights[best].tolist())),
+            "value": float(best_scores["value"][0]),
+            "revenue": float(best_scores["revenue"][0]),
+            "spend": float(best_scores["spend"][0]),
+        },
+        "frontier": [
+            {
+                "new_customers_per_month": float(new_customers[i]),
+                "weights": dict(zip(scenarios, weights[i].tolist())),
+                "value": float(value[i]),
+                "spend": float(spend[i]),
+            }
+            for i in frontier
+        ],
+        "evaluated": int(len(value)),
+        "iterations": iterations,
+    }
@@ -0,0 +1,447 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from transition_matrices import SCENARIOS, STATES, get_transition_matrix
+from revenue_model import revenue_vector
+import monte_carlo
+
+# Directory of the stored runs; override with the CUSTOMER_PATH_DIR environment variable
+DEFAULT_PATH_DIR = os.environ.get("CUSTOMER_PATH_DIR", ".path_store")
+
+# Bump when the stored layout changes
+STORE_FORMAT = 2
+
+# Storage type of the path counts
+PATH_DTYPE = np.int32
+
+# Replications read at once by the queries
+DEFAULT_BLOCK_ROWS = 4096
+
+# Histogram bins per month of the quantile search
+QUANTILE_BINS = 4096
+
+# Per-path quantities the queries can be asked about
+METRICS = ["revenue", "total"] + STATES
+
+def run_id(params: Dict) -> str:
+    """
+    Build the content address of a run.
+
+    The same parameters, scenario matrices and simulation code always give
+    the same paths, so a run is stored once and reused.
+
+    Args:
+        params: Simulation parameters (JSON serializable)
+
+    Returns:
+        Hex identifier of the run
+    """
+    digest = hashlib.sha256(str(STORE_FORMAT).encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    for scenario in params["scenarios"]:
+        digest.update(np.ascontiguousarray(get_transition_matrix(scenario), dtype=np.float64).tobytes())
+    with open(monte_carlo.__file__, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()[:24]
+
+def metric_values(block: np.ndarray, metric: str) -> np.ndarray:
+    """
+    Reduce a block of paths to one value per path and month.
+
+    Args:
+        block: Counts with shape (paths, months + 1, 5)
+        metric: "revenue", "total" or a segment name
+
+    Returns:
+        Array of shape (paths, months + 1)
+    """
+    if metric == "revenue":
+        return block @ revenue_vector(STATES)
+    if metric == "total":
+        return block.sum(axis=-1, dtype=np.float64)
+    if metric in STATES:
+        return block[..., STATES.index(metric)].astype(np.float64)
+    raise ValueError(f"Unknown metric: {metric}. Available metrics: {METRICS}")
+
+class PathRun:
+    """
+    A stored run: one memory-mapped (replication x month x state) count array per scenario.
+
+    Queries read the arrays in blocks of replications, so their memory use
+    does not grow with the number of replications.
+    """
+
+    def __init__(self, directory: str, manifest: Dict):
+        """
+        Open a stored run.
+
+        Args:
+            directory: Directory of the run
+            manifest: The run's manifest
+        """
+        self.directory = directory
+        self.manifest = manifest
+        self.id = manifest["id"]
+        self.shape = tuple(manifest["shape"])
+        self.scenarios = manifest["params"]["scenarios"]
+
+    def counts(self, scenario: str) -> np.memmap:
+        """Map a scenario's counts read-only, shape (replications, months + 1, 5)"""
+        if scenario not in self.scenarios:
+            raise ValueError(f"Scenario {scenario} is not in run {self.id}. Available scenarios: {self.scenarios}")
+        path = os.path.join(self.directory, self.manifest["files"][scenario])
+        return np.memmap(path, dtype=self.manifest["dtype"], mode="r", shape=self.shape)
+
+    def blocks(self, scenario: str, metric: str, block_rows: int = DEFAULT_BLOCK_ROWS) -> Iterator[np.ndarray]:
+        """Yield a metric for consecutive blocks of replications, each with shape (rows, months + 1)"""
+        counts = self.counts(scenario)
+        for start in range(0, self.shape[0], block_rows):
+            yield metric_values(np.asarray(counts[start:start + block_rows]), metric)
+
+    def quantiles(self, scenario: str, quantiles: Sequence[float], metric: str = "revenue",
+                  block_rows: int = DEFAULT_BLOCK_ROWS) -> Dict:
+        """
+        Exact per-month quantiles (numpy's linear interpolation) from three streaming passes.
+
+        The first pass finds every month's range and mean, the second
+        histograms each month into QUANTILE_BINS bins to find the bins
+        holding the order statistics the quantiles interpolate between, and
+        the third collects only the values in those bins, so memory stays at
+        one block plus the values of a few bins.
+
+        Args:
+            scenario: Scenario of the run
+            quantiles: Quantiles between 0 and 1
+            metric: "revenue", "total" or a segment name
+            block_rows: Replications read at once
+
+        Returns:
+            Dictionary with the months, the quantiles, one list of values per
+            quantile (over months) and the mean of every month
+        """
+        quantiles = np.asarray(quantiles, dtype=float)
+        if quantiles.ndim != 1 or np.any((quantiles < 0) | (quantiles > 1)):
+            raise ValueError("Quantiles must be a list of values between 0 and 1")
+        replications, months = self.shape[0], self.shape[1]
+
+        # Pass 1: range and mean of every month
+        low = np.full(months, np.inf)
+        high = np.full(months, -np.inf)
+        total = np.zeros(months)
+        for values in self.blocks(scenario, metric, block_rows):
+            low = np.minimum(low, values.min(axis=0))
+            high = np.maximum(high, values.max(axis=0))
+            total += values.sum(axis=0)
+
+        width = (high - low) / QUANTILE_BINS
+        scale = np.divide(1.0, width, out=np.zeros(months), where=width > 0)
+        def bin_of(values):
+            return np.minimum(((values - low) * scale).astype(np.int64), QUANTILE_BINS - 1)
+
+        # Pass 2: histogram of every month
+        offsets = np.arange(months) * QUANTILE_BINS
+        histogram = np.zeros(months * QUANTILE_BINS, dtype=np.int64)
+        for values in self.blocks(scenario, metric, block_rows):
+            histogram += np.bincount((bin_of(values) + offsets).ravel(), minlength=histogram.size)
+        cumulative = np.cumsum(histogram.reshape(months, QUANTILE_BINS), axis=1)
+
+        # Order statistics needed: floor and ceil of (replications - 1) * q
+        position = (replications - 1) * quantiles
+        ranks = np.unique(np.concatenate([np.floor(position), np.ceil(position)]).astype(np.int64))
+        # Bin of every (month, rank) and the number of values in earlier bins
+        rank_bins = np.stack([np.searchsorted(cumulative[m], ranks, side="right") for m in range(months)])
+        below = np.take_along_axis(np.pad(cumulative, ((0, 0), (1, 0))), rank_bins, axis=1)
+
+        # Pass 3: collect the values of the needed bins
+        needed = np.zeros((months, QUANTILE_BINS), dtype=bool)
+        np.put_along_axis(needed, rank_bins, True, axis=1)
+        collected = [([], []) for _ in range(months)]
+        for values in self.blocks(scenario, metric, block_rows):
+            bins = bin_of(values)
+            keep = np.take_along_axis(needed, bins.T, axis=1).T
+            for m in np.flatnonzero(keep.any(axis=0)):
+                collected[m][0].append(values[keep[:, m], m])
+                collected[m][1].append(bins[keep[:, m], m])
+
+        order = np.zeros((months, len(ranks)))
+        for m in range(months):
+            candidates, bins = np.concatenate(collected[m][0]), np.concatenate(collected[m][1])
+            for r, rank in enumerate(ranks):
+                in_bin = np.sort(candidates[bins == rank_bins[m, r]])
+                order[m, r] = in_bin[rank - below[m, r]]
+
+        lower = order[:, np.searchsorted(ranks, np.floor(position).astype(np.int64))]
+        upper = order[:, np.searchsorted(ranks, np.ceil(position).astype(np.int64))]
+        result = lower + (position - np.floor(position)) * (upper - lower)
+
+        return {
+            "run": self.id,
+            "scenario": scenario,
+            "metric": metric,
+            "replications": replications,
+            "months": list(range(months)),
+            "quantiles": quantiles.tolist(),
+            "values": result.T.tolist(),
+            "mean": (total / replications).tolist()
+        }
+
+    def exceedance(self, scenario: str, threshold: float, metric: str = "revenue", below: bool = False,
+                   block_rows: int = DEFAULT_BLOCK_ROWS) -> Dict:
+        """
+        Probability that a metric exceeds (or falls below) a threshold, in one streaming pass.
+
+        Args:
+            scenario: Scenario of the run
+            threshold: Threshold of the metric
+            metric: "revenue", "total" or a segment name
+            below: Count paths below the threshold instead of above it
+            block_rows: Replications read at once
+
+        Returns:
+            Dictionary with the probability of every month and the
+            probability of crossing the threshold in any of months 1..months
+        """
+        replications, months = self.shape[0], self.shape[1]
+        hits = np.zeros(months, dtype=np.int64)
+        ever = 0
+        for values in self.blocks(scenario, metric, block_rows):
+            crossed = values < threshold if below else values > threshold
+            hits += crossed.sum(axis=0)
+            ever += int(crossed[:, 1:].any(axis=1).sum())
+
+        return {
+            "run": self.id,
+            "scenario": scenario,
+            "metric": metric,
+            "threshold": float(threshold),
+            "below": below,
+            "replications": replications,
+            "months": list(range(months)),
+            "probability": (hits / replications).tolist(),
+            "any_month": ever / replications
+        }
+
+    def paths(self, scenario: str, replications: Sequence[int]) -> np.ndarray:
+        """
+        Read a subset of paths.
+
+        Args:
+            scenario: Scenario of the run
+            replications: Indices of the replications to read
+
+        Returns:
+            Counts with shape (len(replications), months + 1, 5)
+        """
+        indices = np.asarray(replications, dtype=np.int64)
+        if np.any((indices < 0) | (indices >= self.shape[0])):
+            raise ValueError(f"Replications must be between 0 and {self.shape[0] - 1}")
+        return np.asarray(self.counts(scenario)[indices])
+
+class PathStore:
+    """
+    A directory of simulated Monte Carlo runs.
+
+    Each run lives in its own directory named after its content address,
+    with one raw count file per scenario and a manifest of the parameters,
+    seed and layout. Runs are written to a temporary directory that is
+    renamed into place once complete, so readers never see partial runs.
+    """
+
+    def __init__(self, directory: str = DEFAULT_PATH_DIR):
+        """
+        Initialize the store.
+
+        Args:
+            directory: Directory holding the runs (created with the first run)
+        """
+        self.directory = directory
+
+    def create(self,
+               scenarios: Optional[List[str]] = None,
+               months: int = 12,
+               initial_customers: int = 10000,
+               new_customers_per_month: int = 800,
+               replications: int = 1000,
+               antithetic: bool = True,
+               common_random_numbers: bool = True,
+               seed: int = 0) -> PathRun:
+        """
+        Simulate a run with monte_carlo.simulate_customer_chunks and store it chunk by chunk.
+
+        Only one chunk of replications is held in memory; the rest goes
+        straight to the memory-mapped files. A run with the same parameters
+        already in the store is returned without simulating.
+
+        Args:
+            See monte_carlo.simulate_customers
+
+        Returns:
+            The stored run
+        """
+        scenarios = list(SCENARIOS.keys()) if scenarios is None else list(scenarios)
+        unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+        if unknown:
+            raise ValueError(f"Unknown scenario: {unknown}. Available scenarios: {list(SCENARIOS.keys())}")
+
+        params = {
+            "scenarios": scenarios,
+            "months": months,
+            "initial_customers": initial_customers,
+            "new_customers_per_month": new_customers_per_month,
+            "replications": replications,
+            "antithetic": antithetic,
+            "common_random_numbers": common_random_numbers,
+            "seed": seed,
+            # Chunking decides the random streams, so it is part of the run
+            "chunk_elements": monte_carlo.CHUNK_ELEMENTS
+        }
+        identifier = run_id(params)
+        existing = self.open(identifier)
+        if existing is not None:
+            return existing
+
+        shape = (replications, months + 1, len(STATES))
+        files = {scenario: f"{k}.dat" for k, scenario in enumerate(scenarios)}
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            arrays = [np.memmap(os.path.join(staging, files[scenario]), dtype=PATH_DTYPE, mode="w+", shape=shape)
+                      for scenario in scenarios]
+            started = time.time()
+            for start, chunk in monte_carlo.simulate_customer_chunks(scenarios, months, initial_customers,
+                                                                     new_customers_per_month, replications,
+                                                                     antithetic, common_random_numbers, seed):
+                for array, counts in zip(arrays, chunk):
+                    array[start:start + counts.shape[0]] = counts
+            for array in arrays:
+                array.flush()
+            del arrays
+
+            manifest = {
+                "id": identifier,
+                "format": STORE_FORMAT,
+                "params": params,
+                "shape": list(shape),
+                "dtype": np.dtype(PATH_DTYPE).name,
+                "layout": ["replication", "month", "state"],
+                "states": STATES,
+                "files": files,
+                "created": time.time(),
+                "seconds": time.time() - started
+            }
+            with open(os.path.join(staging, "manifest.json"), "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.rename(staging, os.path.join(self.directory, identifier))
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            # Another process may have stored the same run in the meantime
+            existing = self.open(identifier)
+            if existing is None:
+                raise
+            return existing
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        return self.open(identifier)
+
+    def open(self, identifier: str) -> Optional[PathRun]:
+        """
+        Open a stored run.
+
+        Args:
+            identifier: Identifier of the run
+
+        Returns:
+            The run, or None if the store has no such run
+        """
+        if not identifier or identifier.startswith(".") or os.sep in identifier or "/" in identifier:
+            return None
+        directory = os.path.join(self.directory, identifier)
+        try:
+            with open(os.path.join(directory, "manifest.json")) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            return None
+        if manifest.get("format") != STORE_FORMAT:
+            return None
+        return PathRun(directory, manifest)
+
+    def runs(self) -> List[Dict]:
+        """List the manifests of the stored runs, newest first"""
+        manifests = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []  # Nothing stored yet
+        for name in names:
+            run = self.open(name)
+            if run is not None:
+                manifests.append(run.manifest)
+        return sorted(manifests, key=lambda manifest: manifest["created"], reverse=True)
+
+    def delete(self, identifier: str) -> bool:
+        """Remove a run; returns whether it existed"""
+        run = self.open(identifier)
+        if run is None:
+            return False
+        shutil.rmtree(run.directory, ignore_errors=True)
+        return True
+
+def main():
+    """Command line entry point to create, list and query stored runs"""
+    parser = argparse.ArgumentParser(description="Manage stored Monte Carlo path runs")
+    parser.add_argument("--dir", default=DEFAULT_PATH_DIR, help="Store directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create = subparsers.add_parser("create", help="Simulate and store a run")
+    create.add_argument("--scenarios", nargs="+", help="Scenarios (defaults to all)")
+    create.add_argument("--months", type=int, default=12)
+    create.add_argument("--initial-customers", type=int, default=10000)
+    create.add_argument("--new-customers", type=int, default=800)
+    create.add_argument("--replications", type=int, default=1000)
+    create.add_argument("--no-antithetic", action="store_true")
+    create.add_argument("--seed", type=int, default=0)
+
+    subparsers.add_parser("list", help="List the stored runs")
+
+    query = subparsers.add_parser("quantiles", help="Print per-month quantiles of a run")
+    query.add_argument("run")
+    query.add_argument("--scenario", default="Default")
+    query.add_argument("--metric", default="revenue", choices=METRICS)
+    query.add_argument("--q", type=float, nargs="+", default=[0.05, 0.5, 0.95])
+
+    delete = subparsers.add_parser("delete", help="Remove a run")
+    delete.add_argument("run")
+    args = parser.parse_args()
+
+    store = PathStore(args.dir)
+    if args.command == "create":
+        run = store.create(args.scenarios, args.months, args.initial_customers, args.new_customers,
+                           args.replications, antithetic=not args.no_antithetic, seed=args.seed)
+        print(run.id)
+    elif args.command == "list":
+        for manifest in store.runs():
+            params = manifest["params"]
+            print(f"{manifest['id']}  {params['replications']} replications x {params['months']} months  "
+                  f"{', '.join(params['scenarios'])}")
+    elif args.command == "quantiles":
+        run = store.open(args.run)
+        if run is None:
+            parser.error(f"Unknown run: {args.run}")
+        result = run.quantiles(args.scenario, args.q, args.metric)
+        for month, *values in zip(result["months"], *result["values"]):
+            print(month, " ".join(f"{value:.2f}" for value in values))
+    else:
+        print("deleted" if store.delete(args.run) else "not found")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from transition_matrices import STATES, SCENARIOS, get_transition_matrix
+from revenue_model import revenue_vector
+from simulation import CustomerMarkovModel, forecast_batch
+
+# Observed transition counts per scenario (rows: from-state, columns: to-state).
+# Scenarios without observed counts use pseudo-counts, see transition_counts().
+TRANSITION_COUNTS: Dict[str, np.ndarray] = {}
+
+# Number of pseudo-observations per row when a scenario has no observed counts
+DEFAULT_CONCENTRATION = 200.0
+
+# Symmetric Dirichlet prior added to every cell (Jeffreys prior)
+PRIOR = 0.5
+
+def register_transition_counts(scenario: str, counts: np.ndarray) -> None:
+    """
+    Register observed transition counts for a scenario.
+
+    Args:
+        scenario: Which business scenario the counts were observed under
+        counts: Matrix of transition counts (rows: from-state, columns: to-state)
+    """
+    counts = np.asarray(counts, dtype=float)
+    if counts.shape != (len(STATES), len(STATES)) or np.any(counts < 0):
+        raise ValueError(f"Transition counts must be a non-negative {len(STATES)}x{len(STATES)} matrix")
+
+    TRANSITION_COUNTS[scenario] = counts
+    # Cached draws for this scenario are stale now
+    _posterior_draws.cache_clear()
+
+def forget_transition_counts(scenario: str) -> None:
+    """
+    Drop the observed transition counts of a scenario, if any, so its
+    posterior falls back to pseudo-counts from its current matrix.
+
+    Args:
+        scenario: Which business scenario to forget the counts of
+    """
+    TRANSITION_COUNTS.pop(scenario, None)
+    # Cached draws may come from the old counts or the old matrix
+    _posterior_draws.cache_clear()
+
+def transition_counts(scenario: str, concentration: float = DEFAULT_CONCENTRATION) -> np.ndarray:
+    """
+    Get the transition counts behind a scenario's matrix.
+
+    Args:
+        scenario: Which business scenario to use
+        concentration: Pseudo-observations per row if no counts were registered
+
+    Returns:
+        Matrix of (pseudo-)counts
+    """
+    if scenario in TRANSITION_COUNTS:
+        return TRANSITION_COUNTS[scenario]
+    return get_transition_matrix(scenario) * concentration
+
+def posterior_parameters(scenario: str, concentration: float = DEFAULT_CONCENTRATION) -> np.ndarray:
+    """
+    Get the Dirichlet parameters of every row of a scenario's matrix.
+
+    Args:
+        scenario: Which business scenario to use
+        concentration: Pseudo-observations per row if no counts were registered
+
+    Returns:
+        Matrix of Dirichlet parameters, one row per from-state
+    """
+    return transition_counts(scenario, concentration) + PRIOR
+
+@lru_cache(maxsize=32)
+def _posterior_draws(scenario: str, draws: int, seed: int, concentration: float) -> np.ndarray:
+    alpha = posterior_parameters(scenario, concentration)
+    rng = np.random.default_rng(seed)
+
+    # A Dirichlet draw is a row of independent gammas normalized to sum to 1
+    gammas = rng.standard_gamma(np.broadcast_to(alpha, (draws,) + alpha.shape))
+    matrices = gammas / gammas.sum(axis=-1, keepdims=True)
+
+    matrices.flags.writeable = False
+    return matrices
+
+def sample_transition_matrices(scenario: str,
+                               draws: int = 2000,
+                               seed: int = 0,
+                               concentration: float = DEFAULT_CONCENTRATION) -> np.ndarray:
+    """
+    Draw transition matrices from the posterior of a scenario.
+
+    All draws come from one vectorized gamma sample. Results are cached per
+    (scenario, draws, seed, concentration) and shared between callers, so the
+    returned array is read-only.
+
+    Args:
+        scenario: Which business scenario to use
+        draws: Number of posterior matrices to draw
+        seed: Random seed of the draws
+        concentration: Pseudo-observations per row if no counts were registered
+
+    Returns:
+        Array of transition matrices with shape (draws, 5, 5)
+    """
+    get_transition_matrix(scenario)  # Validate the scenario name
+    return _posterior_draws(scenario, int(draws), int(seed), float(concentration))
+
+def posterior_forecast(scenarios: Optional[List[str]] = None,
+                       months: int = 12,
+                       initial_customers: int = 10000,
+                       new_customers_per_month: int = 800,
+                       draws: int = 2000,
+                       credibility: float = 0.9,
+                       seed: int = 0,
+                       concentration: float = DEFAULT_CONCENTRATION) -> pd.DataFrame:
+    """
+    Forecast revenue and churn under every posterior draw of each scenario.
+
+    The draws of all scenarios are stacked and pushed through a single
+    batched forecast, then summarized by their quantiles.
+
+    Args:
+        scenarios: Scenarios to forecast (defaults to all scenarios)
+        months: Number of months to forecast
+        initial_customers: Total number of customers at start
+        new_customers_per_month: Number of new customers added each month
+        draws: Number of posterior matrices per scenario
+        credibility: Probability mass inside each credible interval
+        seed: Random seed of the draws
+        concentration: Pseudo-observations per row if no counts were registered
+
+    Returns:
+        DataFrame with one row per scenario and month holding the median and
+        credible interval bounds of Monthly Revenue and Churn Rate
+    """
+    scenarios = list(SCENARIOS.keys()) if scenarios is None else list(scenarios)
+    matrices = np.concatenate([sample_transition_matrices(scenario, draws, seed, concentration)
+                               for scenario in scenarios])
+    initial_counts = CustomerMarkovModel(initial_customers=initial_customers).initial_counts()
+
+    paths = forecast_batch(initial_counts, matrices, new_customers_per_month, months)
+    paths = paths.reshape(len(scenarios), draws, months + 1, len(STATES))
+
+    revenue = paths @ revenue_vector(STATES)
+    active_before = paths[:, :, :-1, :4].sum(axis=-1)
+    churn = np.zeros_like(revenue)
+    churn[:, :, 1:] = np.diff(paths[..., 4], axis=-1) / np.where(active_before > 0, active_before, np.nan) * 100
+
+    quantiles = [(1 - credibility) / 2, 0.5, (1 + credibility) / 2]
+    revenue_q = np.quantile(revenue, quantiles, axis=1)
+    churn_q = np.nanquantile(churn, quantiles, axis=1)
+
+    return pd.DataFrame({
+        'Scenario': np.repeat(scenarios, months + 1),
+        'Month': np.tile(np.arange(months + 1), len(scenarios)),
+        'Revenue Lower': revenue_q[0].ravel(),
+        'Revenue Median': revenue_q[1].ravel(),
+        'Revenue Upper': revenue_q[2].ravel(),
+        'Churn Rate Lower': churn_q[0].ravel(),
+        'Churn Rate Median': churn_q[1].ravel(),
+        'Churn Rate Upper': churn_q[2].ravel()
+    })
@@ -0,0 +1,233 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+# Directory of stored captures; override with the CUSTOMER_PROFILE_DIR environment variable
+DEFAULT_PROFILE_DIR = os.environ.get("CUSTOMER_PROFILE_DIR", ".profiles")
+
+# Number of most recent captures kept
+DEFAULT_KEEP = 50
+
+# Files of a capture by kind
+KINDS = {"pstats": ".pstats", "folded": ".folded", "body": ".body"}
+
+# Stop unfolding call paths below this depth
+MAX_STACK_DEPTH = 64
+
+class _StatsDict:
+    """Adapter letting pstats.Stats load a raw stats dictionary (e.g. one sent back by a worker process)"""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def profile_stats(profiler: cProfile.Profile) -> Dict:
+    """Get the raw, picklable stats dictionary of a finished profiler"""
+    profiler.create_stats()
+    return profiler.stats
+
+def merge_stats(stats: Iterable[Dict]) -> pstats.Stats:
+    """
+    Combine the raw stats of several profilers, e.g. one per worker process.
+
+    Args:
+        stats: Raw stats dictionaries from profile_stats
+
+    Returns:
+        The combined statistics
+    """
+    merged = None
+    for entry in stats:
+        if merged is None:
+            merged = pstats.Stats(_StatsDict(entry))
+        else:
+            merged.add(_StatsDict(entry))
+    return merged
+
+def function_name(function) -> str:
+    """Readable name of a pstats function key (file, line, name)"""
+    filename, line, name = function
+    if filename == "~":
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def top_functions(stats: pstats.Stats, limit: int = 15) -> List[Dict]:
+    """
+    Summarize the functions with the highest cumulative time.
+
+    Args:
+        stats: Profile statistics
+        limit: Number of functions
+
+    Returns:
+        List of dictionaries with the function, call count and total and
+        cumulative seconds
+    """
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{
+        "function": function_name(function),
+        "calls": calls,
+        "total_time": total_time,
+        "cumulative_time": cumulative_time
+    } for function, (_, calls, total_time, cumulative_time, _) in rows]
+
+def collapsed_stacks(stats: pstats.Stats) -> List[str]:
+    """
+    Convert profile statistics to the folded format of flamegraph tools.
+
+    cProfile keeps caller -> callee edges rather than full stacks, so stacks
+    are rebuilt by walking the call graph from its roots and splitting each
+    function's time over its callers in proportion to the cumulative time
+    each caller's calls took. Recursive edges are cut.
+
+    Args:
+        stats: Profile statistics
+
+    Returns:
+        Lines "root;caller;function microseconds" of self time per stack
+    """
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(function)
+
+    lines = {}
+    def visit(function, path, scale, depth):
+        _, _, total_time, cumulative_time, _ = stats.stats[function]
+        stack = path + (function_name(function),)
+        microseconds = total_time * scale * 1e6
+        if microseconds >= 1:
+            key = ";".join(stack)
+            lines[key] = lines.get(key, 0) + microseconds
+        if depth >= MAX_STACK_DEPTH or cumulative_time <= 0:
+            return
+        for callee in callees.get(function, []):
+            if function_name(callee) in stack:
+                continue
+            callee_cumulative = stats.stats[callee][3]
+            edge_cumulative = stats.stats[callee][4][function][3]
+            # Paths worth less than a microsecond are dropped, which also bounds the walk
+            if callee_cumulative > 0 and edge_cumulative * scale >= 1e-6:
+                visit(callee, stack, scale * edge_cumulative / callee_cumulative, depth + 1)
+
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            visit(function, (), 1.0, 0)
+    return [f"{stack} {round(microseconds)}" for stack, microseconds in lines.items()]
+
+class ProfileStore:
+    """
+    A directory of the most recent profile captures.
+
+    A capture is a .pstats file (readable by pstats, snakeviz or
+    gprof2dot), a .folded file for flamegraph tools, an optional .body file
+    with the profiled request's payload, and a .json file of metadata that
+    is written last, so listings only show complete captures.
+    """
+
+    def __init__(self, directory: str = DEFAULT_PROFILE_DIR, keep: int = DEFAULT_KEEP):
+        """
+        Initialize the store.
+
+        Args:
+            directory: Directory holding the captures (created if missing)
+            keep: Number of most recent captures kept
+        """
+        self.directory = directory
+        self.keep = keep
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, capture_id: str, kind: str) -> Optional[str]:
+        """
+        Get the file of a capture.
+
+        Args:
+            capture_id: Identifier of the capture
+            kind: "pstats", "folded", "body" or "json"
+
+        Returns:
+            The path, or None if the capture has no such file
+        """
+        if (kind != "json" and kind not in KINDS) or not capture_id.replace("-", "").isalnum():
+            return None
+        path = os.path.join(self.directory, capture_id + KINDS.get(kind, ".json"))
+        return path if os.path.exists(path) else None
+
+    def save(self, stats: pstats.Stats, meta: Dict, body: Optional[bytes] = None) -> Dict:
+        """
+        Store a capture and drop the oldest ones beyond the limit.
+
+        Args:
+            stats: Profile statistics
+            meta: Metadata describing what was profiled
+            body: Payload to keep for reproducing the run
+
+        Returns:
+            The stored metadata, including the capture's id
+        """
+        # Identifiers sort by creation time
+        capture_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        base = os.path.join(self.directory, capture_id)
+
+        stats.dump_stats(base + KINDS["pstats"])
+        with open(base + KINDS["folded"], "w") as f:
+            f.write("\n".join(collapsed_stacks(stats)) + "\n")
+        if body:
+            with open(base + KINDS["body"], "wb") as f:
+                f.write(body)
+
+        meta = {
+            "id": capture_id,
+            "created": time.time(),
+            "total_time": stats.total_tt,
+            "top_functions": top_functions(stats),
+            "files": [kind for kind in KINDS if kind != "body" or body],
+            **meta
+        }
+        with open(base + ".json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(base + ".json.tmp", base + ".json")
+
+        self.prune()
+        return meta
+
+    def ids(self) -> List[str]:
+        """Identifiers of the complete captures, newest first"""
+        return sorted((name[:-5] for name in os.listdir(self.directory) if name.endswith(".json")), reverse=True)
+
+    def list(self, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Get the metadata of the most recent captures.
+
+        Args:
+            limit: Maximum number of captures (defaults to all kept)
+
+        Returns:
+            Metadata of each capture, newest first
+        """
+        captures = []
+        for capture_id in self.ids()[:limit]:
+            try:
+                with open(os.path.join(self.directory, capture_id + ".json")) as f:
+                    captures.append(json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue  # Pruned by another process meanwhile
+        return captures
+
+    def prune(self):
+        """Remove every capture beyond the most recent `keep`"""
+        with self.lock:
+            for capture_id in self.ids()[self.keep:]:
+                for extension in [".json", *KINDS.values()]:
+                    try:
+                        os.remove(os.path.join(self.directory, capture_id + extension))
+                    except FileNotFoundError:
+                        pass
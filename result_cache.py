@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; eviction then runs unlocked
+    fcntl = None
+
+from transition_matrices import STATES, SCENARIOS, get_transition_matrix
+from revenue_model import MONTHLY_REVENUE
+import simulation
+import revenue_model
+import transition_matrices
+
+# Directory of the shared cache; override with the CUSTOMER_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = os.environ.get("CUSTOMER_CACHE_DIR", ".simulation_cache")
+
+# Default size bound of the cache (256 MB)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Bump when the stored layout changes
+CACHE_FORMAT = 2
+
+# Columns of a cached simulation's results
+RESULT_COLUMNS = ['Month', 'Total Customers', 'Monthly Revenue', 'Churn Rate', *STATES]
+
+# Layout of a cached simulation, as a structured array; Converged flags the
+# month a simulation with tol converged in, so hits can restore converged_month
+RESULT_DTYPE = np.dtype([
+    ('Month', np.int64),
+    ('Total Customers', np.int64),
+    ('Monthly Revenue', np.float64),
+    ('Churn Rate', np.float64),
+    *[(state, np.int64) for state in STATES],
+    ('Converged', np.bool_)
+])
+
+def code_version() -> str:
+    """
+    Hash the source of the modules that determine simulation results, so
+    any change to the model invalidates every cached result.
+
+    Returns:
+        Hex digest of the simulation, transition matrix and revenue sources
+    """
+    digest = hashlib.sha256(str(CACHE_FORMAT).encode())
+    for module in (simulation, transition_matrices, revenue_model):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+CODE_VERSION = code_version()
+
+def result_key(params: Dict, scenario: str, transition_matrix: Optional[np.ndarray] = None) -> str:
+    """
+    Build the content address of a simulation result.
+
+    Args:
+        params: Simulation parameters (JSON serializable)
+        scenario: Which business scenario the result is for
+        transition_matrix: Matrix used (defaults to the scenario's matrix)
+
+    Returns:
+        Hex digest identifying the result
+    """
+    if transition_matrix is None:
+        transition_matrix = get_transition_matrix(scenario)
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"scenario": scenario, **params}, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(transition_matrix, dtype=np.float64).tobytes())
+    digest.update(json.dumps(MONTHLY_REVENUE, sort_keys=True).encode())
+    digest.update(CODE_VERSION.encode())
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    A content-addressed, size-bounded cache of simulation results on disk.
+
+    Each result is one .npy file of a structured array named after its key,
+    so it can be memory-mapped on load. Files are written to a temporary
+    name and atomically renamed into place, so readers in other processes
+    never see partial results. Hits refresh the file's modification time,
+    which eviction uses as the least-recently-used order.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the cache.
+
+        Args:
+            directory: Directory holding the cached results (created on the first store)
+            max_bytes: Total size above which least recently used results are evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key: str) -> str:
+        """Get the file path of a key"""
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def load(self, key: str) -> Optional[np.ndarray]:
+        """
+        Load a cached result as a read-only memory map.
+
+        Args:
+            key: Content address of the result
+
+        Returns:
+            Structured array of the result, or None on a miss
+        """
+        path = self.path(key)
+        try:
+            result = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            # Missing, evicted by another process, or unreadable
+            return None
+        return result
+
+    def store(self, key: str, result: np.ndarray):
+        """
+        Atomically store a result and evict old results if over the size bound.
+
+        Args:
+            key: Content address of the result
+            result: Structured array to store
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, result)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    @contextmanager
+    def _lock(self):
+        """Hold an exclusive lock on the cache directory across processes"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def entries(self):
+        """List (path, size, last use) for every cached result"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith('.npy'):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((entry.path, stat.st_size, stat.st_mtime))
+        except FileNotFoundError:
+            pass  # Nothing stored yet
+        return entries
+
+    def evict(self):
+        """Delete least recently used results until the cache fits its size bound"""
+        with self._lock():
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def clear(self):
+        """Delete every cached result"""
+        with self._lock():
+            for path, _, _ in self.entries():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def simulate(self, model: "simulation.CustomerMarkovModel", months: int = 12,
+                 tol: Optional[float] = None) -> pd.DataFrame:
+        """
+        Run model.simulate through the cache.
+
+        Hits set model.converged_month like a fresh simulation would.
+
+        Args:
+            model: The model to simulate
+            months: Number of months to simulate
+            tol: Convergence tolerance passed on to simulate
+
+        Returns:
+            DataFrame identical to model.simulate(months, tol)
+        """
+        params = {
+            "initial_counts": model.initial_counts().tolist(),
+            "new_customers_per_month": model.new_customers_per_month,
+            "new_customer_distribution": np.asarray(model.new_customer_distribution, dtype=float).tolist(),
+            "months": months,
+            "tol": tol
+        }
+        params.update(model.cache_parameters())
+        key = result_key(params, model.scenario, model.transition_matrix)
+
+        cached = self.load(key)
+        if cached is not None:
+            converged = np.flatnonzero(cached['Converged'])
+            model.converged_month = int(converged[0]) if len(converged) else None
+            return pd.DataFrame({name: np.asarray(cached[name]) for name in RESULT_COLUMNS})
+
+        results = model.simulate(months=months, tol=tol)
+        stored = np.zeros(len(results), dtype=RESULT_DTYPE)
+        for name in RESULT_COLUMNS:
+            stored[name] = results[name].to_numpy()
+        if model.converged_month is not None:
+            stored['Converged'][model.converged_month] = True
+        self.store(key, stored)
+        return results
+
+def warm_up(cache: ResultCache, months: int = 12):
+    """
+    Pre-populate the cache with every scenario at default parameters.
+
+    Args:
+        cache: The cache to fill
+        months: Number of months to simulate
+    """
+    for scenario in SCENARIOS:
+        cache.simulate(simulation.CustomerMarkovModel(scenario=scenario), months=months)
+
+def main():
+    """Command line entry point to manage the result cache"""
+    parser = argparse.ArgumentParser(description="Manage the simulation result cache")
+    parser.add_argument("command", choices=["warm", "stats", "clear"])
+    parser.add_argument("--dir", default=DEFAULT_CACHE_DIR, help="Cache directory")
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES, help="Cache size bound")
+    parser.add_argument("--months", type=int, default=12, help="Months simulated by warm")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.dir, args.max_bytes)
+    if args.command == "warm":
+        warm_up(cache, args.months)
+        print(f"Warmed cache with {len(SCENARIOS)} scenarios at default parameters")
+    elif args.command == "clear":
+        cache.clear()
+        print("Cleared cache")
+
+    entries = cache.entries()
+    print(f"{len(entries)} results, {sum(size for _, size, _ in entries):,} bytes in {args.dir}")
+
+if __name__ == "__main__":
+    main()
@@ -23,4 +23,16 @@ def calculate_revenue(customer_counts: np.ndarray, states: List[str]) -> float:
     """
     revenue = sum(count * MONTHLY_REVENUE[state] 
                   for count, state in zip(customer_counts, states))
-    return revenue
\ No newline at end of file
+    return revenue
+
+def revenue_vector(states: List[str]) -> np.ndarray:
+    """
+    Get the average monthly revenue per customer as an array aligned with states.
+    
+    Args:
+        states: List of state names
+        
+    Returns:
+        Array of monthly revenue per customer for each state
+    """
+    return np.array([MONTHLY_REVENUE[state] for state in states], dtype=float)
\ No newline at end of file
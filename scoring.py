@@ -0,0 +1,145 @@
+import argparse
+import time
+import numpy as np
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from transition_matrices import STATES, SCENARIOS, get_transition_matrix
+from revenue_model import revenue_vector
+
+NO_REPURCHASE = STATES.index("No Repurchase")
+
+@lru_cache(maxsize=64)
+def score_tables(scenario: str, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Precompute the per-segment scores for a scenario and horizon.
+
+    The churn table treats No Repurchase as absorbing, so entry s of the last
+    column of that matrix to the power k is the probability of entering No
+    Repurchase within k months from segment s. The value table sums the
+    expected revenue of months 1..k, i.e. (P + P^2 + ... + P^k) @ revenue.
+
+    Args:
+        scenario: Which business scenario to use
+        horizon: Number of months k to look ahead
+
+    Returns:
+        Tuple of (churn probability, expected revenue) arrays indexed by segment
+    """
+    transition_matrix = get_transition_matrix(scenario)
+    revenue = revenue_vector(STATES)
+
+    absorbing = transition_matrix.copy()
+    absorbing[NO_REPURCHASE] = 0.0
+    absorbing[NO_REPURCHASE, NO_REPURCHASE] = 1.0
+
+    churn = np.linalg.matrix_power(absorbing, horizon)[:, NO_REPURCHASE]
+
+    value = np.zeros(len(STATES))
+    expected_revenue = revenue
+    for _ in range(horizon):
+        expected_revenue = transition_matrix @ expected_revenue
+        value += expected_revenue
+
+    churn.flags.writeable = False
+    value.flags.writeable = False
+    return churn, value
+
+def score_labels(labels: np.ndarray, scenario: str = "Default", horizon: int = 12) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score customers given their current segment index.
+
+    Args:
+        labels: Integer segment index of every customer (positions in STATES)
+        scenario: Which business scenario to use
+        horizon: Number of months to look ahead
+
+    Returns:
+        Tuple of float32 arrays (churn probability, expected revenue), one
+        entry per customer
+    """
+    churn, value = score_tables(scenario, horizon)
+    labels = np.asarray(labels)
+    if labels.size and (labels.min() < 0 or labels.max() >= len(STATES)):
+        raise ValueError(f"Segment labels must be between 0 and {len(STATES) - 1}")
+
+    return churn.astype(np.float32)[labels], value.astype(np.float32)[labels]
+
+def open_labels(path: str) -> np.ndarray:
+    """
+    Memory-map a file of int8 segment labels.
+
+    Args:
+        path: A .npy file, or a raw file of int8 labels
+
+    Returns:
+        Read-only memory-mapped array of labels
+    """
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return np.memmap(path, dtype=np.int8, mode='r')
+
+def score_file(labels_path: str,
+               output_prefix: str,
+               scenario: str = "Default",
+               horizon: int = 12,
+               chunk_size: int = 4_000_000) -> Dict[str, str]:
+    """
+    Score every customer in a labels file and write the scores to disk.
+
+    Labels are read through a memory map and scored chunk by chunk with
+    plain array indexing into the precomputed tables; each chunk is written
+    straight into memory-mapped .npy outputs, so memory use is bounded by
+    the chunk size rather than the number of customers.
+
+    Args:
+        labels_path: File of int8 segment labels (see open_labels)
+        output_prefix: Outputs are written to <prefix>_churn.npy and <prefix>_value.npy
+        scenario: Which business scenario to use
+        horizon: Number of months to look ahead
+        chunk_size: Number of customers scored per chunk
+
+    Returns:
+        Dictionary with the paths of the churn and value outputs
+    """
+    labels = open_labels(labels_path)
+    churn_table, value_table = (table.astype(np.float32) for table in score_tables(scenario, horizon))
+
+    paths = {"churn": f"{output_prefix}_churn.npy", "value": f"{output_prefix}_value.npy"}
+    churn_out = np.lib.format.open_memmap(paths["churn"], mode='w+', dtype=np.float32, shape=labels.shape)
+    value_out = np.lib.format.open_memmap(paths["value"], mode='w+', dtype=np.float32, shape=labels.shape)
+
+    for start in range(0, labels.shape[0], chunk_size):
+        chunk = np.asarray(labels[start:start + chunk_size])
+        if chunk.min() < 0 or chunk.max() >= len(STATES):
+            raise ValueError(f"Segment labels must be between 0 and {len(STATES) - 1} "
+                             f"(bad label in rows {start}-{start + len(chunk) - 1})")
+        np.take(churn_table, chunk, out=churn_out[start:start + len(chunk)])
+        np.take(value_table, chunk, out=value_out[start:start + len(chunk)])
+
+    churn_out.flush()
+    value_out.flush()
+    del churn_out, value_out
+    return paths
+
+def main():
+    """Command line entry point for nightly scoring runs"""
+    parser = argparse.ArgumentParser(description="Score customers by churn risk and expected revenue")
+    parser.add_argument("labels", help="File of int8 segment labels (.npy or raw)")
+    parser.add_argument("output_prefix", help="Prefix of the output .npy files")
+    parser.add_argument("--scenario", default="Default", choices=list(SCENARIOS.keys()))
+    parser.add_argument("--horizon", type=int, default=12, help="Months to look ahead")
+    parser.add_argument("--chunk-size", type=int, default=4_000_000, help="Customers scored per chunk")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = score_file(args.labels, args.output_prefix, args.scenario, args.horizon, args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    n_customers = len(open_labels(args.labels))
+    print(f"Scored {n_customers:,} customers in {elapsed:.2f}s ({n_customers / max(elapsed, 1e-9):,.0f} customers/s)")
+    print(f"Churn probabilities: {paths['churn']}")
+    print(f"Expected revenue: {paths['value']}")
+
+if __name__ == "__main__":
+    main()
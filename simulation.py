@@ -1,9 +1,11 @@
 import numpy as np
 import pandas as pd
+from statistics import NormalDist
 from typing import Dict, List, Tuple, Optional
 
-from transition_matrices import STATES, STATE_ABBR, NEW_CUSTOMER_DISTRIBUTION, get_transition_matrix, get_steady_state
-from revenue_model import calculate_revenue
+from transition_matrices import (STATES, STATE_ABBR, NEW_CUSTOMER_DISTRIBUTION, get_transition_matrix,
+                                 get_steady_state, get_stationary_distribution)
+from revenue_model import calculate_revenue, revenue_vector
 
 class CustomerMarkovModel:
     """
@@ -38,76 +40,589 @@ class CustomerMarkovModel:
         # New customer distribution
         self.new_customer_distribution = NEW_CUSTOMER_DISTRIBUTION
     
-    def simulate(self, months: int = 12) -> pd.DataFrame:
+    def initial_counts(self) -> np.ndarray:
+        """
+        Get the integer customer counts per segment at month 0.
+        
+        Returns:
+            Array of customer counts by segment
+        """
+        customer_counts = np.asarray(self.initial_distribution, dtype=float) * self.initial_customers
+        return customer_counts.astype(int)
+    
+    def asymptote(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calculate the straight line the simulation converges to.
+        
+        Every month adds new_customers_per_month customers and none leave the
+        chain, so counts[t] approaches offset + t * drift with
+        drift = new_customers_per_month * pi (pi the stationary distribution)
+        and offset solving offset @ (I - P) = new_customers * distribution - drift.
+        With no new customers the drift is zero and offset is the fixed point.
+        
+        Returns:
+            Tuple of (drift, offset) arrays
+        """
+        n_states = len(STATES)
+        stationary = get_stationary_distribution(self.transition_matrix)
+        drift = self.new_customers_per_month * stationary
+        
+        # offset is only fixed up to a multiple of pi; pin its total to month 0
+        system = np.vstack([(np.eye(n_states) - self.transition_matrix).T, np.ones(n_states)])
+        rhs = np.append(self.new_customers_per_month * np.asarray(self.new_customer_distribution) - drift,
+                        np.sum(self.initial_counts()))
+        offset, *_ = np.linalg.lstsq(system, rhs, rcond=None)
+        
+        return drift, offset
+    
+    def simulate(self, months: int = 12, tol: Optional[float] = None) -> pd.DataFrame:
         """
         Simulate customer behavior over specified months.
         
+        With tol set, stepping stops as soon as every segment changes by
+        within tol customers of its long-run monthly drift (see asymptote()),
+        and the remaining months are filled in analytically along that drift.
+        The month this happened is stored in self.converged_month (None if the
+        run never converged).
+        
         Args:
             months: Number of months to simulate
+            tol: Convergence tolerance in customers, or None to step every month
             
         Returns:
             DataFrame with customer counts, revenue, and churn metrics for each month
         """
-        # Initialize results storage
-        results = []
-        
-        # Initial customer distribution
-        customer_counts = self.initial_distribution * self.initial_customers
-        customer_counts = customer_counts.astype(int)
-        
-        # Total customers at start
-        total_customers = np.sum(customer_counts)
+        # Customer counts for every month, starting from the initial distribution
+        customer_counts = np.zeros((months + 1, len(STATES)), dtype=int)
+        customer_counts[0] = self.initial_counts()
+        self.converged_month = None
         
-        # Calculate initial monthly revenue
-        monthly_revenue = calculate_revenue(customer_counts, STATES)
-        
-        # Store initial state
-        results.append({
-            'Month': 0,
-            'Total Customers': total_customers,
-            'Monthly Revenue': monthly_revenue,
-            'Churn Rate': 0.0,
-            **{state: count for state, count in zip(STATES, customer_counts)},
-            **{f'{abbr}': count for abbr, count in zip(STATE_ABBR, customer_counts)}
-        })
+        if tol is not None:
+            drift, _ = self.asymptote()
         
         # Run simulation for specified months
         for month in range(1, months + 1):
             # Apply transition matrix to current distribution
-            new_counts = np.zeros_like(customer_counts, dtype=float)  # Use float for calculations
+            new_counts = np.zeros(len(STATES), dtype=float)  # Use float for calculations
             
             for i in range(len(STATES)):
                 for j in range(len(STATES)):
-                    new_counts[j] += customer_counts[i] * self.transition_matrix[i, j]
+                    new_counts[j] += customer_counts[month - 1, i] * self.transition_matrix[i, j]
             
             # Add new customers
             new_customers = self.new_customers_per_month * self.new_customer_distribution
             new_counts += new_customers
             
             # Convert to integers AFTER all calculations are done/Rounded to nearest customer
-            customer_counts = np.round(new_counts).astype(int)
+            customer_counts[month] = np.round(new_counts).astype(int)
+            
+            # Once on the asymptote, every later month just adds the drift
+            step = customer_counts[month] - customer_counts[month - 1]
+            if tol is not None and np.max(np.abs(step - drift)) <= tol:
+                self.converged_month = month
+                remaining = np.arange(1, months - month + 1)[:, None]
+                customer_counts[month + 1:] = np.round(customer_counts[month] + remaining * drift).astype(int)
+                break
+        
+        return self._results_frame(customer_counts)
+    
+    def _results_frame(self, customer_counts: np.ndarray) -> pd.DataFrame:
+        """
+        Build the results DataFrame from monthly segment counts.
+        
+        Args:
+            customer_counts: Integer counts with shape (months + 1, 5)
+            
+        Returns:
+            DataFrame with customer counts, revenue, and churn metrics for each month
+        """
+        months = len(customer_counts) - 1
+        
+        # Total customers and monthly revenue for every month
+        total_customers = customer_counts.sum(axis=1)
+        monthly_revenue = calculate_revenue(customer_counts.T, STATES)
+        
+        # Calculate customers who moved to NR each month (true monthly churn)
+        new_nr_customers = np.diff(customer_counts[:, 4])
+        active_customers_before = customer_counts[:-1, :4].sum(axis=1)
+        churn_rate = np.zeros(months + 1)
+        np.divide(new_nr_customers, active_customers_before, out=churn_rate[1:],
+                  where=active_customers_before > 0)
+        churn_rate[1:] *= 100
+        
+        return pd.DataFrame({
+            'Month': np.arange(months + 1),
+            'Total Customers': total_customers,
+            'Monthly Revenue': monthly_revenue,
+            'Churn Rate': churn_rate,
+            **{state: customer_counts[:, i] for i, state in enumerate(STATES)}
+        })
+    
+    def cache_parameters(self) -> Dict:
+        """
+        Get the parameters beyond counts, acquisition and matrix that shape the results.
+        
+        Returns:
+            JSON-serializable dictionary included in result cache keys
+        """
+        return {}
+    
+    def propagate_moments(self, months: int = 12,
+                          acquisition_noise: Optional[str] = "poisson",
+                          initial_covariance: Optional[np.ndarray] = None,
+                          exact_months: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Propagate the exact mean and covariance of the segment counts.
+        
+        Each customer moves independently according to its row of P, so given
+        counts X the next counts are a sum of multinomials plus acquisition:
+            mean[t+1] = mean[t] @ P + a * d
+            cov[t+1]  = P^T cov[t] P + sum_i mean[t, i] * (diag(P_i) - P_i^T P_i) + cov_A
+        where cov_A is diag(a * d) for Poisson acquisition and
+        a * (diag(d) - d^T d) for a fixed number of new customers split
+        multinomially. Counts are not rounded.
+        
+        Args:
+            months: Number of months to propagate
+            acquisition_noise: "poisson", "multinomial" or None for a fixed,
+                deterministic split of new customers
+            initial_covariance: Covariance of the counts at month 0, e.g. the
+                last month of a run being extended (defaults to known counts)
+            exact_months: Propagate exactly for this many months only and
+                continue along the last monthly change after that, like
+                simulate does once converged (defaults to every month)
+            
+        Returns:
+            Tuple of (means, covariances) with shapes (months + 1, 5) and
+            (months + 1, 5, 5)
+        """
+        return propagate_chain_moments(self.transition_matrix, self.initial_counts(),
+                                       self.new_customer_distribution, self.new_customers_per_month,
+                                       months, acquisition_noise, initial_covariance, exact_months)
+    
+    def forecast_intervals(self, months: int = 12, confidence: float = 0.95,
+                           acquisition_noise: Optional[str] = "poisson") -> pd.DataFrame:
+        """
+        Calculate analytic confidence intervals for revenue and segment counts.
+        
+        Uses the exact moments from propagate_moments with a normal
+        approximation, so no Monte Carlo paths are needed.
+        
+        Args:
+            months: Number of months to forecast
+            confidence: Two-sided confidence level of the intervals
+            acquisition_noise: See propagate_moments
+            
+        Returns:
+            DataFrame with expected revenue, its standard deviation and interval
+            bounds, and the expected count and standard deviation of each segment
+        """
+        means, covariances = self.propagate_moments(months, acquisition_noise)
+        return moment_intervals(means, covariances, confidence)
+
+
+def moment_intervals(means: np.ndarray, covariances: np.ndarray, confidence: float = 0.95) -> pd.DataFrame:
+    """
+    Turn propagated segment moments into normal-approximation intervals.
+    
+    Args:
+        means: Expected segment counts, shape (months + 1, 5)
+        covariances: Covariances of the segment counts, shape (months + 1, 5, 5)
+        confidence: Two-sided confidence level of the intervals
+        
+    Returns:
+        DataFrame with the columns of CustomerMarkovModel.forecast_intervals
+    """
+    revenue = revenue_vector(STATES)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    
+    revenue_mean = means @ revenue
+    revenue_std = np.sqrt(np.maximum(np.einsum('j,tjk,k->t', revenue, covariances, revenue), 0.0))
+    segment_std = np.sqrt(np.maximum(np.diagonal(covariances, axis1=1, axis2=2), 0.0))
+    
+    return pd.DataFrame({
+        'Month': np.arange(len(means)),
+        'Expected Revenue': revenue_mean,
+        'Revenue Std': revenue_std,
+        'Revenue Lower': revenue_mean - z * revenue_std,
+        'Revenue Upper': revenue_mean + z * revenue_std,
+        **{f'{state} Mean': means[:, i] for i, state in enumerate(STATES)},
+        **{f'{state} Std': segment_std[:, i] for i, state in enumerate(STATES)}
+    })
+
+
+def propagate_chain_moments(P: np.ndarray,
+                            initial_counts: np.ndarray,
+                            new_customer_distribution: np.ndarray,
+                            new_customers_per_month: float,
+                            months: int,
+                            acquisition_noise: Optional[str] = "poisson",
+                            initial_covariance: Optional[np.ndarray] = None,
+                            exact_months: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Propagate the mean and covariance of the counts of a chain with acquisition.
+    
+    See CustomerMarkovModel.propagate_moments for the recursion; P may have any
+    number of states. After exact_months the means grow by the long-run drift
+    (see CustomerMarkovModel.asymptote) and the covariance, driven by them,
+    by its last monthly step, so both are extended linearly.
+    
+    Args:
+        P: Transition matrix, shape (n, n)
+        initial_counts: Counts at month 0, shape (n,)
+        new_customer_distribution: Distribution of new customers, shape (n,)
+        new_customers_per_month: Number of new customers added each month
+        months: Number of months to propagate
+        acquisition_noise: "poisson", "multinomial" or None
+        initial_covariance: Covariance of the counts at month 0, shape (n, n)
+            (defaults to zero)
+        exact_months: Months propagated exactly (defaults to all)
+        
+    Returns:
+        Tuple of (means, covariances) with shapes (months + 1, n) and
+        (months + 1, n, n)
+    """
+    n_states = P.shape[0]
+    inflow = new_customers_per_month * np.asarray(new_customer_distribution, dtype=float)
+    inflow_cov = acquisition_covariance(new_customer_distribution, new_customers_per_month, acquisition_noise)
+    
+    # Multinomial covariance of one customer leaving each state
+    row_cov = np.einsum('ij,jk->ijk', P, np.eye(n_states)) - np.einsum('ij,ik->ijk', P, P)
+    
+    means = np.zeros((months + 1, n_states))
+    covariances = np.zeros((months + 1, n_states, n_states))
+    means[0] = initial_counts
+    if initial_covariance is not None:
+        covariances[0] = initial_covariance
+    
+    exact_months = months if exact_months is None else min(max(exact_months, 1), months)
+    for month in range(1, exact_months + 1):
+        mean, cov = means[month - 1], covariances[month - 1]
+        means[month] = mean @ P + inflow
+        covariances[month] = P.T @ cov @ P + np.einsum('i,ijk->jk', mean, row_cov) + inflow_cov
+    
+    if exact_months < months:
+        extend_moments(means, covariances, exact_months, new_customers_per_month * get_stationary_distribution(P))
+    
+    return means, covariances
+
+def acquisition_covariance(new_customer_distribution: np.ndarray,
+                           new_customers_per_month: float,
+                           acquisition_noise: Optional[str] = "poisson") -> np.ndarray:
+    """
+    Covariance of the new customers added to each state in a month.
+    
+    Args:
+        new_customer_distribution: Distribution of new customers, shape (n,)
+        new_customers_per_month: Number of new customers added each month
+        acquisition_noise: "poisson", "multinomial" or None
+        
+    Returns:
+        Covariance matrix, shape (n, n)
+    """
+    distribution = np.asarray(new_customer_distribution, dtype=float)
+    if acquisition_noise == "poisson":
+        return np.diag(new_customers_per_month * distribution)
+    if acquisition_noise == "multinomial":
+        return new_customers_per_month * (np.diag(distribution) - np.outer(distribution, distribution))
+    if acquisition_noise is None:
+        return np.zeros((len(distribution), len(distribution)))
+    raise ValueError(f"Unknown acquisition noise: {acquisition_noise}. "
+                     f"Available options: ['poisson', 'multinomial', None]")
+
+def extend_moments(means: np.ndarray, covariances: np.ndarray, last: int, drift: np.ndarray) -> None:
+    """
+    Fill the moments after month `last` in place: the means grow by the
+    long-run drift and the covariances by their last monthly step.
+    
+    Args:
+        means: Means, shape (months + 1, n), exact up to month last
+        covariances: Covariances, shape (months + 1, n, n), exact up to month last
+        last: Last exactly propagated month (at least 1)
+        drift: Long-run monthly change of the means, shape (n,)
+    """
+    remaining = np.arange(1, len(means) - last)
+    means[last + 1:] = means[last] + remaining[:, None] * drift
+    covariances[last + 1:] = covariances[last] + remaining[:, None, None] * (covariances[last] - covariances[last - 1])
+
+
+def forecast_batch(initial_counts: np.ndarray,
+                   transition_matrices: np.ndarray,
+                   new_customers_per_month,
+                   months: int,
+                   new_customer_distribution: np.ndarray = NEW_CUSTOMER_DISTRIBUTION,
+                   round_counts: bool = False) -> np.ndarray:
+    """
+    Forecast segment counts for a whole batch of candidates at once.
+    
+    Applies the same recurrence as CustomerMarkovModel.simulate, i.e.
+    counts[t+1] = counts[t] @ P + new_customers * distribution, to every
+    candidate in one vectorized step per month. The batch dimensions of the
+    three inputs are broadcast against each other.
+    
+    Args:
+        initial_counts: Counts at month 0, shape (..., 5)
+        transition_matrices: Transition matrices, shape (..., 5, 5)
+        new_customers_per_month: New customers per month, scalar or shape (...)
+        months: Number of months to forecast
+        new_customer_distribution: How new customers are split across segments
+        round_counts: Round to whole customers each month like simulate does
+        
+    Returns:
+        Array of counts with shape (..., months + 1, 5)
+    """
+    counts = np.asarray(initial_counts, dtype=float)
+    matrices = np.asarray(transition_matrices, dtype=float)
+    new_customers = np.asarray(new_customers_per_month, dtype=float)
+    n_states = matrices.shape[-1]
+    
+    batch_shape = np.broadcast_shapes(counts.shape[:-1], matrices.shape[:-2], new_customers.shape)
+    counts = np.broadcast_to(counts, batch_shape + (n_states,))
+    inflow = new_customers[..., None] * np.asarray(new_customer_distribution, dtype=float)
+    
+    paths = np.empty(batch_shape + (months + 1, n_states))
+    paths[..., 0, :] = counts
+    for month in range(1, months + 1):
+        counts = np.matmul(counts[..., None, :], matrices)[..., 0, :] + inflow
+        if round_counts:
+            counts = np.round(counts)
+        paths[..., month, :] = counts
+    
+    return paths
+
+
+# Default tenure effects: the share of a segment's leaving probability that
+# turns into staying once a customer reaches the last tenure bucket
+DEFAULT_STICKINESS = {"Loyal Customer": 0.3}
+
+class TenureMarkovModel(CustomerMarkovModel):
+    """
+    A semi-Markov model whose transitions depend on tenure in the current segment.
+    
+    States expand to (segment, tenure bucket) pairs, where tenure counts the
+    months since the customer entered the segment and the last bucket holds
+    every longer tenure. A customer at tenure k leaves its segment with the
+    scenario's leaving probabilities scaled by 1 - stickiness * k / (buckets - 1),
+    so tenure 0 follows the scenario's matrix and zero stickiness reproduces
+    the plain chain.
+    
+    The expanded matrix is block-sparse: the block from a segment to itself
+    only moves customers one tenure bucket up, and the block to any other
+    segment only has entries in its tenure-0 column. It is therefore stored
+    as a staying probability per (segment, bucket) and leaving probabilities
+    per (segment, bucket, destination), and a month costs O(25 * buckets)
+    instead of a dense (5 * buckets)^2 product.
+    """
+    
+    def __init__(self,
+                 initial_customers: int = 10000,
+                 new_customers_per_month: int = 800,
+                 scenario: str = "Default",
+                 tenure_buckets: int = 6,
+                 stickiness: Optional[Dict[str, float]] = None):
+        """
+        Initialize the tenure-aware model.
+        
+        Args:
+            initial_customers: Total number of customers at start (all at tenure 0)
+            new_customers_per_month: Number of new customers added each month
+            scenario: Which business scenario to use
+            tenure_buckets: Number of tenure buckets, the last one capping tenure
+            stickiness: Segment name -> share of the leaving probability turned
+                into staying at the last bucket (defaults to DEFAULT_STICKINESS)
+        """
+        super().__init__(initial_customers, new_customers_per_month, scenario)
+        
+        stickiness = DEFAULT_STICKINESS if stickiness is None else stickiness
+        if tenure_buckets < 1:
+            raise ValueError("tenure_buckets must be at least 1")
+        unknown = [state for state in stickiness if state not in STATES]
+        if unknown:
+            raise ValueError(f"Unknown segment: {unknown}. Available segments: {STATES}")
+        if any(not 0 <= value <= 1 for value in stickiness.values()):
+            raise ValueError("Stickiness must be between 0 and 1")
+        
+        self.tenure_buckets = tenure_buckets
+        self.stickiness = {state: float(value) for state, value in stickiness.items()}
+        self.stay, self.leave = self.tenure_blocks()
+    
+    def tenure_blocks(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Build the block-sparse form of the expanded transition matrix.
+        
+        Returns:
+            Tuple of (stay, leave): stay[s, k] is the probability of staying in
+            segment s from bucket k (moving to bucket min(k + 1, last)), and
+            leave[s, k, j] the probability of moving to segment j at tenure 0
+            (zero for j == s)
+        """
+        n_states, buckets = len(STATES), self.tenure_buckets
+        P = self.transition_matrix
+        
+        scale = np.ones((n_states, buckets))
+        if buckets > 1:
+            ramp = np.arange(buckets) / (buckets - 1)
+            for state, value in self.stickiness.items():
+                scale[STATES.index(state)] = 1.0 - value * ramp
+        
+        leave = (P - np.diag(np.diag(P)))[:, None, :] * scale[:, :, None]
+        stay = 1.0 - leave.sum(axis=2)
+        return stay, leave
+    
+    def expanded_matrix(self) -> np.ndarray:
+        """
+        Materialize the dense expanded transition matrix.
+        
+        Returns:
+            Matrix of shape (5 * buckets, 5 * buckets); state (s, k) is index s * buckets + k
+        """
+        n_states, buckets = len(STATES), self.tenure_buckets
+        matrix = np.zeros((n_states, buckets, n_states, buckets))
+        for s in range(n_states):
+            for k in range(buckets):
+                matrix[s, k, s, min(k + 1, buckets - 1)] += self.stay[s, k]
+                matrix[s, k, :, 0] += self.leave[s, k]
+        return matrix.reshape(n_states * buckets, n_states * buckets)
+    
+    def aggregation_matrix(self) -> np.ndarray:
+        """
+        Get the matrix summing expanded states into their segments.
+        
+        Returns:
+            Matrix of shape (5 * buckets, 5)
+        """
+        return np.repeat(np.eye(len(STATES)), self.tenure_buckets, axis=0)
+    
+    def step(self, counts: np.ndarray) -> np.ndarray:
+        """
+        Move expanded counts one month forward (without new customers) using the block structure.
+        
+        Args:
+            counts: Expanded counts, shape (..., 5, buckets); leading
+                dimensions are stepped independently, so a (n, 5, buckets)
+                array of n rows is multiplied by the expanded matrix
             
-            # Total customers now
-            total_customers = np.sum(customer_counts)
+        Returns:
+            Expanded counts of the next month
+        """
+        staying = counts * self.stay
+        following = np.zeros_like(counts, dtype=float)
+        following[..., 1:] = staying[..., :-1]
+        following[..., -1] += staying[..., -1]
+        following[..., 0] += counts.reshape(counts.shape[:-2] + (-1,)) @ self.leave.reshape(-1, self.leave.shape[-1])
+        return following
+    
+    def initial_tenure_counts(self) -> np.ndarray:
+        """
+        Get the expanded counts at month 0, with every customer at tenure 0.
+        
+        Returns:
+            Array of shape (5, buckets)
+        """
+        counts = np.zeros((len(STATES), self.tenure_buckets))
+        counts[:, 0] = self.initial_counts()
+        return counts
+    
+    def simulate(self, months: int = 12, tol: Optional[float] = None) -> pd.DataFrame:
+        """
+        Simulate customer behavior over specified months.
+        
+        The expanded counts are kept unrounded; the segment totals reported
+        are rounded to whole customers. The expanded counts of every month are
+        stored in self.tenure_history with shape (months + 1, 5, buckets).
+        With tol set, stepping stops once every expanded state changes by
+        within tol customers of its long-run monthly drift and the remaining
+        months follow that drift (see CustomerMarkovModel.simulate).
+        
+        Args:
+            months: Number of months to simulate
+            tol: Convergence tolerance in customers, or None to step every month
             
-            # Calculate monthly revenue
-            monthly_revenue = calculate_revenue(customer_counts, STATES)
+        Returns:
+            DataFrame with the same columns as CustomerMarkovModel.simulate
+        """
+        history = np.zeros((months + 1, len(STATES), self.tenure_buckets))
+        history[0] = self.initial_tenure_counts()
+        self.converged_month = None
+        
+        inflow = np.zeros_like(history[0])
+        inflow[:, 0] = self.new_customers_per_month * np.asarray(self.new_customer_distribution, dtype=float)
+        
+        if tol is not None:
+            stationary = get_stationary_distribution(self.expanded_matrix())
+            drift = self.new_customers_per_month * stationary.reshape(history[0].shape)
+        
+        for month in range(1, months + 1):
+            history[month] = self.step(history[month - 1]) + inflow
             
-            # Calculate customers who moved to NR this month (true monthly churn)
-            previous_nr = results[-1]["No Repurchase"]
-            new_nr_customers = customer_counts[4] - previous_nr
-            active_customers_before = sum(results[-1][STATE_ABBR[i]] for i in range(4))
-            churn_rate = (new_nr_customers / active_customers_before * 100 
-                         if active_customers_before > 0 else 0)
+            if tol is not None and np.max(np.abs(history[month] - history[month - 1] - drift)) <= tol:
+                self.converged_month = month
+                remaining = np.arange(1, months - month + 1)[:, None, None]
+                history[month + 1:] = history[month] + remaining * drift
+                break
+        
+        self.tenure_history = history
+        return self._results_frame(np.round(history.sum(axis=2)).astype(int))
+    
+    def propagate_moments(self, months: int = 12,
+                          acquisition_noise: Optional[str] = "poisson",
+                          exact_months: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Propagate the exact mean and covariance of the segment counts.
+        
+        The moments are propagated on the expanded chain, where customers
+        still move independently, and summed back into segments. The
+        multinomial terms sum to diag(mean @ P) - P^T diag(mean) P, so a month
+        is P^T (cov - diag(mean)) P plus diagonal terms, with both products
+        taken by step() over the block structure. Only the current expanded
+        covariance is kept, so time and memory stay O(months * (5 * buckets)^2)
+        rather than the cube of the dense recursion.
+        
+        Args:
+            months: Number of months to propagate
+            acquisition_noise: See CustomerMarkovModel.propagate_moments
+            exact_months: See CustomerMarkovModel.propagate_moments
             
-            # Store results
-            results.append({
-                'Month': month,
-                'Total Customers': total_customers,
-                'Monthly Revenue': monthly_revenue,
-                'Churn Rate': churn_rate,
-                **{state: count for state, count in zip(STATES, customer_counts)},
-                **{f'{abbr}': count for abbr, count in zip(STATE_ABBR, customer_counts)}
-            })
-        
-        return pd.DataFrame(results)
\ No newline at end of file
+        Returns:
+            Tuple of (means, covariances) with shapes (months + 1, 5) and
+            (months + 1, 5, 5)
+        """
+        n_states, buckets = len(STATES), self.tenure_buckets
+        size = n_states * buckets
+        shape = (n_states, buckets)
+        
+        # New customers only arrive at tenure 0
+        inflow = np.zeros(shape)
+        inflow[:, 0] = self.new_customers_per_month * np.asarray(self.new_customer_distribution, dtype=float)
+        inflow_cov = np.zeros(shape + shape)
+        inflow_cov[:, 0, :, 0] = acquisition_covariance(self.new_customer_distribution,
+                                                        self.new_customers_per_month, acquisition_noise)
+        inflow_cov = inflow_cov.reshape(size, size)
+        
+        means = np.zeros((months + 1, n_states))
+        covariances = np.zeros((months + 1, n_states, n_states))
+        mean = self.initial_tenure_counts()
+        cov = np.zeros((size, size))
+        means[0] = mean.sum(axis=1)
+        
+        exact_months = months if exact_months is None else min(max(exact_months, 1), months)
+        diagonal = np.arange(size)
+        for month in range(1, exact_months + 1):
+            # (cov - diag(mean)) @ P row by row, then P^T @ that as its transpose's rows times P
+            cov[diagonal, diagonal] -= mean.ravel()
+            right = self.step(cov.reshape(size, *shape)).reshape(size, size)
+            stepped = self.step(mean)
+            cov = self.step(right.T.reshape(size, *shape)).reshape(size, size) + inflow_cov
+            cov[diagonal, diagonal] += stepped.ravel()
+            mean = stepped + inflow
+            means[month] = mean.sum(axis=1)
+            covariances[month] = cov.reshape(shape + shape).sum(axis=(1, 3))
+        
+        if exact_months < months:
+            stationary = get_stationary_distribution(self.expanded_matrix()).reshape(shape)
+            extend_moments(means, covariances, exact_months, self.new_customers_per_month * stationary.sum(axis=1))
+        return means, covariances
+    
+    def cache_parameters(self) -> Dict:
+        """Tenure settings change the results, so they are part of the cache key"""
+        return {"tenure_buckets": self.tenure_buckets, "stickiness": self.stickiness}
@@ -0,0 +1,81 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait for it and share its result, or
+    its exception. Nothing is cached once the leader finishes, so results
+    never go stale.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight: Dict[Hashable, "_Call"] = {}
+        self.calls = 0
+        self.computations = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run function for key, or wait for the identical in-flight call.
+
+        Args:
+            key: Canonical identity of the call
+            function: Function computing the result
+
+        Returns:
+            Tuple of (result, shared) where shared is True if the result came
+            from another caller's computation
+        """
+        with self.lock:
+            self.calls += 1
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self.in_flight[key] = _Call()
+                self.computations += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict:
+        """
+        Report how much coalescing has saved.
+
+        Returns:
+            Dictionary with the number of calls, computations, coalesced calls
+            and the coalescing ratio (calls per computation)
+        """
+        with self.lock:
+            calls, computations, in_flight = self.calls, self.computations, len(self.in_flight)
+        return {
+            "calls": calls,
+            "computations": computations,
+            "coalesced": calls - computations,
+            "coalescing_ratio": calls / computations if computations else 1.0,
+            "in_flight": in_flight
+        }
+
+class _Call:
+    """An in-flight computation and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are skipped without the brotli package
+    brotli = None
+
+# Encodings in order of preference when the client accepts several
+ENCODINGS = ["br", "gzip"]
+
+# Files smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+# Types that compress well
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+class Asset:
+    """A static file held in memory with its precompressed variants"""
+
+    def __init__(self, path: str, content: bytes, mtime: float):
+        """
+        Initialize an asset and compress it.
+
+        Args:
+            path: Path of the file on disk
+            content: Contents of the file
+            mtime: Modification time of the file, to detect changes
+        """
+        self.path = path
+        self.mtime = mtime
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.digest = hashlib.sha256(content).hexdigest()[:32]
+
+        # Encoding -> bytes; None is the identity encoding
+        self.variants: Dict[Optional[str], bytes] = {None: content}
+        if len(content) >= MIN_COMPRESS_SIZE and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            compressed = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(content, quality=11)
+            # Keep a variant only if it actually saves bytes
+            for encoding, data in compressed.items():
+                if len(data) < len(content):
+                    self.variants[encoding] = data
+
+    def etag(self, encoding: Optional[str]) -> str:
+        """Strong ETag of one variant; each encoding gets its own since the bytes differ"""
+        return f"{self.digest}-{encoding}" if encoding else self.digest
+
+class StaticAssets:
+    """
+    In-memory cache of a static directory.
+
+    Every file is read, hashed and compressed once, so serving it is a
+    dictionary lookup. Only files found in the directory can be served, which
+    also rules out path traversal.
+    """
+
+    def __init__(self, directory: str, auto_reload: bool = False):
+        """
+        Initialize the cache and load the directory.
+
+        Args:
+            directory: Directory of the static files
+            auto_reload: Reload a file when its modification time changes
+                (one stat per request, meant for development)
+        """
+        self.directory = directory
+        self.auto_reload = auto_reload
+        self.assets: Dict[str, Asset] = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read and compress every file of the directory"""
+        assets = {}
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    relative = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                    assets[relative] = self._read(path)
+        with self.lock:
+            self.assets = assets
+
+    def _read(self, path: str) -> Asset:
+        """Load one file from disk"""
+        with open(path, "rb") as f:
+            content = f.read()
+        return Asset(path, content, os.path.getmtime(path))
+
+    def get(self, name: str) -> Optional[Asset]:
+        """
+        Look up an asset by its path relative to the directory.
+
+        Args:
+            name: Relative path, e.g. "index.html"
+
+        Returns:
+            The asset, or None if the directory has no such file
+        """
+        asset = self.assets.get(name)
+        if asset is not None and self.auto_reload:
+            try:
+                mtime = os.path.getmtime(asset.path)
+            except OSError:
+                return None
+            if mtime != asset.mtime:
+                asset = self._read(asset.path)
+                with self.lock:
+                    self.assets[name] = asset
+        return asset
+
+    def stats(self) -> Dict:
+        """Summarize the cached assets and their compressed sizes"""
+        with self.lock:
+            assets = dict(self.assets)
+        return {
+            name: {encoding or "identity": len(data) for encoding, data in asset.variants.items()}
+            for name, asset in assets.items()
+        }
+
+def choose_encoding(asset: Asset, accept_encodings) -> Optional[str]:
+    """
+    Pick the best variant of an asset the client accepts.
+
+    Args:
+        asset: The asset to serve
+        accept_encodings: The request's parsed Accept-Encoding header
+
+    Returns:
+        The chosen content encoding, or None for the uncompressed bytes
+    """
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings[encoding]
+        if encoding in asset.variants and quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import threading
+from typing import Dict, List, Optional
+
+from transition_matrices import STATES, SCENARIOS, get_transition_matrix, get_transient_block
+
+ACTIVE_STATES = STATES[:4]
+
+# Longest horizon of /api/survival, and of the tables SurvivalTables keeps
+MAX_HORIZON = 1200
+
+def survival_analysis(scenarios: Optional[List[str]] = None, horizon: int = 24) -> Dict[str, np.ndarray]:
+    """
+    Calculate time-to-churn distributions for every starting segment and scenario.
+
+    No Repurchase is treated as absorbing, so only the transient block Q of
+    active-to-active transitions matters: the probability of not having
+    churned after k months is S_k = Q^k @ 1, the hazard in month k is
+    1 - S_k / S_(k-1), and the expected time to churn is (I - Q)^-1 @ 1.
+    All scenarios are stacked and computed together.
+
+    Args:
+        scenarios: Scenarios to analyse (defaults to all scenarios)
+        horizon: Number of months of the survival curves
+
+    Returns:
+        Dictionary with the scenario names, survival curves with shape
+        (n_scenarios, horizon + 1, 4), hazard rates with the same shape
+        (month 0 is zero), expected months to churn with shape
+        (n_scenarios, 4) and median months to churn with shape
+        (n_scenarios, 4) (-1 if beyond the horizon)
+    """
+    scenarios = list(SCENARIOS.keys()) if scenarios is None else list(scenarios)
+    transient = get_transient_block(np.stack([get_transition_matrix(scenario) for scenario in scenarios]))
+    n_active = transient.shape[-1]
+
+    survival = np.empty((len(scenarios), horizon + 1, n_active))
+    survival[:, 0] = 1.0
+    for month in range(1, horizon + 1):
+        survival[:, month] = np.matmul(transient, survival[:, month - 1, :, None])[..., 0]
+
+    hazard = np.zeros_like(survival)
+    np.divide(survival[:, :-1] - survival[:, 1:], survival[:, :-1], out=hazard[:, 1:],
+              where=survival[:, :-1] > 0)
+
+    expected = np.linalg.solve(np.eye(n_active) - transient, np.ones((len(scenarios), n_active, 1)))[..., 0]
+
+    below_half = survival <= 0.5
+    median = np.where(below_half.any(axis=1), below_half.argmax(axis=1), -1)
+
+    return {
+        "scenarios": scenarios,
+        "survival": survival,
+        "hazard": hazard,
+        "expected_months": expected,
+        "median_months": median
+    }
+
+def survival_table(scenario: str = "Default", horizon: int = 24) -> pd.DataFrame:
+    """
+    Get the survival curve and hazard of each starting segment for one scenario.
+
+    Args:
+        scenario: Which business scenario to use
+        horizon: Number of months of the survival curves
+
+    Returns:
+        DataFrame with the survival probability and hazard rate of each
+        starting segment per month
+    """
+    analysis = survival_analysis([scenario], horizon)
+    return pd.DataFrame({
+        'Month': np.arange(horizon + 1),
+        **{f'{state} Survival': analysis["survival"][0, :, i] for i, state in enumerate(ACTIVE_STATES)},
+        **{f'{state} Hazard': analysis["hazard"][0, :, i] for i, state in enumerate(ACTIVE_STATES)}
+    })
+
+class SurvivalTables:
+    """
+    The survival analysis of every scenario up to a maximum horizon, computed once.
+
+    Shorter horizons and subsets of scenarios are sliced out of the tables,
+    so a pre-fork server can compute them before forking and every worker
+    reads the parent's copy. Scenarios added or changed since (e.g. fitted
+    scenarios registered again) are detected by their matrix and computed
+    per call.
+    """
+
+    def __init__(self, horizon: int = MAX_HORIZON):
+        """
+        Initialize the tables; they are computed on first use or by compute().
+
+        Args:
+            horizon: Number of months of the stored survival curves
+        """
+        self.horizon = horizon
+        self.analysis = None
+        self.matrices = None
+        self.lock = threading.Lock()
+
+    def compute(self):
+        """Compute the tables for every current scenario"""
+        scenarios = list(SCENARIOS.keys())
+        matrices = {scenario: get_transition_matrix(scenario).copy() for scenario in scenarios}
+        analysis = survival_analysis(scenarios, self.horizon)
+        with self.lock:
+            self.analysis, self.matrices = analysis, matrices
+
+    def get(self, scenarios: Optional[List[str]] = None, horizon: int = 24) -> Dict[str, np.ndarray]:
+        """
+        Get the survival analysis of some scenarios, as survival_analysis returns it.
+
+        Args:
+            scenarios: Scenarios to analyse (defaults to all scenarios)
+            horizon: Number of months of the survival curves
+
+        Returns:
+            See survival_analysis
+        """
+        scenarios = list(SCENARIOS.keys()) if scenarios is None else list(scenarios)
+        if self.analysis is None:
+            self.compute()
+        with self.lock:
+            analysis, matrices = self.analysis, self.matrices
+
+        current = all(scenario in matrices and np.array_equal(matrices[scenario], get_transition_matrix(scenario))
+                      for scenario in scenarios)
+        if horizon > self.horizon or not current:
+            return survival_analysis(scenarios, horizon)
+
+        rows = [analysis["scenarios"].index(scenario) for scenario in scenarios]
+        median = analysis["median_months"][rows]
+        return {
+            "scenarios": scenarios,
+            "survival": analysis["survival"][rows, :horizon + 1],
+            "hazard": analysis["hazard"][rows, :horizon + 1],
+            "expected_months": analysis["expected_months"][rows],
+            # A median beyond the shorter horizon is unknown within it
+            "median_months": np.where(median <= horizon, median, -1)
+        }
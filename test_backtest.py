@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from backtest import FITTED, backtest
+from simulation import CustomerMarkovModel
+from transition_matrices import get_transition_matrix
+
+# Tests of the rolling-origin backtest on a synthetic history with a known scenario
+
+TRUE_SCENARIO = "Economic Recession"
+
+@pytest.fixture(scope="module")
+def history():
+    """Three years of customers moving by the true scenario's matrix, with Poisson acquisition"""
+    P = get_transition_matrix(TRUE_SCENARIO)
+    model = CustomerMarkovModel()
+    rng = np.random.default_rng(0)
+    counts, new_customers = [model.initial_counts()], []
+    for _ in range(36):
+        moved = sum(rng.multinomial(count, P[i]) for i, count in enumerate(counts[-1]))
+        new_customers.append(rng.poisson(model.new_customers_per_month))
+        counts.append(moved + rng.multinomial(new_customers[-1], model.new_customer_distribution))
+    return np.array(counts, dtype=float), np.array(new_customers, dtype=float)
+
+def test_true_scenario_and_window_fit_beat_a_wrong_scenario(history):
+    """The generating matrix forecasts almost exactly and the window fits get close to it"""
+    counts, new_customers = history
+    errors, summary = backtest(counts, new_customers, window=12, horizon=3,
+                               compare=["Default", TRUE_SCENARIO], workers=2)
+    mape = summary.set_index(["Method", "Horizon"])["Revenue MAPE"]
+    for ahead in range(1, 4):
+        assert mape[TRUE_SCENARIO, ahead] < 2
+        assert mape[FITTED, ahead] < mape["Default", ahead] / 4
+        # Origins 12..35 minus those too close to the end of the history
+        assert summary.set_index(["Method", "Horizon"])["Windows"][FITTED, ahead] == 36 - 12 - ahead + 1
+    assert (errors["Train Months"] == 12).all()
+
+def test_results_do_not_depend_on_the_worker_split(history):
+    """Origins scored in one worker or spread over several in small chunks give the same errors"""
+    counts, new_customers = history
+    single, _ = backtest(counts, new_customers, window=None, min_train=6, horizon=2, workers=1, chunk_size=64)
+    split, _ = backtest(counts, new_customers, window=None, min_train=6, horizon=2, workers=3, chunk_size=2)
+    assert single.equals(split)
+    assert single["Train Months"].min() == 6
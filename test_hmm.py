@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from hmm import fit_hmm, simulate_observations, save_fit, load_fitted_scenario, register_fitted_scenario
+from posterior import TRANSITION_COUNTS, sample_transition_matrices
+from transition_matrices import SCENARIOS, get_transition_matrix
+from whatif import WhatIfSessions
+
+# Tests of fitting, saving and registering HMM scenarios
+
+@pytest.fixture
+def fitted(tmp_path):
+    """A scenario fitted to observations of the Default matrix and saved to JSON"""
+    _, counts, spend = simulate_observations(get_transition_matrix("Default"), 3000, 24, seed=1)
+    params, statistics, history = fit_hmm(counts, spend, iterations=10)
+    path = str(tmp_path / "fit.json")
+    save_fit(path, "Test Fitted", params, statistics, history)
+    yield path, params, statistics
+    SCENARIOS.pop("Test Fitted", None)
+    TRANSITION_COUNTS.pop("Test Fitted", None)
+
+def test_saved_fit_registers_the_same_scenario(fitted):
+    """Loading a saved fit registers its matrix and transition counts unchanged"""
+    path, params, statistics = fitted
+    assert load_fitted_scenario(path) == "Test Fitted"
+    assert np.allclose(get_transition_matrix("Test Fitted"), params["transition"])
+    assert np.allclose(TRANSITION_COUNTS["Test Fitted"], statistics["transitions"])
+    # The fit recovers the matrix the observations came from
+    assert np.abs(params["transition"] - get_transition_matrix("Default")).max() < 0.05
+
+def test_registering_again_refreshes_posterior_and_sessions(fitted):
+    """A scenario registered again under the same name drops stale draws, counts and what-if sessions"""
+    path, params, _ = fitted
+    load_fitted_scenario(path)
+    draws = sample_transition_matrices("Test Fitted", draws=100)
+    sessions = WhatIfSessions()
+    engine = sessions.get("session", "Test Fitted")
+    assert sessions.get("session", "Test Fitted") is engine
+
+    replacement = {"transition": get_transition_matrix("Default").copy()}
+    register_fitted_scenario("Test Fitted", replacement)
+    assert "Test Fitted" not in TRANSITION_COUNTS
+    assert not np.array_equal(sample_transition_matrices("Test Fitted", draws=100), draws)
+
+    restarted = sessions.get("session", "Test Fitted")
+    assert restarted is not engine
+    assert np.array_equal(restarted.transition_matrix, replacement["transition"])
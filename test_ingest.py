@@ -0,0 +1,92 @@
+import time
+import numpy as np
+from ingest import LiveCounts, estimate_parameters, generate_events, OUTSIDE, SECONDS_PER_MONTH
+from transition_matrices import STATES, get_transition_matrix
+
+# Tests of the live event ingestion behind /api/live
+
+DAY = 24 * 3600
+
+def replay(lines, initial_counts):
+    """Apply event lines one by one: segment counts and all moves by (from, to)"""
+    names = {"": OUTSIDE, **{str(i): i for i in range(len(STATES))}}
+    counts = np.array(initial_counts, dtype=float)
+    moves = np.zeros((OUTSIDE + 1, OUTSIDE + 1))
+    for line in lines:
+        _, source, target = line.strip().split(",")
+        i, j = names[source], names[target]
+        moves[i, j] += 1
+        if i != OUTSIDE:
+            counts[i] -= 1
+        if j != OUTSIDE:
+            counts[j] += 1
+    return counts, moves
+
+def test_batches_match_exact_replay(tmp_path):
+    """Counts and window moves folded per batch equal a line-by-line replay"""
+    path = str(tmp_path / "events.csv")
+    generate_events(path, 50000, customers=8000, seed=2)
+    with open(path) as f:
+        lines = f.readlines()
+    initial = [2000.0] * 4 + [0.0]
+
+    # A window longer than the events, so every move is still in it
+    live = LiveCounts(initial, window_seconds=48 * SECONDS_PER_MONTH)
+    for start in range(0, len(lines), 3000):
+        assert live.ingest(lines[start:start + 3000]) == len(lines[start:start + 3000])
+    snapshot = live.snapshot()
+    counts, moves = replay(lines, initial)
+    assert np.array_equal(snapshot["counts"], counts)
+    assert np.array_equal(snapshot["moves"], moves)
+    assert snapshot["events"] == len(lines) and snapshot["rejected"] == 0
+
+def test_estimates_recover_generating_scenario(tmp_path):
+    """Moves over exposure in the last three months give the scenario's matrix, not the prior's"""
+    path = str(tmp_path / "events.csv")
+    generate_events(path, 300000, customers=20000, scenario="Economic Recession", seed=0)
+    with open(path) as f:
+        lines = f.readlines()
+    live = LiveCounts([5000.0] * 4 + [0.0])
+    for start in range(0, len(lines), 10000):
+        live.ingest(lines[start:start + 10000])
+
+    estimates = estimate_parameters(live.snapshot(), "Default")
+    truth = get_transition_matrix("Economic Recession")
+    assert np.abs(estimates["transition_matrix"] - truth).max() < 0.03
+    assert np.allclose(estimates["transition_matrix"].sum(axis=1), 1.0)
+    # generate_events adds customers // 12 new customers a month
+    assert abs(estimates["new_customers_per_month"] / (20000 // 12) - 1) < 0.05
+
+def test_buckets_leave_the_window_with_their_moves_and_exposure():
+    """Old buckets drop out of the window and take their moves and exposure with them"""
+    live = LiveCounts([100.0] * 5, window_seconds=10 * DAY, bucket_seconds=DAY)
+    live.ingest(["0,0,1"] * 3)
+    live.ingest([f"{5 * DAY},1,2"] * 2)
+    snapshot = live.snapshot()
+    assert snapshot["moves"][0, 1] == 3 and snapshot["moves"][1, 2] == 2
+
+    live.ingest([f"{20 * DAY},2,3"])
+    snapshot = live.snapshot()
+    expected = np.zeros((OUTSIDE + 1, OUTSIDE + 1))
+    expected[2, 3] = 1
+    assert np.array_equal(snapshot["moves"], expected)
+    # Days 10-19 are closed and empty: they hold the counts after day 5 throughout
+    held = np.array([97.0, 101.0, 102.0, 100.0, 100.0])
+    assert np.allclose(snapshot["exposure"], held * 10 * DAY / SECONDS_PER_MONTH)
+    assert np.allclose(snapshot["window_months"], 10 * DAY / SECONDS_PER_MONTH)
+
+def test_malformed_and_implausible_lines_are_rejected():
+    """Bad lines are counted as rejected without raising or moving the open bucket"""
+    now = time.time()
+    live = LiveCounts([100.0] * 5)
+    bad = ["nan,0,1", "inf,0,1", "-inf,,1", "1e400,0,1", "1e12,0,1", "abc,0,1",
+           f"{now},9,1", f"{now},0", "", f"{now},Unknown,1\n"]
+    assert live.ingest(bad) == 0
+    assert live.rejected == len(bad)
+    assert live.snapshot()["last_timestamp"] is None
+
+    assert live.ingest([f"{now},0,1\n", "nan,1,2", f"{now + 10 * SECONDS_PER_MONTH},1,2", f"{now + 60},0,1"]) == 2
+    snapshot = live.snapshot()
+    assert live.rejected == len(bad) + 2
+    assert snapshot["last_timestamp"] == now + 60
+    assert snapshot["moves"][0, 1] == 2 and snapshot["moves"][1, 2] == 0
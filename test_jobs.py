@@ -0,0 +1,19 @@
+from jobs import JobQueue
+
+# Tests of result retention in the job queue behind /api/jobs
+
+def test_results_are_dropped_beyond_the_retained_cost():
+    """The earliest results go once the kept ones cost too much; their status stays"""
+    queue = JobQueue(inline_cost=100, max_cost=100, max_retained_cost=250)
+    jobs = [queue.submit(lambda report, i=i: i, cost=100) for i in range(4)]
+
+    assert [job.to_dict().get("result") for job in jobs] == [None, None, 2, 3]
+    for job in jobs[:2]:
+        description = queue.get(job.id).to_dict()
+        assert description["status"] == "done" and description["result_dropped"]
+
+def test_latest_result_is_kept_even_above_the_limit():
+    """A single result costing more than the limit is still returned"""
+    queue = JobQueue(inline_cost=500, max_cost=500, max_retained_cost=100)
+    job = queue.submit(lambda report: "result", cost=500)
+    assert job.to_dict()["result"] == "result"
@@ -0,0 +1,71 @@
+import numpy as np
+from simulation import CustomerMarkovModel, TenureMarkovModel, propagate_chain_moments
+from revenue_model import revenue_vector
+from transition_matrices import STATES
+
+# Tests of the analytic moments behind the revenue intervals of /api/simulate
+
+def simulate_paths(model, months, paths, seed=0):
+    """Simulate customers one by one: multinomial moves plus Poisson acquisition"""
+    rng = np.random.default_rng(seed)
+    P = model.transition_matrix
+    counts = np.tile(model.initial_counts(), (paths, 1))
+    for _ in range(months):
+        moved = sum(rng.multinomial(counts[:, i], P[i]) for i in range(len(STATES)))
+        counts = moved + rng.poisson(model.new_customers_per_month * model.new_customer_distribution,
+                                     size=(paths, len(STATES)))
+    return counts
+
+def test_moments_match_monte_carlo():
+    """The propagated mean and covariance agree with simulated customers"""
+    model = CustomerMarkovModel(initial_customers=2000, new_customers_per_month=100, scenario="Default")
+    months, paths = 6, 20000
+    means, covariances = model.propagate_moments(months)
+    counts = simulate_paths(model, months, paths)
+    
+    std = np.sqrt(np.diag(covariances[-1]))
+    # Sample means are within 5 standard errors, sample covariances within 10%
+    assert np.all(np.abs(counts.mean(axis=0) - means[-1]) < 5 * std / np.sqrt(paths))
+    assert np.allclose(np.cov(counts.T), covariances[-1], rtol=0.1, atol=0.1 * std.max() ** 2)
+
+def test_moments_continue_from_initial_covariance():
+    """Extending from the last month's covariance equals propagating in one go"""
+    model = CustomerMarkovModel(initial_customers=10000, new_customers_per_month=800, scenario="Default")
+    means, covariances = model.propagate_moments(12)
+    
+    first_means, first_covariances = model.propagate_moments(5)
+    # Counts are not rounded, so the extension can start from the exact means
+    model.initial_counts = lambda: first_means[-1]
+    rest_means, rest_covariances = model.propagate_moments(7, initial_covariance=first_covariances[-1])
+    
+    assert np.allclose(rest_means, means[5:])
+    assert np.allclose(rest_covariances, covariances[5:])
+
+def test_moments_follow_drift_after_convergence():
+    """Moments extrapolated from the converged month stay close to the exact ones"""
+    model = CustomerMarkovModel(initial_customers=10000, new_customers_per_month=800, scenario="Default")
+    model.simulate(months=600, tol=0.5)
+    assert model.converged_month is not None and model.converged_month < 600
+    
+    means, covariances = model.propagate_moments(600)
+    fast_means, fast_covariances = model.propagate_moments(600, exact_months=model.converged_month)
+    
+    revenue = revenue_vector(STATES)
+    revenue_std = np.sqrt(revenue @ covariances[-1] @ revenue)
+    fast_revenue_std = np.sqrt(revenue @ fast_covariances[-1] @ revenue)
+    assert np.allclose(fast_means, means, rtol=1e-3)
+    assert abs(fast_revenue_std - revenue_std) < 1e-2 * revenue_std
+
+def test_tenure_moments_match_dense_expanded_chain():
+    """The block-structured tenure recursion equals the dense recursion on the expanded matrix"""
+    model = TenureMarkovModel(tenure_buckets=4, stickiness={"Loyal Customer": 0.5, "Occasional Buyer": 0.2})
+    distribution = np.zeros((len(STATES), model.tenure_buckets))
+    distribution[:, 0] = model.new_customer_distribution
+    aggregate = model.aggregation_matrix()
+    for noise, exact_months in [("poisson", None), ("multinomial", 20), (None, None)]:
+        means, covariances = model.propagate_moments(48, noise, exact_months=exact_months)
+        dense_means, dense_covariances = propagate_chain_moments(
+            model.expanded_matrix(), model.initial_tenure_counts().ravel(), distribution.ravel(),
+            model.new_customers_per_month, 48, noise, exact_months=exact_months)
+        assert np.allclose(means, dense_means @ aggregate)
+        assert np.allclose(covariances, aggregate.T @ dense_covariances @ aggregate)
@@ -0,0 +1,43 @@
+import numpy as np
+import monte_carlo
+from monte_carlo import simulate_customers, compare_scenarios
+from revenue_model import revenue_vector
+from transition_matrices import STATES
+
+# Tests of antithetic pairing in the paired scenario comparison of /api/compare
+
+def revenue_totals(counts):
+    """Total revenue of months 1 to the end per scenario and replication"""
+    return (counts[:, :, 1:] @ revenue_vector(STATES)).sum(axis=-1)
+
+def test_halves_mirror_each_other_across_chunks(monkeypatch):
+    """Replication i is antithetic to i + R/2 even when the run is split into many chunks"""
+    replications = 200
+    # Small chunks: four replications (two pairs) each
+    monkeypatch.setattr(monte_carlo, "CHUNK_ELEMENTS", 4 * (1000 + 12 * 100))
+    counts = simulate_customers(["Default"], 12, 1000, 100, replications, antithetic=True)
+    totals = revenue_totals(counts)[0]
+    
+    half = replications // 2
+    paired = np.corrcoef(totals[:half], totals[half:])[0, 1]
+    shifted = np.corrcoef(totals[:half], np.roll(totals[half:], 1))[0, 1]
+    assert paired < -0.5
+    assert abs(shifted) < 0.3
+
+def test_pairing_does_not_depend_on_chunk_size(monkeypatch):
+    """The paired standard error agrees between one chunk and many"""
+    options = dict(scenarios=["Default", "Price Increase"], months=12, initial_customers=1000,
+                   new_customers_per_month=100, replications=400)
+    whole = compare_scenarios(**options).iloc[0]
+    monkeypatch.setattr(monte_carlo, "CHUNK_ELEMENTS", 4 * 2 * (1000 + 12 * 100))
+    chunked = compare_scenarios(**options).iloc[0]
+    
+    assert chunked["Variance Reduction"] > 2
+    assert 0.5 < chunked["Std Error"] / whole["Std Error"] < 2
+    assert abs(chunked["Mean Difference"] - whole["Mean Difference"]) < 4 * whole["Std Error"]
+
+def test_without_antithetic_variates_every_replication_is_drawn():
+    """Independent replications come out in order with no mirrored half"""
+    counts = simulate_customers(["Default"], 6, 500, 50, replications=7, antithetic=False)
+    assert counts.shape == (1, 7, 7, len(STATES))
+    assert np.all(counts.sum(axis=-1)[..., -1] == counts[0, 0].sum(axis=-1)[-1])
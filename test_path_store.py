@@ -0,0 +1,38 @@
+import numpy as np
+from path_store import PathStore, metric_values
+
+# Tests of the streaming queries over stored runs behind /api/paths
+
+def test_streaming_quantiles_match_numpy(tmp_path):
+    """Quantiles from the three streaming passes equal np.quantile over all paths, ties included"""
+    store = PathStore(str(tmp_path / "paths"))
+    run = store.create(["Default", "Economic Recession"], months=6, initial_customers=500,
+                       new_customers_per_month=40, replications=301, antithetic=False, seed=3)
+    quantiles = [0.0, 0.01, 0.1, 0.25, 0.5, 0.777, 0.9, 0.99, 1.0]
+    for scenario in run.scenarios:
+        counts = np.asarray(run.counts(scenario))
+        for metric in ["revenue", "total", "Loyal Customer"]:
+            # Small blocks so every pass spans several of them
+            result = run.quantiles(scenario, quantiles, metric, block_rows=64)
+            values = metric_values(counts, metric)
+            assert np.allclose(result["values"], np.quantile(values, quantiles, axis=0))
+            assert np.allclose(result["mean"], values.mean(axis=0))
+
+def test_exceedance_matches_direct_count(tmp_path):
+    """Per-month and any-month exceedance equal the fractions counted over all paths"""
+    store = PathStore(str(tmp_path / "paths"))
+    run = store.create(["Default"], months=6, initial_customers=500, new_customers_per_month=40,
+                       replications=200, seed=5)
+    values = metric_values(np.asarray(run.counts("Default")), "revenue")
+    threshold = np.median(values[:, -1])
+    result = run.exceedance("Default", threshold, block_rows=64)
+    assert np.allclose(result["probability"], (values > threshold).mean(axis=0))
+    assert np.isclose(result["any_month"], (values[:, 1:] > threshold).any(axis=1).mean())
+
+def test_store_directory_is_created_with_the_first_run(tmp_path):
+    """Opening a store writes nothing until a run is stored"""
+    store = PathStore(str(tmp_path / "paths"))
+    assert store.runs() == []
+    assert not (tmp_path / "paths").exists()
+    run = store.create(["Default"], months=2, initial_customers=100, new_customers_per_month=10, replications=10)
+    assert [manifest["id"] for manifest in store.runs()] == [run.id]
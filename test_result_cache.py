@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pandas as pd
+from result_cache import ResultCache, result_key
+from simulation import CustomerMarkovModel, TenureMarkovModel
+from transition_matrices import get_transition_matrix
+
+# Tests of the content-addressed simulation cache
+
+def test_key_depends_on_every_input():
+    """Keys change with the parameters, scenario and matrix, but not with parameter order"""
+    params = {"months": 12, "new_customers_per_month": 800}
+    key = result_key(params, "Default")
+    
+    assert key == result_key({"new_customers_per_month": 800, "months": 12}, "Default")
+    assert key != result_key({**params, "months": 13}, "Default")
+    assert key != result_key(params, "New Competitor")
+    edited = get_transition_matrix("Default").copy()
+    edited[0, :2] = [0.31, 0.39]
+    assert key != result_key(params, "Default", edited)
+
+def test_hit_matches_fresh_simulation(tmp_path):
+    """A hit returns the stored results and restores converged_month"""
+    cache = ResultCache(str(tmp_path / "cache"))
+    assert not os.path.exists(tmp_path / "cache")
+    
+    model = CustomerMarkovModel(scenario="Default")
+    fresh = cache.simulate(model, months=600, tol=0.5)
+    assert model.converged_month is not None
+    
+    other = CustomerMarkovModel(scenario="Default")
+    cached = cache.simulate(other, months=600, tol=0.5)
+    pd.testing.assert_frame_equal(cached, fresh)
+    assert other.converged_month == model.converged_month
+    assert len(cache.entries()) == 1
+    
+    # Tenure settings are part of the key
+    cache.simulate(TenureMarkovModel(scenario="Default"), months=600, tol=0.5)
+    assert len(cache.entries()) == 2
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    """Stores beyond the size bound evict the results used least recently"""
+    cache = ResultCache(str(tmp_path))
+    models = [CustomerMarkovModel(new_customers_per_month=n) for n in (100, 200, 300)]
+    
+    cache.simulate(models[0], months=24)
+    size = cache.entries()[0][1]
+    cache.max_bytes = 2 * size
+    cache.simulate(models[1], months=24)
+    
+    # Touch the first result so the second is the least recently used
+    first, second = sorted(cache.entries(), key=lambda entry: entry[2])
+    os.utime(first[0], (second[2] + 10, second[2] + 10))
+    cache.simulate(models[2], months=24)
+    
+    remaining = {path for path, _, _ in cache.entries()}
+    assert len(remaining) == 2
+    assert first[0] in remaining and second[0] not in remaining
@@ -0,0 +1,62 @@
+import threading
+import time
+from singleflight import SingleFlight
+
+# Tests of request coalescing behind /api/simulate
+
+def run_concurrently(flight, key, function, callers):
+    """Call flight.do from several threads at once and collect (result, shared) or the exception"""
+    barrier = threading.Barrier(callers)
+    outcomes = []
+    lock = threading.Lock()
+
+    def call():
+        barrier.wait()
+        try:
+            outcome = flight.do(key, function)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+def test_concurrent_calls_share_one_computation():
+    """Identical in-flight calls run the function once and all get its result"""
+    flight = SingleFlight()
+    runs = []
+
+    def compute():
+        runs.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    outcomes = run_concurrently(flight, "key", compute, 10)
+    assert len(runs) == 1
+    assert [result for result, _ in outcomes] == ["result"] * 10
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * 9
+    assert flight.stats()["coalesced"] == 9 and flight.stats()["in_flight"] == 0
+
+def test_errors_reach_every_waiter():
+    """The leader's exception is raised in every coalesced caller"""
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    outcomes = run_concurrently(flight, "key", fail, 5)
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+def test_results_are_not_cached():
+    """Calls after the leader finished compute again, and different keys never share"""
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("a", lambda: 2) == (2, False)
+    assert flight.do("b", lambda: 3) == (3, False)
+    assert flight.stats()["computations"] == 3
@@ -0,0 +1,25 @@
+import json
+from simulation import CustomerMarkovModel
+from tail_risk import tail_risk
+
+# Tests of the rare-event estimate behind /api/tailrisk
+
+def test_unreachable_floor_stops_tuning_and_stays_valid_json():
+    """A floor below anything the tilt produces ends tuning early and reports no shortfall"""
+    result = tail_risk(CustomerMarkovModel(), 1000, paths=500, tuning_paths=500)
+    assert result["probability"] == 0.0
+    assert result["hits"] == 0
+    assert result["expected_shortfall"] is None
+    assert result["expected_shortfall_lower"] is None
+    assert result["expected_shortfall_upper"] is None
+    assert not result["tuning_reached_floor"]
+    assert len(result["tuning_levels"]) < 20
+    json.loads(json.dumps(result, allow_nan=False))
+
+def test_reachable_floor_has_shortfall_within_bounds():
+    """A floor most paths fall below gives a finite shortfall inside its interval"""
+    result = tail_risk(CustomerMarkovModel(), 900000, paths=500, tuning_paths=500)
+    assert result["tuning_reached_floor"]
+    assert result["probability"] > 0.9
+    assert result["expected_shortfall_lower"] <= result["expected_shortfall"] <= result["expected_shortfall_upper"]
+    json.loads(json.dumps(result, allow_nan=False))
@@ -0,0 +1,46 @@
+import numpy as np
+from whatif import WhatIfEngine
+from transition_matrices import SCENARIOS, STATES, get_stationary_distribution
+
+# Tests of the incremental (Sherman-Morrison) updates behind /api/whatif
+
+def refactorized(engine):
+    """A fresh engine factorizing the edited engine's matrix from scratch"""
+    fresh = WhatIfEngine(engine.scenario, **engine.options)
+    fresh.reset(engine.transition_matrix)
+    return fresh
+
+def test_single_edit_matches_refactorization():
+    """One edit updates the inverses, lifetime values and stationary distribution exactly"""
+    engine = WhatIfEngine("Default")
+    engine.edit(1, 4, value=0.2)
+    fresh = refactorized(engine)
+    
+    assert np.allclose(engine.transition_matrix.sum(axis=1), 1.0)
+    assert np.isclose(engine.transition_matrix[1, 4], 0.2)
+    assert np.allclose(engine.clv_inverse, fresh.clv_inverse)
+    assert np.allclose(engine.fundamental, fresh.fundamental)
+    assert np.allclose(engine.clv, fresh.clv)
+    assert np.allclose(engine.stationary, fresh.stationary)
+    assert np.allclose(engine.stationary @ engine.transition_matrix, engine.stationary)
+
+def test_many_edits_stay_accurate():
+    """Random edits across refactorizations keep the stationary distribution of the current matrix"""
+    rng = np.random.default_rng(0)
+    for scenario in SCENARIOS:
+        engine = WhatIfEngine(scenario)
+        for _ in range(2 * WhatIfEngine.REFACTOR_EVERY + 5):
+            engine.edit(rng.integers(5), rng.integers(5), delta=rng.uniform(-0.1, 0.1))
+        
+        expected = get_stationary_distribution(engine.transition_matrix)
+        assert np.allclose(engine.stationary, expected, atol=1e-9)
+        assert np.allclose(engine.clv, refactorized(engine).clv)
+
+def test_summary_reports_full_chain_stationary_distribution():
+    """The summary's stationary distribution covers all five states"""
+    summary = WhatIfEngine("Default").summary()
+    stationary = summary["stationary_distribution"]
+    
+    assert list(stationary) == STATES
+    assert np.isclose(sum(stationary.values()), 1.0)
+    assert len(summary["forecast"]) == 13
@@ -61,6 +61,18 @@ def get_transition_matrix(scenario: str) -> np.ndarray:
     else:
         raise ValueError(f"Unknown scenario: {scenario}. Available scenarios: {list(SCENARIOS.keys())}")
 
+def get_transient_block(transition_matrix: np.ndarray) -> np.ndarray:
+    """
+    Get the block of transitions among the active (non No Repurchase) states.
+    
+    Args:
+        transition_matrix: The Markov chain transition matrix, or a stack of them
+        
+    Returns:
+        The 4x4 sub-matrix (or stack of sub-matrices) of active-to-active transitions
+    """
+    return transition_matrix[..., :4, :4]
+
 def get_steady_state(transition_matrix: np.ndarray) -> np.ndarray:
     """
     Calculate the steady state distribution for the transition matrix.
@@ -73,7 +85,7 @@ def get_steady_state(transition_matrix: np.ndarray) -> np.ndarray:
         Array of steady state probabilities for the non-absorbing states
     """
     # Extract the sub-matrix for non-absorbing states
-    sub_matrix = transition_matrix[:4, :4]
+    sub_matrix = get_transient_block(transition_matrix)
     
     # Find eigenvalues and eigenvectors
     eigenvalues, eigenvectors = np.linalg.eig(sub_matrix.T)
@@ -86,4 +98,27 @@ def get_steady_state(transition_matrix: np.ndarray) -> np.ndarray:
     # Normalize to make the sum 1
     steady_state = steady_state / np.sum(steady_state)
     
-    return steady_state
\ No newline at end of file
+    return steady_state
+
+def get_stationary_distribution(transition_matrix: np.ndarray) -> np.ndarray:
+    """
+    Calculate the stationary distribution of the full chain, No Repurchase included.
+    
+    No Repurchase is not fully absorbing (customers can be won back), so the
+    chain is irreducible and has a unique distribution pi with pi @ P = pi.
+    
+    Args:
+        transition_matrix: The Markov chain transition matrix
+        
+    Returns:
+        Array of stationary probabilities for all states
+    """
+    n_states = transition_matrix.shape[0]
+    
+    # Solve pi @ (I - P) = 0 together with sum(pi) = 1
+    system = np.vstack([(np.eye(n_states) - transition_matrix).T, np.ones(n_states)])
+    rhs = np.zeros(n_states + 1)
+    rhs[-1] = 1.0
+    stationary, *_ = np.linalg.lstsq(system, rhs, rcond=None)
+    
+    return stationary
\ No newline at end of file
@@ -3,6 +3,8 @@ import pandas as pd
 import numpy as np
 from matplotlib.widgets import Button
 from transition_matrices import STATE_ABBR, STATES, SCENARIOS
+from simulation import CustomerMarkovModel
+from result_cache import ResultCache
 import os
 
 # Professional color palette
@@ -123,15 +125,38 @@ def export_results(results, scenario):
     
     return csv_filename, report_filename
 
-def compare_scenarios(current_scenario, results):
-    """Compare current scenario with all other scenarios"""
+def compare_scenarios(current_scenario, results, new_customers_per_month=None):
+    """
+    Compare current scenario with all other scenarios.
+    
+    When new_customers_per_month is given, the other scenarios are simulated
+    with the same parameters through the shared result cache; otherwise
+    results saved to CSV by earlier runs are used.
+    """
     fig, ax = plt.figure(figsize=(12, 10)), plt.subplot(111)
     
-    # Load and plot data from existing CSV files
+    if new_customers_per_month is not None:
+        cache = ResultCache()
+        initial_counts = results.iloc[0][STATES].to_numpy(dtype=float)
+    
+    # Load and plot data from the cache or existing CSV files
     scenarios_found = []
     for scenario_name in SCENARIOS.keys():
         filename = f"customer_simulation_{scenario_name.replace(' ', '_')}.csv"
-        if os.path.exists(filename) and scenario_name != current_scenario:
+        if scenario_name == current_scenario:
+            continue
+        if new_customers_per_month is not None:
+            model = CustomerMarkovModel(
+                initial_customers=int(initial_counts.sum()),
+                new_customers_per_month=new_customers_per_month,
+                scenario=scenario_name
+            )
+            model.initial_distribution = initial_counts / max(initial_counts.sum(), 1)
+            df = cache.simulate(model, months=int(results['Month'].iloc[-1] - results['Month'].iloc[0]))
+            ax.plot(df['Month'] + results['Month'].iloc[0], df['Monthly Revenue'], '--', alpha=0.7,
+                    label=f"{scenario_name}")
+            scenarios_found.append(scenario_name)
+        elif os.path.exists(filename):
             try:
                 df = pd.read_csv(filename)
                 ax.plot(df['Month'], df['Monthly Revenue'], '--', alpha=0.7, 
@@ -183,7 +208,7 @@ def calculate_new_customers(results):
     
     return pd.Series(new_customers)
 
-def plot_results(results, scenario="Default"):
+def plot_results(results, scenario="Default", new_customers_per_month=None):
     """
     Plot simulation results with improved layout, embedded text summaries,
     analysis panel, and interactive buttons.
@@ -191,6 +216,8 @@ def plot_results(results, scenario="Default"):
     Args:
         results: DataFrame from the simulate method
         scenario: The business scenario name
+        new_customers_per_month: New customers per month of the run, used to
+            simulate the other scenarios for comparison
     """
     # Calculate new customers for each month
     new_customers = calculate_new_customers(results)
@@ -376,7 +403,7 @@ def plot_results(results, scenario="Default"):
         fig.canvas.draw_idle()
     
     def compare_callback(event):
-        compare_scenarios(scenario, results)
+        compare_scenarios(scenario, results, new_customers_per_month)
     
     def reset_callback(event):
         plt.close()
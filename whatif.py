@@ -0,0 +1,220 @@
+import numpy as np
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from transition_matrices import STATES, get_transition_matrix, get_stationary_distribution
+from revenue_model import revenue_vector
+from simulation import CustomerMarkovModel, forecast_batch
+
+class WhatIfEngine:
+    """
+    Keeps the factorizations of one transition matrix and updates them in
+    place when a single row is edited.
+
+    Editing row i changes P by a rank-one term e_i @ delta, so both inverses
+    the engine keeps can be updated with the Sherman-Morrison formula in
+    O(n^2) instead of being refactorized:
+
+    - M = (I - gamma P)^-1 gives the customer lifetime value M @ revenue
+    - Z = (I - P + 1 pi)^-1 (the fundamental matrix) gives the stationary
+      distribution: pi' = pi + pi_i (delta @ Z) / (1 - delta @ Z e_i)
+    """
+
+    # Refactorize from scratch after this many incremental updates to keep
+    # rounding errors from accumulating
+    REFACTOR_EVERY = 64
+
+    def __init__(self,
+                 scenario: str = "Default",
+                 initial_customers: int = 10000,
+                 new_customers_per_month: int = 800,
+                 months: int = 12,
+                 discount_rate: float = 0.01):
+        """
+        Initialize the engine with a scenario's transition matrix.
+
+        Args:
+            scenario: Which business scenario to start from
+            initial_customers: Total number of customers at start of the forecast
+            new_customers_per_month: Number of new customers added each month
+            months: Number of months to forecast
+            discount_rate: Monthly discount rate used for lifetime value
+        """
+        self.scenario = scenario
+        # The scenario's matrix when the engine started; sessions restart if it is re-registered
+        self.original = get_transition_matrix(scenario).copy()
+        self.options = dict(initial_customers=initial_customers, new_customers_per_month=new_customers_per_month,
+                            months=months, discount_rate=discount_rate)
+        self.months = months
+        self.new_customers_per_month = new_customers_per_month
+        self.gamma = 1.0 / (1.0 + discount_rate)
+        self.revenue = revenue_vector(STATES)
+        self.initial_counts = CustomerMarkovModel(initial_customers=initial_customers,
+                                                  scenario=scenario).initial_counts()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, transition_matrix: Optional[np.ndarray] = None):
+        """
+        Refactorize from a matrix (by default the scenario's original matrix).
+
+        Args:
+            transition_matrix: Matrix to start from
+        """
+        if transition_matrix is None:
+            transition_matrix = self.original
+        self.transition_matrix = np.array(transition_matrix, dtype=float)
+        n_states = len(self.transition_matrix)
+
+        self.stationary = get_stationary_distribution(self.transition_matrix)
+        self.clv_inverse = np.linalg.inv(np.eye(n_states) - self.gamma * self.transition_matrix)
+        self.fundamental = np.linalg.inv(np.eye(n_states) - self.transition_matrix
+                                         + np.outer(np.ones(n_states), self.stationary))
+        self.clv = self.clv_inverse @ self.revenue
+        self.updates = 0
+
+    def edit(self, from_state: int, to_state: int, value: Optional[float] = None,
+             delta: Optional[float] = None) -> np.ndarray:
+        """
+        Change one transition probability and renormalize its row.
+
+        The other entries of the row are rescaled proportionally so the row
+        still sums to 1.
+
+        Args:
+            from_state: Row (segment index) to edit
+            to_state: Column (segment index) to edit
+            value: New probability for the entry
+            delta: Change to add to the entry (used when value is None)
+
+        Returns:
+            The change applied to the row
+        """
+        row = self.transition_matrix[from_state]
+        old = row[to_state]
+        new = old + delta if value is None else value
+        new = float(np.clip(new, 0.0, 1.0))
+
+        new_row = row.copy()
+        others = np.arange(len(row)) != to_state
+        if old < 1.0:
+            new_row[others] *= (1.0 - new) / (1.0 - old)
+        else:
+            new_row[others] = (1.0 - new) / others.sum()
+        new_row[to_state] = new
+
+        row_delta = new_row - row
+        self._update(from_state, row_delta)
+        return row_delta
+
+    def _update(self, i: int, row_delta: np.ndarray):
+        """Apply the rank-one change P' = P + e_i @ row_delta to every factorization"""
+        self.updates += 1
+        clv_pivot = 1.0 - self.gamma * row_delta @ self.clv_inverse[:, i]
+        stationary_pivot = 1.0 - row_delta @ self.fundamental[:, i]
+
+        self.transition_matrix[i] += row_delta
+        if (self.updates >= self.REFACTOR_EVERY
+                or abs(clv_pivot) < 1e-10 or abs(stationary_pivot) < 1e-10):
+            self.reset(self.transition_matrix)
+            return
+
+        # (I - gamma P')^-1 = M + gamma (M e_i)(delta M) / (1 - gamma delta M e_i)
+        column = self.clv_inverse[:, i].copy()
+        self.clv_inverse += self.gamma * np.outer(column, row_delta @ self.clv_inverse) / clv_pivot
+        self.clv = self.clv_inverse @ self.revenue
+
+        # Stationary distribution from the fundamental matrix of the old chain
+        pi_change = self.stationary[i] * (row_delta @ self.fundamental) / stationary_pivot
+        stationary = self.stationary + pi_change
+
+        # Z' = (I - P' + 1 pi'^T)^-1: the row edit and the pi change are both rank one
+        column = self.fundamental[:, i].copy()
+        self.fundamental += np.outer(column, row_delta @ self.fundamental) / stationary_pivot
+        ones_image = self.fundamental.sum(axis=1)
+        pivot = 1.0 + pi_change @ ones_image
+        self.fundamental -= np.outer(ones_image, pi_change @ self.fundamental) / pivot
+
+        self.stationary = stationary
+
+    def forecast(self) -> np.ndarray:
+        """
+        Forecast the current matrix over the engine's horizon.
+
+        Returns:
+            Array of segment counts with shape (months + 1, 5)
+        """
+        return forecast_batch(self.initial_counts, self.transition_matrix,
+                              self.new_customers_per_month, self.months, round_counts=True)
+
+    def summary(self) -> Dict:
+        """
+        Get the current matrix, stationary distribution, lifetime value and forecast.
+
+        The stationary distribution covers all five states, No Repurchase
+        included, unlike get_steady_state's distribution over the active states.
+
+        The forecast records are built straight from lists rather than through
+        a DataFrame, which would dominate the latency of a slider update.
+
+        Returns:
+            Dictionary ready for JSON serialization
+        """
+        counts = self.forecast()
+        revenue = (counts @ self.revenue).tolist()
+        totals = counts.sum(axis=1).tolist()
+        forecast = [
+            {
+                'Month': month,
+                'Total Customers': int(totals[month]),
+                'Monthly Revenue': revenue[month],
+                **{state: int(count) for state, count in zip(STATES, row)}
+            }
+            for month, row in enumerate(counts.tolist())
+        ]
+
+        return {
+            "scenario": self.scenario,
+            "transition_matrix": self.transition_matrix.tolist(),
+            "stationary_distribution": dict(zip(STATES, self.stationary.tolist())),
+            "clv": dict(zip(STATES, self.clv.tolist())),
+            "forecast": forecast
+        }
+
+class WhatIfSessions:
+    """
+    A bounded, thread-safe collection of what-if engines, one per session.
+    The least recently used session is dropped when the limit is reached.
+    """
+
+    def __init__(self, max_sessions: int = 256):
+        self.max_sessions = max_sessions
+        self.engines: "OrderedDict[str, WhatIfEngine]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id: str, scenario: str, **kwargs) -> WhatIfEngine:
+        """
+        Get the engine of a session, starting a new one if the session is
+        unknown, switched scenario or forecast options, or its scenario's
+        matrix changed since (e.g. a fitted scenario registered again).
+
+        Args:
+            session_id: Identifier of the client session
+            scenario: Which business scenario the session is editing
+            **kwargs: Passed to WhatIfEngine when a new engine is created
+
+        Returns:
+            The session's engine
+        """
+        with self.lock:
+            engine = self.engines.get(session_id)
+            if engine is None or engine.scenario != scenario or any(
+                    engine.options[name] != value for name, value in kwargs.items()) or not np.array_equal(
+                    engine.original, get_transition_matrix(scenario)):
+                engine = WhatIfEngine(scenario=scenario, **kwargs)
+                self.engines[session_id] = engine
+            self.engines.move_to_end(session_id)
+            while len(self.engines) > self.max_sessions:
+                self.engines.popitem(last=False)
+            return engine